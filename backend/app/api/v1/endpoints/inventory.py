@@ -1,18 +1,36 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional, Union
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 from app.db.base import get_database
 from app.models.inventory_transaction import (
     InventoryTransaction,
     InventoryTransactionCreate,
+    InventoryTransactionBulkCreate,
     InventoryTransactionWithDetails,
     InventoryBalance,
+    InventoryBalanceAsOf,
+    InventoryBalanceLookup,
+    InventoryBalanceLookupResult,
+    InventoryMovementRollup,
+    InventoryPeriodSummary,
     InventoryAdjustment,
     InventoryTransfer,
-    InventoryCount
+    InventoryMultiTransfer,
+    InventoryCount,
+    InventoryCountSession,
+    InventoryCountSessionCreate,
+    InventoryCountUploadResult
 )
+from app.models.inventory_reconciliation import ReconciliationRun, BalanceDrift
+from app.models.inventory_valuation import InventoryCostLayers, ValuationRun, ValuationSnapshot
 from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.crud.inventory_count import InventoryCountCRUD
+from app.crud.inventory_archive import InventoryArchiveCRUD
+from app.crud.inventory_reconciliation import InventoryReconciliationCRUD
+from app.crud.inventory_valuation import InventoryValuationCRUD
+from app.crud.pagination import next_cursor
+from app.core.streaming import iter_request_documents, ndjson_response, wants_ndjson
 from app.core.auth import get_current_user
 
 router = APIRouter()
@@ -20,6 +38,7 @@ router = APIRouter()
 @router.post("/transactions", response_model=InventoryTransaction)
 async def create_transaction(
     transaction: InventoryTransactionCreate,
+    prevent_negative: bool = Query(False, description="Reject deductions that would make stock negative"),
     db: AsyncIOMotorClient = Depends(get_database),
     current_user: dict = Depends(get_current_user)
 ):
@@ -27,10 +46,43 @@ async def create_transaction(
     Create a new inventory transaction.
     """
     inventory_crud = InventoryTransactionCRUD(db)
-    return await inventory_crud.create(transaction, current_user["id"])
+    try:
+        return await inventory_crud.create(
+            transaction,
+            current_user["id"],
+            prevent_negative=prevent_negative
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/transactions/bulk", response_model=List[InventoryTransaction])
+async def create_transactions_bulk(
+    batch: InventoryTransactionBulkCreate,
+    prevent_negative: bool = Query(False, description="Reject deductions that would make stock negative"),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Create a batch of inventory transactions in a single database transaction.
+    """
+    inventory_crud = InventoryTransactionCRUD(db)
+    try:
+        return await inventory_crud.create_bulk(
+            batch.transactions,
+            current_user["id"],
+            prevent_negative=prevent_negative
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/transactions", response_model=List[InventoryTransaction])
+@router.get(
+    "/transactions",
+    response_model=List[Union[InventoryTransactionWithDetails, InventoryTransaction]]
+)
 async def list_transactions(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    with_details: bool = Query(False, description="Include product and location documents"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     product_id: Optional[str] = None,
@@ -43,17 +95,30 @@ async def list_transactions(
 ):
     """
     List inventory transactions with optional filtering.
+
+    With `with_details=true` the products and locations of the whole page are
+    resolved in one batch and attached to each row.
     """
     inventory_crud = InventoryTransactionCRUD(db)
-    return await inventory_crud.get_all(
-        skip=skip,
-        limit=limit,
-        product_id=product_id,
-        location_id=location_id,
-        transaction_type=transaction_type,
-        from_date=from_date,
-        to_date=to_date
-    )
+    try:
+        transactions = await inventory_crud.get_all(
+            skip=skip,
+            limit=limit,
+            product_id=product_id,
+            location_id=location_id,
+            transaction_type=transaction_type,
+            from_date=from_date,
+            to_date=to_date,
+            cursor=cursor,
+            with_details=with_details
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page_cursor = next_cursor(transactions, limit)
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    return transactions
 
 @router.get("/transactions/{transaction_id}", response_model=InventoryTransactionWithDetails)
 async def get_transaction(
@@ -70,6 +135,53 @@ async def get_transaction(
         raise HTTPException(status_code=404, detail="Transaction not found")
     return transaction
 
+@router.post("/balances/lookup", response_model=InventoryBalanceLookupResult)
+async def lookup_balances(
+    lookup: InventoryBalanceLookup,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get balances for many products and/or locations in a single request.
+    """
+    inventory_crud = InventoryTransactionCRUD(db)
+    try:
+        return await inventory_crud.lookup_balances(
+            lookup.product_ids,
+            lookup.location_ids,
+            lookup.include_totals
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/balances/as-of", response_model=InventoryBalanceAsOf)
+async def get_balance_as_of(
+    product_id: str,
+    location_id: str,
+    as_of: datetime,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the inventory balance for a product at a location as of a point in time.
+    """
+    inventory_crud = InventoryTransactionCRUD(db)
+    balance = await inventory_crud.get_balance_as_of(product_id, location_id, as_of)
+    if not balance:
+        raise HTTPException(status_code=400, detail="Invalid product or location ID")
+    return balance
+
+@router.get("/balances/cache-stats", response_model=dict)
+async def get_balance_cache_stats(
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get hit, miss and eviction counters for this worker's balance cache.
+    """
+    inventory_crud = InventoryTransactionCRUD(db)
+    return inventory_crud.cache_stats()
+
 @router.get("/balances/{product_id}/{location_id}", response_model=InventoryBalance)
 async def get_balance(
     product_id: str,
@@ -113,6 +225,7 @@ async def create_adjustment(
 @router.post("/transfers", response_model=List[InventoryTransaction])
 async def create_transfer(
     transfer: InventoryTransfer,
+    prevent_negative: bool = Query(False, description="Reject transfers the source location cannot cover"),
     db: AsyncIOMotorClient = Depends(get_database),
     current_user: dict = Depends(get_current_user)
 ):
@@ -120,12 +233,36 @@ async def create_transfer(
     Create an inventory transfer between locations.
     """
     inventory_crud = InventoryTransactionCRUD(db)
-    from_transaction, to_transaction = await inventory_crud.process_transfer(
-        transfer,
-        current_user["id"]
-    )
+    try:
+        from_transaction, to_transaction = await inventory_crud.process_transfer(
+            transfer,
+            current_user["id"],
+            prevent_negative=prevent_negative
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return [from_transaction, to_transaction]
 
+@router.post("/transfers/multi", response_model=List[InventoryTransaction])
+async def create_multi_transfer(
+    transfer: InventoryMultiTransfer,
+    prevent_negative: bool = Query(False, description="Reject transfers the source location cannot cover"),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Transfer many products between two locations in a single transaction.
+    """
+    inventory_crud = InventoryTransactionCRUD(db)
+    try:
+        return await inventory_crud.process_multi_transfer(
+            transfer,
+            current_user["id"],
+            prevent_negative=prevent_negative
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/counts", response_model=List[InventoryTransaction])
 async def create_count(
     count: InventoryCount,
@@ -136,12 +273,124 @@ async def create_count(
     Process inventory count results and create adjustment transactions.
     """
     inventory_crud = InventoryTransactionCRUD(db)
-    transactions = await inventory_crud.process_count(count, current_user["id"])
+    try:
+        transactions = await inventory_crud.process_count(count, current_user["id"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return transactions
 
+@router.post("/count-sessions", response_model=InventoryCountSession)
+async def create_count_session(
+    count_session: InventoryCountSessionCreate,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Open a draft count session for a location.
+    """
+    count_crud = InventoryCountCRUD(db)
+    return await count_crud.create_session(count_session, current_user["id"])
+
+@router.get("/count-sessions/{session_id}", response_model=InventoryCountSession)
+async def get_count_session(
+    session_id: str,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get a count session and how many lines it has staged.
+    """
+    count_crud = InventoryCountCRUD(db)
+    count_session = await count_crud.get_session(session_id)
+    if not count_session:
+        raise HTTPException(status_code=404, detail="Count session not found")
+    return count_session
+
+@router.post("/count-sessions/{session_id}/lines", response_model=InventoryCountUploadResult)
+async def upload_count_lines(
+    session_id: str,
+    request: Request,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Stage counted lines as a JSON array or an application/x-ndjson stream.
+    Re-sending a line replaces the earlier count for that product.
+    """
+    count_crud = InventoryCountCRUD(db)
+    try:
+        result = await count_crud.upsert_lines(session_id, iter_request_documents(request))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Count session not found")
+    return result
+
+@router.post("/count-sessions/{session_id}/complete", response_model=InventoryCountSession)
+async def complete_count_session(
+    session_id: str,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Post every staged line as count transactions and close the session.
+    A session interrupted while posting can be completed again.
+    """
+    count_crud = InventoryCountCRUD(db)
+    try:
+        count_session = await count_crud.complete_session(session_id, current_user["id"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not count_session:
+        raise HTTPException(status_code=404, detail="Count session not found")
+    return count_session
+
+@router.get("/period-summaries/{product_id}", response_model=List[InventoryPeriodSummary])
+async def get_period_summaries(
+    product_id: str,
+    location_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the opening and closing balances of a product's archived months, newest first.
+    """
+    archive_crud = InventoryArchiveCRUD(db)
+    return await archive_crud.get_summaries(product_id, location_id, skip=skip, limit=limit)
+
+@router.get("/movements/rollup", response_model=List[InventoryMovementRollup])
+async def get_movement_rollups(
+    product_id: Optional[str] = None,
+    location_id: Optional[str] = None,
+    granularity: str = "day",
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+    by_location: bool = False,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get hourly or daily movement totals for a product and/or location.
+    """
+    inventory_crud = InventoryTransactionCRUD(db)
+    try:
+        return await inventory_crud.get_movement_rollups(
+            product_id,
+            location_id,
+            granularity,
+            from_date,
+            to_date,
+            by_location
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/movements/product/{product_id}", response_model=List[InventoryTransaction])
 async def get_product_movements(
     product_id: str,
+    request: Request,
     from_date: Optional[datetime] = None,
     to_date: Optional[datetime] = None,
     db: AsyncIOMotorClient = Depends(get_database),
@@ -149,8 +398,16 @@ async def get_product_movements(
 ):
     """
     Get all movements for a specific product.
+
+    Send `Accept: application/x-ndjson` to stream the movements one per line.
     """
     inventory_crud = InventoryTransactionCRUD(db)
+    if wants_ndjson(request):
+        return ndjson_response(inventory_crud.iter_product_movements(
+            product_id,
+            from_date,
+            to_date
+        ))
     return await inventory_crud.get_product_movements(
         product_id,
         from_date,
@@ -160,6 +417,7 @@ async def get_product_movements(
 @router.get("/movements/location/{location_id}", response_model=List[InventoryTransaction])
 async def get_location_movements(
     location_id: str,
+    request: Request,
     from_date: Optional[datetime] = None,
     to_date: Optional[datetime] = None,
     db: AsyncIOMotorClient = Depends(get_database),
@@ -167,10 +425,149 @@ async def get_location_movements(
 ):
     """
     Get all movements for a specific location.
+
+    Send `Accept: application/x-ndjson` to stream the movements one per line.
     """
     inventory_crud = InventoryTransactionCRUD(db)
+    if wants_ndjson(request):
+        return ndjson_response(inventory_crud.iter_location_movements(
+            location_id,
+            from_date,
+            to_date
+        ))
     return await inventory_crud.get_location_movements(
         location_id,
         from_date,
         to_date
-    ) 
\ No newline at end of file
+    ) 
+
+@router.post("/reconciliation", response_model=ReconciliationRun)
+async def start_reconciliation(
+    background_tasks: BackgroundTasks,
+    partitions: int = Query(64, ge=1, le=4096),
+    concurrency: int = Query(8, ge=1, le=64),
+    repair: bool = Query(False, description="Correct drifted balances from the ledger"),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Start a ledger-to-balance reconciliation run in the background.
+    """
+    reconciliation_crud = InventoryReconciliationCRUD(db)
+    run = await reconciliation_crud.create_run(partitions=partitions, repair=repair)
+    background_tasks.add_task(reconciliation_crud.run, run["id"], concurrency)
+    return run
+
+@router.post("/reconciliation/{run_id}/resume", response_model=ReconciliationRun)
+async def resume_reconciliation(
+    run_id: str,
+    background_tasks: BackgroundTasks,
+    concurrency: int = Query(8, ge=1, le=64),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Resume an interrupted reconciliation run with its pending partitions.
+    """
+    reconciliation_crud = InventoryReconciliationCRUD(db)
+    run = await reconciliation_crud.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reconciliation run not found")
+    background_tasks.add_task(reconciliation_crud.run, run_id, concurrency)
+    return run
+
+@router.get("/reconciliation/{run_id}", response_model=ReconciliationRun)
+async def get_reconciliation(
+    run_id: str,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the progress of a reconciliation run.
+    """
+    reconciliation_crud = InventoryReconciliationCRUD(db)
+    run = await reconciliation_crud.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reconciliation run not found")
+    return run
+
+@router.get("/reconciliation/{run_id}/drift", response_model=List[BalanceDrift])
+async def get_reconciliation_drift(
+    run_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    List the balances a reconciliation run found out of line with the ledger.
+    """
+    reconciliation_crud = InventoryReconciliationCRUD(db)
+    return await reconciliation_crud.get_drift(run_id, skip=skip, limit=limit)
+
+@router.get("/valuation/layers/{product_id}/{location_id}", response_model=InventoryCostLayers)
+async def get_cost_layers(
+    product_id: str,
+    location_id: str,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the FIFO cost layers and moving average cost for a product at a location.
+    """
+    valuation_crud = InventoryValuationCRUD(db)
+    layers = await valuation_crud.get_layers(product_id, location_id)
+    if not layers:
+        raise HTTPException(
+            status_code=404,
+            detail="No cost layers found for this product at this location"
+        )
+    return layers
+
+@router.post("/valuation/runs", response_model=ValuationRun)
+async def start_revaluation(
+    background_tasks: BackgroundTasks,
+    as_of: Optional[datetime] = None,
+    rebuild_layers: bool = Query(False, description="Replace the cost layers with the replayed ones"),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Revalue the ledger per product and location in the background.
+    """
+    valuation_crud = InventoryValuationCRUD(db)
+    try:
+        run = await valuation_crud.create_run(as_of=as_of, rebuild_layers=rebuild_layers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(valuation_crud.revalue, run["id"])
+    return run
+
+@router.get("/valuation/runs/{run_id}", response_model=ValuationRun)
+async def get_revaluation(
+    run_id: str,
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get the progress of a revaluation run.
+    """
+    valuation_crud = InventoryValuationCRUD(db)
+    run = await valuation_crud.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Valuation run not found")
+    return run
+
+@router.get("/valuation/runs/{run_id}/snapshots", response_model=List[ValuationSnapshot])
+async def get_revaluation_snapshots(
+    run_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    List the per product and location valuations of a revaluation run.
+    """
+    valuation_crud = InventoryValuationCRUD(db)
+    return await valuation_crud.get_snapshots(run_id, skip=skip, limit=limit)
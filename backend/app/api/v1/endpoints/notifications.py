@@ -1,5 +1,5 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 from app.db.base import get_database
@@ -10,10 +10,15 @@ from app.models.notification import (
     NotificationWithDetails,
     NotificationPreferences,
     BulkNotificationCreate,
+    NotificationFanOutResult,
     NotificationStats
 )
 from app.crud.notification import NotificationCRUD
+from app.crud.notification_retention import NotificationRetentionCRUD
+from app.crud.notification_stream import NotificationStreamCRUD
+from app.crud.pagination import next_cursor
 from app.core.auth import get_current_user
+from app.core.streaming import sse_response
 
 router = APIRouter()
 
@@ -29,7 +34,7 @@ async def create_notification(
     notification_crud = NotificationCRUD(db)
     return await notification_crud.create(notification)
 
-@router.post("/bulk", response_model=List[Notification])
+@router.post("/bulk", response_model=NotificationFanOutResult)
 async def create_bulk_notification(
     notification: BulkNotificationCreate,
     db: AsyncIOMotorClient = Depends(get_database),
@@ -37,12 +42,16 @@ async def create_bulk_notification(
 ):
     """
     Create notifications for users matching filter criteria.
+    Returns the number created and the first few IDs.
     """
     notification_crud = NotificationCRUD(db)
     return await notification_crud.create_bulk(notification)
 
-@router.get("/me", response_model=List[Notification])
+@router.get("/me", response_model=List[Union[NotificationWithDetails, Notification]])
 async def get_my_notifications(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    with_details: bool = Query(False, description="Include recipient and referenced entity documents"),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
     include_archived: bool = False,
@@ -55,18 +64,31 @@ async def get_my_notifications(
 ):
     """
     Get notifications for the current user with filtering options.
+
+    With `with_details=true` the recipient and the referenced entities of the
+    whole page are resolved in one batch and attached to each notification.
     """
     notification_crud = NotificationCRUD(db)
-    return await notification_crud.get_user_notifications(
-        current_user["id"],
-        skip=skip,
-        limit=limit,
-        include_archived=include_archived,
-        type=type,
-        priority=priority,
-        from_date=from_date,
-        to_date=to_date
-    )
+    try:
+        notifications = await notification_crud.get_user_notifications(
+            current_user["id"],
+            skip=skip,
+            limit=limit,
+            include_archived=include_archived,
+            type=type,
+            priority=priority,
+            from_date=from_date,
+            to_date=to_date,
+            cursor=cursor,
+            with_details=with_details
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page_cursor = next_cursor(notifications, limit)
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    return notifications
 
 @router.get("/me/stats", response_model=NotificationStats)
 async def get_my_notification_stats(
@@ -85,6 +107,32 @@ async def get_my_notification_stats(
         to_date=to_date
     )
 
+@router.get("/me/stream")
+async def stream_my_notifications(
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Stream the current user's new notifications as Server-Sent Events.
+    Reconnecting with Last-Event-ID replays what was missed.
+    """
+    stream_crud = NotificationStreamCRUD(db)
+    return sse_response(
+        stream_crud.stream_user_notifications(current_user["id"], last_event_id),
+        "notification"
+    )
+
+@router.get("/retention/stats")
+async def get_retention_stats(
+    db: AsyncIOMotorClient = Depends(get_database),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Progress of the notification purges run by this worker.
+    """
+    return NotificationRetentionCRUD(db).metrics()
+
 @router.get("/{notification_id}", response_model=NotificationWithDetails)
 async def get_notification(
     notification_id: str,
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 from app.db.base import get_database
@@ -12,6 +12,7 @@ from app.models.purchase_order import (
     PurchaseOrderItem
 )
 from app.crud.purchase_order import PurchaseOrderCRUD
+from app.crud.pagination import next_cursor
 from app.core.auth import get_current_user
 
 router = APIRouter()
@@ -30,6 +31,8 @@ async def create_purchase_order(
 
 @router.get("/", response_model=List[PurchaseOrder])
 async def list_purchase_orders(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     status: Optional[str] = None,
@@ -43,14 +46,23 @@ async def list_purchase_orders(
     Retrieve purchase orders with optional filtering.
     """
     purchase_order_crud = PurchaseOrderCRUD(db)
-    return await purchase_order_crud.get_all(
-        skip=skip,
-        limit=limit,
-        status=status,
-        supplier_id=supplier_id,
-        from_date=from_date,
-        to_date=to_date
-    )
+    try:
+        orders = await purchase_order_crud.get_all(
+            skip=skip,
+            limit=limit,
+            status=status,
+            supplier_id=supplier_id,
+            from_date=from_date,
+            to_date=to_date,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page_cursor = next_cursor(orders, limit)
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    return orders
 
 @router.get("/stats")
 async def get_purchase_order_stats(
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 from app.db.base import get_database
@@ -12,6 +12,7 @@ from app.models.sales_order import (
     SalesOrderItem
 )
 from app.crud.sales_order import SalesOrderCRUD
+from app.crud.pagination import next_cursor
 from app.core.auth import get_current_user
 
 router = APIRouter()
@@ -30,6 +31,8 @@ async def create_sales_order(
 
 @router.get("/", response_model=List[SalesOrder])
 async def list_sales_orders(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=100),
     status: Optional[str] = None,
@@ -43,14 +46,23 @@ async def list_sales_orders(
     Retrieve sales orders with optional filtering.
     """
     sales_order_crud = SalesOrderCRUD(db)
-    return await sales_order_crud.get_all(
-        skip=skip,
-        limit=limit,
-        status=status,
-        customer_id=customer_id,
-        from_date=from_date,
-        to_date=to_date
-    )
+    try:
+        orders = await sales_order_crud.get_all(
+            skip=skip,
+            limit=limit,
+            status=status,
+            customer_id=customer_id,
+            from_date=from_date,
+            to_date=to_date,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page_cursor = next_cursor(orders, limit)
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    return orders
 
 @router.get("/stats")
 async def get_sales_order_stats(
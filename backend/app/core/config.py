@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 from pydantic import AnyHttpUrl, validator
 
@@ -13,6 +13,43 @@ class Settings(BaseSettings):
     
     # MongoDB
     MONGODB_URI: str
+    CREATE_INDEXES_ON_STARTUP: bool = True
+
+    # Inventory
+    MOVEMENT_STREAM_BATCH_SIZE: int = 500
+    BALANCE_CHECKPOINT_INTERVAL: int = 1000  # Ledger rows per (product, location) between checkpoints
+    COUNT_POST_CHUNK_SIZE: int = 1000  # Count lines posted per transaction
+    COUNT_UPLOAD_CHUNK_SIZE: int = 500  # Uploaded count lines staged per bulk write
+    LEDGER_ARCHIVE_AFTER_DAYS: int = 730  # Whole months older than this move to the archive tier
+    # Maintain FIFO/average cost layers on every ledger write. Each posting then
+    # rewrites its pair's layer document, which serializes writes to a hot pair
+    COST_LAYERS_ENABLED: bool = False
+    INVENTORY_VALUATION_METHOD: str = "average"  # fifo or average; costs rows posted without a unit_cost
+    BALANCE_CACHE_ENABLED: bool = False
+    BALANCE_CACHE_SIZE: int = 10000  # (product, location) balances kept per worker
+    BALANCE_CACHE_TTL: float = 30.0  # Seconds; upper bound on staleness if an invalidation is missed
+    BALANCE_INVALIDATION_CHANNEL_BYTES: int = 16 * 1024 * 1024  # Capped collection size
+    REFERENCE_CACHE_SIZE: int = 5000  # Product/location documents kept per worker for detail views
+    REFERENCE_CACHE_TTL: float = 60.0
+    REORDER_SCAN_INTERVAL: float = 0  # Seconds between reorder point scans in each worker; 0 disables
+    LOW_STOCK_RECIPIENT_FILTER: Dict = {"role": {"$in": ["admin", "manager"]}}  # Users notified of low stock
+
+    # Notifications
+    NOTIFICATION_FANOUT_CHUNK_SIZE: int = 1000  # Recipients written per insert_many
+    NOTIFICATION_PREFERENCE_CHECK_INTERVAL: float = 5.0  # Seconds before a worker sees preferences changed elsewhere
+    NOTIFICATION_COALESCE_WINDOW: float = 0  # Seconds repeats about one reference merge into one notification; 0 disables
+    NOTIFICATION_COALESCE_TYPES: List[str] = ["low_stock", "order_status"]
+    NOTIFICATION_DIGEST_TYPES: List[str] = []  # Types queued for the periodic digest instead of sent immediately
+    NOTIFICATION_DIGEST_INTERVAL: float = 0  # Seconds between digest flushes in each worker; 0 leaves it to the script
+    NOTIFICATION_STREAM_FEED_ENABLED: bool = True  # Relay other workers' notifications to this worker's SSE clients
+    NOTIFICATION_STREAM_POLL_INTERVAL: float = 2.0  # Seconds between polls when change streams are unavailable
+    NOTIFICATION_STREAM_KEEPALIVE: float = 15.0  # Seconds of silence before an SSE keep-alive comment
+    NOTIFICATION_STREAM_QUEUE_SIZE: int = 100  # Undelivered notifications buffered per connection
+    NOTIFICATION_RETENTION_DAYS: int = 30  # Archived notifications older than this are purged
+    NOTIFICATION_PURGE_INTERVAL: float = 0  # Seconds between purges; 0 leaves it to the script
+    NOTIFICATION_PURGE_BATCH_SIZE: int = 1000
+    NOTIFICATION_PURGE_PAUSE: float = 0.1  # Seconds between purge batches
+    NOTIFICATION_ARCHIVE_ON_PURGE: bool = False  # Copy purged notifications to notifications_archive
     
     # CORS
     CORS_ORIGINS: List[AnyHttpUrl] = []
@@ -0,0 +1,82 @@
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from bson import ObjectId
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+def wants_ndjson(request: Request) -> bool:
+    """Whether the client asked for newline-delimited JSON."""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def json_default(value):
+    """Serialize the BSON types that json.dumps does not know about."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def ndjson_response(documents: AsyncIterator[dict]) -> StreamingResponse:
+    """Stream documents one JSON line at a time as they are produced."""
+    async def lines():
+        async for document in documents:
+            yield json.dumps(document, default=json_default) + "\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+def sse_response(documents: AsyncIterator[Optional[dict]], event: str) -> StreamingResponse:
+    """Stream documents as Server-Sent Events named `event`, using their id as the event id.
+
+    A None from `documents` is sent as a comment, which keeps idle
+    connections open through proxies.
+    """
+    async def frames():
+        async for document in documents:
+            if document is None:
+                yield ": keep-alive\n\n"
+            else:
+                data = json.dumps(document, default=json_default)
+                yield f"id: {document['id']}\nevent: {event}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        frames(),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def iter_request_documents(request: Request) -> AsyncIterator[dict]:
+    """Yield the documents of a JSON array or NDJSON request body.
+
+    NDJSON bodies are parsed line by line as they arrive, so an upload of
+    any size is never held in memory at once.
+    """
+    if NDJSON_MEDIA_TYPE not in request.headers.get("content-type", ""):
+        try:
+            documents = await request.json()
+        except ValueError:
+            raise ValueError("Request body must be a JSON array")
+        if not isinstance(documents, list):
+            raise ValueError("Request body must be a JSON array")
+        for document in documents:
+            yield document
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_ndjson_line(line)
+    if buffer.strip():
+        yield _parse_ndjson_line(buffer)
+
+def _parse_ndjson_line(line: bytes) -> dict:
+    try:
+        return json.loads(line)
+    except ValueError:
+        raise ValueError(f"Invalid NDJSON line: {line[:80]!r}")
@@ -0,0 +1,16 @@
+import asyncio
+from typing import Awaitable, List
+
+# Long-running loops started with the application and cancelled on shutdown
+_background_tasks: List[asyncio.Task] = []
+
+def start_background_task(coroutine: Awaitable) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    _background_tasks.append(task)
+    return task
+
+async def cancel_background_tasks() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
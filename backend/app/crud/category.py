@@ -1,10 +1,18 @@
 from typing import List, Optional, Dict
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.models.category import CategoryCreate, CategoryUpdate, Category
 
 class CategoryCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([("name", ASCENDING)]),
+            IndexModel([("parent_id", ASCENDING)])
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.invenpulse.categories
@@ -0,0 +1,28 @@
+import heapq
+from typing import AsyncIterator, Callable, List
+
+async def merge_sorted(
+    iterators: List[AsyncIterator[dict]],
+    key: Callable[[dict], tuple]
+) -> AsyncIterator[dict]:
+    """K-way merge of async iterators that are each already sorted by `key`.
+
+    Only one document per iterator is held at a time, so the sources can
+    be index-backed cursors of any size.
+    """
+    iterators = [iterator.__aiter__() for iterator in iterators]
+    heap = []
+    for index, iterator in enumerate(iterators):
+        async for document in iterator:
+            heap.append((key(document), index, document))
+            break
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, document = heap[0]
+        yield document
+        async for next_document in iterators[index]:
+            heapq.heapreplace(heap, (key(next_document), index, next_document))
+            break
+        else:
+            heapq.heappop(heap)
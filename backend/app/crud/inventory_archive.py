@@ -0,0 +1,291 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+
+ARCHIVE_STATE_ID = "inventory_transactions"
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _next_month(month_start: datetime) -> datetime:
+    return _month_start(month_start + timedelta(days=32))
+
+class InventoryArchiveCRUD:
+    """Move old ledger rows into an archive tier, one calendar month at a time.
+
+    Every archived month leaves a summary per (product, location) with its
+    opening and closing balance. `archived_before` marks the boundary:
+    rows created before it are read from the archive, later rows from
+    inventory_transactions. A month is copied and summarised before the
+    boundary moves past it, and only then deleted from the hot collection,
+    so an interrupted run can simply be repeated.
+    """
+    indexes = {
+        "archive_collection": [
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("location_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("to_location_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("location_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)])
+        ],
+        "summaries_collection": [
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("location_id", ASCENDING),
+                ("period_start", DESCENDING)
+            ], unique=True)
+        ]
+    }
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.transactions_collection = db.inven_pulse.inventory_transactions
+        self.archive_collection = db.inven_pulse.inventory_transactions_archive
+        self.summaries_collection = db.inven_pulse.inventory_period_summaries
+        self.state_collection = db.inven_pulse.inventory_archive_state
+
+    async def get_archived_before(self, session=None) -> Optional[datetime]:
+        state = await self.state_collection.find_one({"_id": ARCHIVE_STATE_ID}, session=session)
+        return state["archived_before"] if state else None
+
+    def split_tiers(self, query: dict, archived_before: Optional[datetime]) -> List[Tuple[object, dict]]:
+        """(collection, query) pairs covering `query` across both tiers, oldest tier first."""
+        if not archived_before:
+            return [(self.transactions_collection, query)]
+        return [
+            (self.archive_collection, {"$and": [query, {"created_at": {"$lt": archived_before}}]}),
+            (self.transactions_collection, {"$and": [query, {"created_at": {"$gte": archived_before}}]})
+        ]
+
+    async def get_closing_summary(
+        self,
+        product_id: ObjectId,
+        location_id: ObjectId,
+        before: datetime
+    ) -> Optional[dict]:
+        """Latest archived month of a pair that ended on or before `before`."""
+        archived_before = await self.get_archived_before()
+        if not archived_before:
+            return None
+
+        return await self.summaries_collection.find_one(
+            {
+                "product_id": product_id,
+                "location_id": location_id,
+                "period_end": {"$lte": min(before, archived_before)}
+            },
+            sort=[("period_start", -1)]
+        )
+
+    async def get_closing_balances(
+        self,
+        match: dict,
+        archived_before: datetime,
+        session=None
+    ) -> Dict[Tuple[ObjectId, ObjectId], dict]:
+        """Closing balance at `archived_before` of every archived pair matching `match`."""
+        closings = {}
+        pipeline = [
+            {"$match": {**match, "period_end": {"$lte": archived_before}}},
+            {"$sort": {"product_id": 1, "location_id": 1, "period_start": -1}},
+            {
+                "$group": {
+                    "_id": {"product_id": "$product_id", "location_id": "$location_id"},
+                    "quantity": {"$first": "$closing_quantity"},
+                    "value": {"$first": "$closing_value"}
+                }
+            }
+        ]
+        # Only partition-wide scans spill to disk, not the rechecks run in a transaction
+        async for row in self.summaries_collection.aggregate(pipeline, allowDiskUse=session is None, session=session):
+            closings[(row["_id"]["product_id"], row["_id"]["location_id"])] = row
+        return closings
+
+    async def get_summaries(
+        self,
+        product_id: str,
+        location_id: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[dict]:
+        if not ObjectId.is_valid(product_id) or (location_id and not ObjectId.is_valid(location_id)):
+            return []
+
+        query = {"product_id": ObjectId(product_id)}
+        if location_id:
+            query["location_id"] = ObjectId(location_id)
+        cursor = self.summaries_collection.find(query).sort(
+            [("period_start", -1), ("location_id", 1)]
+        ).skip(skip).limit(limit)
+        summaries = await cursor.to_list(length=limit)
+        for summary in summaries:
+            summary["id"] = str(summary.pop("_id"))
+        return summaries
+
+    async def archive(
+        self,
+        horizon: Optional[datetime] = None,
+        batch_size: int = 1000,
+        progress: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """Archive every whole month that ends on or before `horizon`.
+
+        The horizon defaults to LEDGER_ARCHIVE_AFTER_DAYS ago and is rounded
+        down to the start of its month.
+        """
+        horizon = _month_start(
+            horizon or datetime.utcnow() - timedelta(days=settings.LEDGER_ARCHIVE_AFTER_DAYS)
+        )
+        months = rows = 0
+        while True:
+            oldest = await self.transactions_collection.find_one(
+                {}, {"created_at": 1}, sort=[("created_at", 1), ("_id", 1)]
+            )
+            if not oldest or oldest["created_at"] >= horizon:
+                break
+
+            month_start = _month_start(oldest["created_at"])
+            month_end = _next_month(month_start)
+            archived = await self._archive_month(month_start, month_end, batch_size)
+            months += 1
+            rows += archived
+            if progress:
+                progress({"month": month_start, "rows": archived})
+
+        return {
+            "months": months,
+            "rows": rows,
+            "archived_before": await self.get_archived_before()
+        }
+
+    async def _archive_month(self, month_start: datetime, month_end: datetime, batch_size: int) -> int:
+        month = {"created_at": {"$gte": month_start, "$lt": month_end}}
+
+        copied = 0
+        batch = []
+        cursor = self.transactions_collection.find(month).sort(
+            [("created_at", 1), ("_id", 1)]
+        ).batch_size(batch_size)
+        async for transaction in cursor:
+            batch.append(transaction)
+            if len(batch) == batch_size:
+                copied += await self._copy_to_archive(batch)
+                batch = []
+        if batch:
+            copied += await self._copy_to_archive(batch)
+
+        # Summarise from the archive, which holds the whole month even when
+        # a previous attempt already deleted part of it from the hot tier
+        await self._summarize_month(month_start, month_end, batch_size)
+        await self.state_collection.update_one(
+            {"_id": ARCHIVE_STATE_ID},
+            {"$max": {"archived_before": month_end}},
+            upsert=True
+        )
+        await self.transactions_collection.delete_many(month)
+        return copied
+
+    async def _copy_to_archive(self, transactions: List[dict]) -> int:
+        try:
+            await self.archive_collection.insert_many(transactions, ordered=False)
+        except BulkWriteError as e:
+            # Rows copied by an interrupted earlier attempt keep their _id
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        return len(transactions)
+
+    async def _summarize_month(self, month_start: datetime, month_end: datetime, batch_size: int) -> None:
+        pipeline = [
+            {"$match": {"created_at": {"$gte": month_start, "$lt": month_end}}},
+            {"$sort": {"created_at": 1, "_id": 1}},
+            {
+                "$group": {
+                    "_id": {"product_id": "$product_id", "location_id": "$location_id"},
+                    "quantity": {"$sum": "$quantity"},
+                    "value": {"$sum": "$value"},
+                    "count": {"$sum": 1},
+                    "last_transaction_id": {"$last": "$_id"},
+                    "last_transaction_date": {"$last": "$created_at"}
+                }
+            }
+        ]
+        batch = []
+        async for row in self.archive_collection.aggregate(pipeline, allowDiskUse=True):
+            batch.append(row)
+            if len(batch) == batch_size:
+                await self._write_summaries(month_start, month_end, batch)
+                batch = []
+        if batch:
+            await self._write_summaries(month_start, month_end, batch)
+
+    async def _write_summaries(self, month_start: datetime, month_end: datetime, rows: List[dict]) -> None:
+        openings: Dict[Tuple[ObjectId, ObjectId], dict] = {}
+        pipeline = [
+            {
+                "$match": {
+                    "$or": [
+                        {"product_id": row["_id"]["product_id"], "location_id": row["_id"]["location_id"]}
+                        for row in rows
+                    ],
+                    "period_start": {"$lt": month_start}
+                }
+            },
+            {"$sort": {"product_id": 1, "location_id": 1, "period_start": -1}},
+            {
+                "$group": {
+                    "_id": {"product_id": "$product_id", "location_id": "$location_id"},
+                    "quantity": {"$first": "$closing_quantity"},
+                    "value": {"$first": "$closing_value"}
+                }
+            }
+        ]
+        async for opening in self.summaries_collection.aggregate(pipeline):
+            openings[(opening["_id"]["product_id"], opening["_id"]["location_id"])] = opening
+
+        now = datetime.utcnow()
+        updates = []
+        for row in rows:
+            product_id, location_id = row["_id"]["product_id"], row["_id"]["location_id"]
+            opening = openings.get((product_id, location_id), {"quantity": 0, "value": 0})
+            updates.append(ReplaceOne(
+                {"product_id": product_id, "location_id": location_id, "period_start": month_start},
+                {
+                    "product_id": product_id,
+                    "location_id": location_id,
+                    "period_start": month_start,
+                    "period_end": month_end,
+                    "opening_quantity": opening["quantity"],
+                    "opening_value": opening["value"],
+                    "quantity": row["quantity"],
+                    "value": row["value"],
+                    "count": row["count"],
+                    "closing_quantity": opening["quantity"] + row["quantity"],
+                    "closing_value": opening["value"] + row["value"],
+                    "last_transaction_id": row["last_transaction_id"],
+                    "last_transaction_date": row["last_transaction_date"],
+                    "created_at": now
+                },
+                upsert=True
+            ))
+        await self.summaries_collection.bulk_write(updates, ordered=False)
@@ -0,0 +1,192 @@
+from typing import AsyncIterator, List, Optional
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pydantic import ValidationError
+from app.core.config import settings
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.models.inventory_transaction import (
+    InventoryCountSessionCreate,
+    InventoryCountLine
+)
+
+OPEN_STATUSES = ["draft", "in_progress"]
+
+class InventoryCountCRUD:
+    """Count sessions that stage scanned lines before posting them.
+
+    Lines are upserted into a staging collection keyed by (session, product),
+    so re-sending a chunk after a dropped connection is harmless. Posting
+    takes differences against the stored balance, so a posting interrupted
+    halfway can be completed again without double counting.
+    """
+    indexes = {
+        "sessions_collection": [
+            IndexModel([("location_id", ASCENDING), ("status", ASCENDING)])
+        ],
+        "lines_collection": [
+            IndexModel([("session_id", ASCENDING), ("product_id", ASCENDING)], unique=True)
+        ]
+    }
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.sessions_collection = db.inven_pulse.inventory_count_sessions
+        self.lines_collection = db.inven_pulse.inventory_count_lines
+
+    async def create_session(
+        self,
+        count_session: InventoryCountSessionCreate,
+        user_id: str
+    ) -> dict:
+        session_dict = count_session.dict()
+        session_dict["status"] = "draft"
+        session_dict["line_count"] = 0
+        session_dict["transaction_count"] = 0
+        session_dict["created_by"] = ObjectId(user_id)
+        session_dict["created_at"] = datetime.utcnow()
+        session_dict["updated_at"] = session_dict["created_at"]
+
+        result = await self.sessions_collection.insert_one(session_dict)
+        session_dict["id"] = str(session_dict.pop("_id", result.inserted_id))
+        return session_dict
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(session_id):
+            return None
+
+        count_session = await self.sessions_collection.find_one(
+            {"_id": ObjectId(session_id)}
+        )
+        if count_session:
+            count_session["id"] = str(count_session.pop("_id"))
+            return count_session
+        return None
+
+    async def upsert_lines(
+        self,
+        session_id: str,
+        lines: AsyncIterator[dict]
+    ) -> Optional[dict]:
+        """Stage counted lines in chunks, keeping the last count per product."""
+        count_session = await self.get_session(session_id)
+        if not count_session:
+            return None
+        if count_session["status"] not in OPEN_STATUSES:
+            raise ValueError("Count session is no longer accepting lines")
+
+        session_oid = ObjectId(session_id)
+        received = 0
+        chunk: List[InventoryCountLine] = []
+
+        # Each chunk counts its new lines in the same transaction that
+        # stages them, so an upload that fails midway leaves line_count
+        # matching the lines already staged
+        async def write(session):
+            now = datetime.utcnow()
+            result = await self.lines_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"session_id": session_oid, "product_id": line.product_id},
+                        {
+                            "$set": {
+                                "counted_quantity": line.counted_quantity,
+                                "updated_at": now
+                            }
+                        },
+                        upsert=True
+                    )
+                    for line in chunk
+                ],
+                ordered=False,
+                session=session
+            )
+            await self.sessions_collection.update_one(
+                {"_id": session_oid},
+                {
+                    "$set": {"status": "in_progress", "updated_at": now},
+                    "$inc": {"line_count": result.upserted_count}
+                },
+                session=session
+            )
+
+        async def flush():
+            async with await self.db.start_session() as session:
+                await session.with_transaction(write)
+
+        async for raw_line in lines:
+            try:
+                chunk.append(InventoryCountLine(**raw_line))
+            except (TypeError, ValidationError) as e:
+                raise ValueError(f"Invalid count line {received + 1}: {e}")
+            received += 1
+            if len(chunk) == settings.COUNT_UPLOAD_CHUNK_SIZE:
+                await flush()
+                chunk = []
+        if chunk:
+            await flush()
+
+        updated = await self.sessions_collection.find_one(
+            {"_id": session_oid},
+            {"line_count": 1}
+        )
+        return {"received": received, "line_count": updated["line_count"]}
+
+    async def complete_session(self, session_id: str, user_id: str) -> Optional[dict]:
+        """Post every staged line as count transactions and close the session."""
+        if not ObjectId.is_valid(session_id):
+            return None
+
+        session_oid = ObjectId(session_id)
+        # A session left in "posting" by an interrupted request can be retried
+        count_session = await self.sessions_collection.find_one_and_update(
+            {"_id": session_oid, "status": {"$in": OPEN_STATUSES + ["posting"]}},
+            {"$set": {"status": "posting", "updated_at": datetime.utcnow()}},
+            return_document=True
+        )
+        if not count_session:
+            if await self.sessions_collection.count_documents({"_id": session_oid}, limit=1):
+                raise ValueError("Count session has already been completed")
+            return None
+
+        inventory_crud = InventoryTransactionCRUD(self.db)
+        transaction_count = 0
+        chunk = []
+        cursor = self.lines_collection.find(
+            {"session_id": session_oid},
+            {"product_id": 1, "counted_quantity": 1}
+        ).sort("product_id", 1).batch_size(settings.COUNT_POST_CHUNK_SIZE)
+        async for line in cursor:
+            chunk.append(line)
+            if len(chunk) == settings.COUNT_POST_CHUNK_SIZE:
+                transaction_count += len(await inventory_crud.post_count_lines(
+                    count_session["location_id"],
+                    chunk,
+                    user_id,
+                    notes=count_session.get("notes")
+                ))
+                chunk = []
+        if chunk:
+            transaction_count += len(await inventory_crud.post_count_lines(
+                count_session["location_id"],
+                chunk,
+                user_id,
+                notes=count_session.get("notes")
+            ))
+
+        now = datetime.utcnow()
+        completed = await self.sessions_collection.find_one_and_update(
+            {"_id": session_oid},
+            {
+                "$set": {
+                    "status": "completed",
+                    "completed_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"transaction_count": transaction_count}
+            },
+            return_document=True
+        )
+        completed["id"] = str(completed.pop("_id"))
+        return completed
@@ -0,0 +1,432 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+from app.crud.inventory_archive import InventoryArchiveCRUD
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+
+# Differences below this are float noise from summing many unit costs
+DRIFT_TOLERANCE = 1e-6
+# Candidate pairs rechecked per snapshot transaction
+CONFIRM_BATCH_SIZE = 200
+# A partition whose runner stops renewing its claim for this long is
+# presumed abandoned and can be claimed by another runner
+PARTITION_LEASE = timedelta(minutes=10)
+
+class InventoryReconciliationCRUD:
+    """Recompute inventory balances from the ledger and report drift.
+
+    The product_id keyspace is split into ranges that are reconciled
+    concurrently. A runner claims a range on the run document before
+    reconciling it and records its completion there, so an interrupted run
+    resumes with the ranges that are still pending, and runners started
+    for the same run never reconcile the same range at once.
+    """
+    indexes = {
+        "runs_collection": [
+            IndexModel([("created_at", DESCENDING)])
+        ],
+        "drift_collection": [
+            IndexModel([("run_id", ASCENDING), ("partition", ASCENDING)])
+        ]
+    }
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.transactions_collection = db.inven_pulse.inventory_transactions
+        self.balances_collection = db.inven_pulse.inventory_balances
+        self.runs_collection = db.inven_pulse.inventory_reconciliation_runs
+        self.drift_collection = db.inven_pulse.inventory_reconciliation_drift
+        self.archive_crud = InventoryArchiveCRUD(db)
+
+    async def create_run(self, partitions: int = 64, repair: bool = False) -> dict:
+        """Plan a reconciliation run over `partitions` product_id ranges."""
+        bounds = await self._partition_bounds(partitions)
+        run = {
+            "status": "pending",
+            "repair": repair,
+            "partitions": [
+                {
+                    "index": index,
+                    "min_product_id": min_product_id,
+                    "max_product_id": max_product_id,
+                    "status": "pending",
+                    "pairs_checked": 0,
+                    "drift_count": 0
+                }
+                for index, (min_product_id, max_product_id) in enumerate(bounds)
+            ],
+            "completed_partitions": 0,
+            "pairs_checked": 0,
+            "drift_count": 0,
+            "repaired_count": 0,
+            "created_at": datetime.utcnow()
+        }
+        result = await self.runs_collection.insert_one(run)
+        run["id"] = str(result.inserted_id)
+        return run
+
+    async def get_run(self, run_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(run_id):
+            return None
+
+        run = await self.runs_collection.find_one({"_id": ObjectId(run_id)})
+        if run:
+            run["id"] = str(run.pop("_id"))
+            return run
+        return None
+
+    async def get_drift(self, run_id: str, skip: int = 0, limit: int = 100) -> List[dict]:
+        if not ObjectId.is_valid(run_id):
+            return []
+
+        cursor = self.drift_collection.find({"run_id": ObjectId(run_id)}).sort(
+            [("partition", 1), ("_id", 1)]
+        ).skip(skip).limit(limit)
+        drifts = await cursor.to_list(length=limit)
+        for drift in drifts:
+            drift["id"] = str(drift.pop("_id"))
+        return drifts
+
+    async def run(
+        self,
+        run_id: str,
+        concurrency: int = 8,
+        progress: Optional[Callable[[dict], None]] = None
+    ) -> Optional[dict]:
+        """Reconcile every pending partition of a run, `concurrency` at a time."""
+        run = await self.get_run(run_id)
+        if not run:
+            return None
+
+        run_oid = ObjectId(run_id)
+        await self.runs_collection.update_one(
+            {"_id": run_oid},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+        )
+
+        semaphore = asyncio.Semaphore(concurrency)
+        total = len(run["partitions"])
+        # Identifies this runner's claims on partitions
+        owner = ObjectId()
+
+        async def reconcile(partition: dict):
+            async with semaphore:
+                if not await self._claim_partition(run_oid, partition["index"], owner):
+                    return
+                try:
+                    reconciled = await self._reconcile_partition(
+                        run_oid,
+                        partition,
+                        run["repair"],
+                        owner
+                    )
+                except Exception:
+                    await self._release_partition(run_oid, partition["index"], owner)
+                    raise
+                if reconciled is None:
+                    # The claim lapsed and another runner took the partition
+                    return
+                checked, drifted, repaired = reconciled
+                updated = await self.runs_collection.find_one_and_update(
+                    {
+                        "_id": run_oid,
+                        "partitions": {"$elemMatch": {"index": partition["index"], "owner": owner}}
+                    },
+                    {
+                        "$set": {
+                            "partitions.$.status": "completed",
+                            "partitions.$.lease_until": None,
+                            "partitions.$.pairs_checked": checked,
+                            "partitions.$.drift_count": drifted
+                        },
+                        "$inc": {
+                            "completed_partitions": 1,
+                            "pairs_checked": checked,
+                            "drift_count": drifted,
+                            "repaired_count": repaired
+                        }
+                    },
+                    projection={"partitions": 0},
+                    return_document=True
+                )
+                if progress and updated:
+                    progress({**updated, "total_partitions": total})
+
+        pending = [
+            partition for partition in run["partitions"]
+            if partition["status"] != "completed"
+        ]
+        try:
+            await asyncio.gather(*[reconcile(partition) for partition in pending])
+        except Exception as e:
+            await self.runs_collection.update_one(
+                {"_id": run_oid},
+                {"$set": {"status": "failed", "error": str(e)}}
+            )
+            raise
+
+        # Partitions claimed by another runner are left for it to complete
+        await self.runs_collection.update_one(
+            {"_id": run_oid, "completed_partitions": total},
+            {"$set": {"status": "completed", "finished_at": datetime.utcnow()}}
+        )
+        return await self.get_run(run_id)
+
+    async def _claim_partition(self, run_id: ObjectId, index: int, owner: ObjectId) -> bool:
+        """Take a pending partition, or one whose claim has lapsed."""
+        now = datetime.utcnow()
+        result = await self.runs_collection.update_one(
+            {
+                "_id": run_id,
+                "partitions": {
+                    "$elemMatch": {
+                        "index": index,
+                        "$or": [
+                            {"status": "pending"},
+                            {"status": "running", "lease_until": {"$lt": now}}
+                        ]
+                    }
+                }
+            },
+            {
+                "$set": {
+                    "partitions.$.status": "running",
+                    "partitions.$.owner": owner,
+                    "partitions.$.lease_until": now + PARTITION_LEASE
+                }
+            }
+        )
+        return result.modified_count == 1
+
+    async def _renew_partition(self, run_id: ObjectId, index: int, owner: ObjectId) -> bool:
+        """Extend a claim; False if it has passed to another runner."""
+        result = await self.runs_collection.update_one(
+            {
+                "_id": run_id,
+                "partitions": {"$elemMatch": {"index": index, "owner": owner, "status": "running"}}
+            },
+            {"$set": {"partitions.$.lease_until": datetime.utcnow() + PARTITION_LEASE}}
+        )
+        return result.matched_count == 1
+
+    async def _release_partition(self, run_id: ObjectId, index: int, owner: ObjectId) -> None:
+        await self.runs_collection.update_one(
+            {
+                "_id": run_id,
+                "partitions": {"$elemMatch": {"index": index, "owner": owner, "status": "running"}}
+            },
+            {"$set": {"partitions.$.status": "pending", "partitions.$.lease_until": None}}
+        )
+
+    async def _partition_bounds(self, partitions: int) -> List[Tuple[ObjectId, ObjectId]]:
+        """Split [min product_id, max product_id] into equal-width ranges.
+
+        Ranges are computed on the 96-bit ObjectId value, so they only need
+        the two ends of the product_id index rather than a scan.
+        """
+        first = await self.transactions_collection.find_one(
+            {}, {"product_id": 1}, sort=[("product_id", 1)]
+        )
+        last = await self.transactions_collection.find_one(
+            {}, {"product_id": 1}, sort=[("product_id", -1)]
+        )
+        balance_first = await self.balances_collection.find_one(
+            {}, {"product_id": 1}, sort=[("product_id", 1)]
+        )
+        balance_last = await self.balances_collection.find_one(
+            {}, {"product_id": 1}, sort=[("product_id", -1)]
+        )
+        ends = [
+            int(str(doc["product_id"]), 16)
+            for doc in (first, last, balance_first, balance_last)
+            if doc
+        ]
+        if not ends:
+            return []
+
+        low, high = min(ends), max(ends) + 1
+        width = max(1, -(-(high - low) // partitions))
+        bounds = []
+        for start in range(low, high, width):
+            end = min(start + width, high)
+            bounds.append((self._to_object_id(start), self._to_object_id(end)))
+        return bounds
+
+    @staticmethod
+    def _to_object_id(value: int) -> ObjectId:
+        return ObjectId(format(min(value, (1 << 96) - 1), "024x"))
+
+    async def _reconcile_partition(
+        self,
+        run_id: ObjectId,
+        partition: dict,
+        repair: bool,
+        owner: ObjectId
+    ) -> Optional[Tuple[int, int, int]]:
+        """Reconcile one claimed partition; None if the claim was lost midway."""
+        product_range = {
+            "$gte": partition["min_product_id"],
+            "$lt": partition["max_product_id"]
+        }
+        # Drop rows left over from an interrupted attempt at this partition
+        await self.drift_collection.delete_many(
+            {"run_id": run_id, "partition": partition["index"]}
+        )
+
+        # The partition scan reads the ledger and the balances separately,
+        # so a movement posted in between looks like drift. It only finds
+        # candidates; each is confirmed, and repaired, from one snapshot.
+        match = {"product_id": product_range}
+        ledger = await self._ledger_balances(match)
+        balances = await self._balances(match)
+        keys = ledger.keys() | balances.keys()
+        candidates = [key for key in keys if self._drifted(ledger.get(key), balances.get(key))]
+
+        drifts = []
+        for start in range(0, len(candidates), CONFIRM_BATCH_SIZE):
+            if not await self._renew_partition(run_id, partition["index"], owner):
+                return None
+            drifts.extend(await self._confirm_drift(
+                run_id,
+                partition,
+                candidates[start:start + CONFIRM_BATCH_SIZE],
+                repair
+            ))
+
+        if not await self._renew_partition(run_id, partition["index"], owner):
+            return None
+        if drifts:
+            await self.drift_collection.insert_many(drifts, ordered=False)
+            if repair:
+                await InventoryTransactionCRUD(self.db).invalidate_balances(
+                    (drift["product_id"], drift["location_id"]) for drift in drifts
+                )
+
+        return len(keys), len(drifts), len(drifts) if repair else 0
+
+    async def _ledger_balances(self, match: dict, session=None) -> Dict[Tuple[ObjectId, ObjectId], dict]:
+        """Quantity and value per pair matching `match`, summed from the ledger.
+
+        Archived months contribute their closing balance, the hot tier the
+        rows after the archive boundary.
+        """
+        ledger: Dict[Tuple[ObjectId, ObjectId], dict] = {}
+        ledger_match = dict(match)
+        archived_before = await self.archive_crud.get_archived_before(session=session)
+        if archived_before:
+            ledger = await self.archive_crud.get_closing_balances(match, archived_before, session=session)
+            ledger_match["created_at"] = {"$gte": archived_before}
+
+        pipeline = [
+            {"$match": ledger_match},
+            {
+                "$group": {
+                    "_id": {"product_id": "$product_id", "location_id": "$location_id"},
+                    "quantity": {"$sum": "$quantity"},
+                    "value": {"$sum": "$value"}
+                }
+            }
+        ]
+        async for row in self.transactions_collection.aggregate(
+            pipeline,
+            allowDiskUse=session is None,
+            session=session
+        ):
+            key = (row["_id"]["product_id"], row["_id"]["location_id"])
+            archived = ledger.get(key, {"quantity": 0, "value": 0})
+            ledger[key] = {
+                "quantity": archived["quantity"] + row["quantity"],
+                "value": archived["value"] + row["value"]
+            }
+        return ledger
+
+    async def _balances(self, match: dict, session=None) -> Dict[Tuple[ObjectId, ObjectId], dict]:
+        balances: Dict[Tuple[ObjectId, ObjectId], dict] = {}
+        async for balance in self.balances_collection.find(
+            match,
+            {"product_id": 1, "location_id": 1, "quantity": 1, "value": 1},
+            session=session
+        ):
+            balances[(balance["product_id"], balance["location_id"])] = balance
+        return balances
+
+    @staticmethod
+    def _drifted(expected: Optional[dict], balance: Optional[dict]) -> bool:
+        expected = expected or {"quantity": 0, "value": 0}
+        return balance is None or (
+            abs(balance.get("quantity", 0) - expected["quantity"]) > DRIFT_TOLERANCE
+            or abs(balance.get("value", 0) - expected["value"]) > DRIFT_TOLERANCE
+        )
+
+    async def _confirm_drift(
+        self,
+        run_id: ObjectId,
+        partition: dict,
+        pairs: List[Tuple[ObjectId, ObjectId]],
+        repair: bool
+    ) -> List[dict]:
+        """Recompute candidate pairs from one snapshot and repair the ones still drifted.
+
+        The repair is written in the same transaction, so a movement posted
+        after the snapshot conflicts with it and the whole check is retried.
+        """
+        match = {
+            "$or": [
+                {"product_id": product_id, "location_id": location_id}
+                for product_id, location_id in pairs
+            ]
+        }
+
+        async def confirm(session):
+            ledger = await self._ledger_balances(match, session=session)
+            balances = await self._balances(match, session=session)
+            drifts = []
+            for key in pairs:
+                expected = ledger.get(key, {"quantity": 0, "value": 0})
+                balance = balances.get(key)
+                if not self._drifted(expected, balance):
+                    continue
+                drifts.append({
+                    "run_id": run_id,
+                    "partition": partition["index"],
+                    "product_id": key[0],
+                    "location_id": key[1],
+                    "ledger_quantity": expected["quantity"],
+                    "ledger_value": expected["value"],
+                    "balance_quantity": balance.get("quantity") if balance else None,
+                    "balance_value": balance.get("value") if balance else None,
+                    "repaired": repair,
+                    "created_at": datetime.utcnow()
+                })
+
+            if repair and drifts:
+                await self.balances_collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {"product_id": drift["product_id"], "location_id": drift["location_id"]},
+                            {
+                                "$inc": {
+                                    "quantity": drift["ledger_quantity"] - (drift["balance_quantity"] or 0),
+                                    "value": drift["ledger_value"] - (drift["balance_value"] or 0)
+                                }
+                            },
+                            upsert=True
+                        )
+                        for drift in drifts
+                    ],
+                    ordered=False,
+                    session=session
+                )
+            return drifts
+
+        async with await self.db.start_session() as session:
+            return await session.with_transaction(
+                confirm,
+                read_concern=ReadConcern("snapshot"),
+                write_concern=WriteConcern("majority")
+            )
@@ -1,89 +1,558 @@
-from typing import List, Optional, Dict, Tuple
-from datetime import datetime
+import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, Iterable, List, Optional, Dict, Tuple
+from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, CursorType, IndexModel, UpdateOne
+from pymongo.errors import CollectionInvalid, PyMongoError
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.crud.cursors import merge_sorted
+from app.crud.inventory_archive import InventoryArchiveCRUD
+from app.crud.inventory_valuation import InventoryValuationCRUD
+from app.crud.pagination import KEYSET_SORT, apply_cursor
+from app.crud.references import ReferenceLoader
 from app.models.inventory_transaction import (
     InventoryTransactionCreate,
     InventoryTransactionUpdate,
     InventoryAdjustment,
     InventoryTransfer,
+    InventoryMultiTransfer,
+    InventoryTransferLine,
     InventoryCount
 )
 
+# (product_id, location_id) -> balance, shared by every CRUD instance in
+# this worker. Other workers' writes arrive through the invalidation channel.
+balance_cache = TTLCache(settings.BALANCE_CACHE_SIZE, settings.BALANCE_CACHE_TTL)
+# Identifies this worker's own messages on the invalidation channel
+WORKER_ID = ObjectId()
+# Single-row writes in flight per pair. When two overlap, their commits may
+# complete out of order, so the pair is evicted instead of written through.
+_balance_writes: Dict[Tuple[ObjectId, ObjectId], dict] = {}
+
+# Bucket sizes maintained in the movement rollups
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+def _bucket_start(moment: datetime, granularity: str) -> datetime:
+    bucket = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        bucket = bucket.replace(hour=0)
+    return bucket
+
 class InventoryTransactionCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("location_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("to_location_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("location_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("transaction_type", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)])
+        ],
+        "balances_collection": [
+            IndexModel([("product_id", ASCENDING), ("location_id", ASCENDING)], unique=True),
+            IndexModel([("location_id", ASCENDING), ("product_id", ASCENDING)])
+        ],
+        "checkpoints_collection": [
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("location_id", ASCENDING),
+                ("as_of", DESCENDING),
+                ("last_transaction_id", DESCENDING)
+            ])
+        ],
+        "rollups_collection": [
+            IndexModel([
+                ("product_id", ASCENDING),
+                ("granularity", ASCENDING),
+                ("bucket", ASCENDING),
+                ("location_id", ASCENDING)
+            ], unique=True),
+            IndexModel([
+                ("location_id", ASCENDING),
+                ("granularity", ASCENDING),
+                ("bucket", ASCENDING)
+            ])
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.inven_pulse.inventory_transactions
         self.balances_collection = db.inven_pulse.inventory_balances
+        self.checkpoints_collection = db.inven_pulse.inventory_balance_checkpoints
+        self.invalidations_collection = db.inven_pulse.inventory_balance_invalidations
+        self.rollups_collection = db.inven_pulse.inventory_movement_rollups
+        self.valuation_crud = InventoryValuationCRUD(db)
+        self.archive_crud = InventoryArchiveCRUD(db)
+
+    def _build_transaction_doc(
+        self,
+        transaction: InventoryTransactionCreate,
+        user_id: str,
+        created_at: datetime
+    ) -> dict:
+        transaction_dict = transaction.dict()
+        # Ids are assigned up front so balances and checkpoints can point
+        # at the ledger row before it is inserted
+        transaction_dict["_id"] = ObjectId()
+        transaction_dict["created_by"] = ObjectId(user_id)
+        transaction_dict["created_at"] = created_at
+        transaction_dict["updated_at"] = created_at
+        transaction_dict["value"] = (
+            transaction.quantity * transaction.unit_cost
+            if transaction.unit_cost
+            else 0
+        )
+        return transaction_dict
+
+    def _stamp_created_at(self, transaction_dict: dict, last_transaction_date: Optional[datetime]) -> datetime:
+        """Date a ledger row now, or just after its pair's last row if that is later.
+
+        Called inside the posting transaction on every attempt. Because the
+        pair's balance is written in the same transaction, a row committed
+        after a checkpoint is always dated after the checkpoint's as_of.
+        """
+        now = self._posting_time()
+        if last_transaction_date and now <= last_transaction_date:
+            now = last_transaction_date + timedelta(milliseconds=1)
+        transaction_dict["created_at"] = now
+        transaction_dict["updated_at"] = now
+        return now
+
+    def _posting_time(self) -> datetime:
+        now = datetime.utcnow()
+        # BSON dates keep milliseconds, so compare at that precision
+        return now.replace(microsecond=now.microsecond // 1000 * 1000)
 
     async def create(
         self,
         transaction: InventoryTransactionCreate,
-        user_id: str
+        user_id: str,
+        prevent_negative: bool = False
+    ) -> dict:
+        transaction_dict = self._build_transaction_doc(
+            transaction,
+            user_id,
+            datetime.utcnow()
+        )
+
+        written = {}
+
+        async def write(session):
+            # Provisional date for the cost layers; the balance update below
+            # settles the final one
+            self._stamp_created_at(transaction_dict, None)
+            if settings.COST_LAYERS_ENABLED:
+                # Costs rows posted without a unit_cost before their value is used
+                await self.valuation_crud.apply_transactions([transaction_dict], session)
+            # The balance post-image carries the running balance and the
+            # date given to this row
+            balance = await self._apply_balance_delta(
+                transaction.product_id,
+                transaction.location_id,
+                transaction.quantity,
+                transaction_dict["value"],
+                transaction_dict["created_at"],
+                transaction_dict["_id"],
+                prevent_negative=prevent_negative,
+                session=session
+            )
+            transaction_dict["created_at"] = balance["last_transaction_date"]
+            transaction_dict["updated_at"] = balance["last_transaction_date"]
+            transaction_dict["running_balance"] = balance["quantity"]
+            written["balance"] = balance
+            await self.collection.insert_one(transaction_dict, session=session)
+            await self.rollups_collection.bulk_write(
+                self._rollup_updates([transaction_dict]),
+                ordered=False,
+                session=session
+            )
+
+            if balance["transactions_since_checkpoint"] >= settings.BALANCE_CHECKPOINT_INTERVAL:
+                await self.checkpoints_collection.insert_one(
+                    self._build_checkpoint(
+                        balance["product_id"],
+                        balance["location_id"],
+                        balance["quantity"],
+                        balance["value"],
+                        transaction_dict["created_at"],
+                        transaction_dict["_id"]
+                    ),
+                    session=session
+                )
+                await self.balances_collection.update_one(
+                    {"_id": balance["_id"]},
+                    {"$inc": {"transactions_since_checkpoint": -balance["transactions_since_checkpoint"]}},
+                    session=session
+                )
+
+        key = (transaction.product_id, transaction.location_id)
+        writes = _balance_writes.setdefault(key, {"in_flight": 0, "contended": False})
+        writes["in_flight"] += 1
+        if writes["in_flight"] > 1:
+            writes["contended"] = True
+        try:
+            # with_transaction retries transient write conflicts on hot balances
+            async with await self.db.start_session() as session:
+                await session.with_transaction(write)
+        finally:
+            writes["in_flight"] -= 1
+            if not writes["in_flight"]:
+                del _balance_writes[key]
+
+        if writes["contended"]:
+            await self.invalidate_balances([key])
+        else:
+            await self._cache_balance(written["balance"])
+
+        transaction_dict["id"] = str(transaction_dict.pop("_id"))
+        return transaction_dict
+
+    async def _apply_balance_delta(
+        self,
+        product_id: ObjectId,
+        location_id: ObjectId,
+        quantity: float,
+        value: float,
+        transaction_date: datetime,
+        transaction_id: ObjectId,
+        prevent_negative: bool = False,
+        session=None
     ) -> dict:
-        # Start a session for transaction atomicity
+        """Atomically add to a balance and return its post-image.
+
+        The post-image's last_transaction_date is the date the new row
+        takes: `transaction_date`, or just after the pair's previous row if
+        that is later, so rows stay in order without reading the balance
+        first. With `prevent_negative` a deduction only matches a balance
+        that can cover it, so the stock check happens in the same round trip.
+        """
+        query = {"product_id": product_id, "location_id": location_id}
+        guarded = prevent_negative and quantity < 0
+        if guarded:
+            query["quantity"] = {"$gte": -quantity}
+
+        balance = await self.balances_collection.find_one_and_update(
+            query,
+            [{
+                "$set": {
+                    "quantity": {"$add": [{"$ifNull": ["$quantity", 0]}, quantity]},
+                    "value": {"$add": [{"$ifNull": ["$value", 0]}, value]},
+                    "transactions_since_checkpoint": {
+                        "$add": [{"$ifNull": ["$transactions_since_checkpoint", 0]}, 1]
+                    },
+                    # A missing date adds up to null, which $max ignores
+                    "last_transaction_date": {
+                        "$max": [transaction_date, {"$add": ["$last_transaction_date", 1]}]
+                    },
+                    "last_transaction_id": transaction_id
+                }
+            }],
+            upsert=not guarded,
+            return_document=True,
+            session=session
+        )
+        if balance is None:
+            raise ValueError("Insufficient stock for this product at this location")
+        return balance
+
+    async def create_bulk(
+        self,
+        transactions: List[InventoryTransactionCreate],
+        user_id: str,
+        prevent_negative: bool = False
+    ) -> List[dict]:
+        """Insert a batch of transactions in one session and transaction.
+
+        Ledger rows go out in a single insert_many and balance deltas are
+        grouped per (product_id, location_id) into a single bulk_write, so
+        the number of round trips does not grow with the batch size.
+        """
+        created_at = datetime.utcnow()
+        transaction_docs = [
+            self._build_transaction_doc(transaction, user_id, created_at)
+            for transaction in transactions
+        ]
+
+        return await self._post_batch(transaction_docs, prevent_negative)
+
+    async def _post_batch(
+        self,
+        transaction_docs: List[dict],
+        prevent_negative: bool = False
+    ) -> List[dict]:
+        """Write a batch of ledger rows in one session with a single commit."""
+        async def write(session):
+            await self._write_batch(
+                transaction_docs,
+                session,
+                prevent_negative=prevent_negative
+            )
+
         async with await self.db.start_session() as session:
-            async with session.start_transaction():
-                # Get current balance
-                balance = await self.balances_collection.find_one(
+            await session.with_transaction(write)
+        await self.invalidate_balances(
+            (doc["product_id"], doc["location_id"]) for doc in transaction_docs
+        )
+
+        for transaction_dict in transaction_docs:
+            transaction_dict["id"] = str(transaction_dict.pop("_id"))
+        return transaction_docs
+
+    async def _get_balances_for_pairs(
+        self,
+        pairs: List[Tuple[ObjectId, ObjectId]],
+        session=None
+    ) -> Dict[Tuple[ObjectId, ObjectId], dict]:
+        """Fetch the balances of many (product_id, location_id) pairs in one query."""
+        products_by_location: Dict[ObjectId, set] = {}
+        for product_id, location_id in pairs:
+            products_by_location.setdefault(location_id, set()).add(product_id)
+        if not products_by_location:
+            return {}
+
+        query = {
+            "$or": [
+                {"location_id": location_id, "product_id": {"$in": list(product_ids)}}
+                for location_id, product_ids in products_by_location.items()
+            ]
+        }
+        balances = {}
+        async for balance in self.balances_collection.find(query, session=session):
+            balances[(balance["product_id"], balance["location_id"])] = balance
+        return balances
+
+    async def _write_batch(
+        self,
+        transaction_docs: List[dict],
+        session,
+        prevent_negative: bool = False,
+        balances: Optional[Dict[Tuple[ObjectId, ObjectId], dict]] = None
+    ) -> None:
+        """Write prepared ledger rows and their balance deltas inside `session`.
+
+        Running balances are assigned in batch order starting from the
+        balances read at the beginning of the transaction. Callers that
+        already read them in the same session can pass `balances`. Rows are
+        dated here, on every attempt, after their pair's last row.
+        """
+        pairs = {
+            (doc["product_id"], doc["location_id"])
+            for doc in transaction_docs
+        }
+        if balances is None:
+            balances = await self._get_balances_for_pairs(list(pairs), session)
+
+        last_dates = {
+            key: balances[key].get("last_transaction_date") if key in balances else None
+            for key in pairs
+        }
+        for transaction_dict in transaction_docs:
+            key = (transaction_dict["product_id"], transaction_dict["location_id"])
+            last_dates[key] = self._stamp_created_at(transaction_dict, last_dates[key])
+
+        if settings.COST_LAYERS_ENABLED:
+            await self.valuation_crud.apply_transactions(transaction_docs, session)
+
+        totals = {}
+        for key in pairs:
+            balance = balances.get(key, {})
+            totals[key] = {
+                "quantity": balance.get("quantity", 0),
+                "value": balance.get("value", 0),
+                "quantity_delta": 0,
+                "value_delta": 0,
+                "transactions_since_checkpoint": balance.get("transactions_since_checkpoint", 0),
+                "last_transaction_date": None,
+                "last_transaction_id": None
+            }
+
+        checkpoints = []
+        for transaction_dict in transaction_docs:
+            key = (transaction_dict["product_id"], transaction_dict["location_id"])
+            pair = totals[key]
+            pair["quantity"] += transaction_dict["quantity"]
+            pair["value"] += transaction_dict["value"]
+            pair["quantity_delta"] += transaction_dict["quantity"]
+            pair["value_delta"] += transaction_dict["value"]
+            transaction_dict["running_balance"] = pair["quantity"]
+            if prevent_negative and transaction_dict["quantity"] < 0 and pair["quantity"] < 0:
+                raise ValueError("Insufficient stock for this product at this location")
+
+            pair["last_transaction_date"] = max(
+                pair["last_transaction_date"] or transaction_dict["created_at"],
+                transaction_dict["created_at"]
+            )
+            pair["last_transaction_id"] = transaction_dict["_id"]
+            pair["transactions_since_checkpoint"] += 1
+            if pair["transactions_since_checkpoint"] >= settings.BALANCE_CHECKPOINT_INTERVAL:
+                checkpoints.append(self._build_checkpoint(
+                    key[0],
+                    key[1],
+                    pair["quantity"],
+                    pair["value"],
+                    transaction_dict["created_at"],
+                    transaction_dict["_id"]
+                ))
+                pair["transactions_since_checkpoint"] = 0
+
+        await self.collection.insert_many(transaction_docs, session=session)
+
+        await self.balances_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"product_id": product_id, "location_id": location_id},
                     {
-                        "product_id": transaction.product_id,
-                        "location_id": transaction.location_id
+                        "$inc": {
+                            "quantity": pair["quantity_delta"],
+                            "value": pair["value_delta"]
+                        },
+                        "$max": {
+                            "last_transaction_date": pair["last_transaction_date"]
+                        },
+                        "$set": {
+                            "last_transaction_id": pair["last_transaction_id"],
+                            "transactions_since_checkpoint": pair["transactions_since_checkpoint"]
+                        }
                     },
-                    session=session
+                    upsert=True
                 )
+                for (product_id, location_id), pair in totals.items()
+            ],
+            ordered=False,
+            session=session
+        )
 
-                current_balance = balance["quantity"] if balance else 0
-                new_balance = current_balance + transaction.quantity
-
-                # Create transaction document
-                transaction_dict = transaction.dict()
-                transaction_dict["created_by"] = ObjectId(user_id)
-                transaction_dict["created_at"] = datetime.utcnow()
-                transaction_dict["updated_at"] = transaction_dict["created_at"]
-                transaction_dict["running_balance"] = new_balance
-                transaction_dict["value"] = (
-                    transaction.quantity * transaction.unit_cost
-                    if transaction.unit_cost
-                    else 0
-                )
+        await self.rollups_collection.bulk_write(
+            self._rollup_updates(transaction_docs),
+            ordered=False,
+            session=session
+        )
 
-                # Insert transaction
-                result = await self.collection.insert_one(
-                    transaction_dict,
-                    session=session
+        if checkpoints:
+            await self.checkpoints_collection.insert_many(checkpoints, session=session)
+
+    def _rollup_updates(self, transaction_docs: List[dict]) -> List[UpdateOne]:
+        """$inc upserts adding ledger rows to their hourly and daily buckets."""
+        increments: Dict[tuple, Dict[str, float]] = {}
+        for transaction_dict in transaction_docs:
+            quantity = transaction_dict["quantity"]
+            transaction_type = transaction_dict["transaction_type"]
+            for granularity in ROLLUP_GRANULARITIES:
+                key = (
+                    transaction_dict["product_id"],
+                    transaction_dict["location_id"],
+                    granularity,
+                    _bucket_start(transaction_dict["created_at"], granularity)
                 )
+                inc = increments.setdefault(key, defaultdict(int))
+                inc["quantity"] += quantity
+                inc["inbound_quantity" if quantity > 0 else "outbound_quantity"] += abs(quantity)
+                inc["value"] += transaction_dict["value"]
+                inc["count"] += 1
+                inc[f"by_type.{transaction_type}.quantity"] += quantity
+                inc[f"by_type.{transaction_type}.value"] += transaction_dict["value"]
+                inc[f"by_type.{transaction_type}.count"] += 1
 
-                # Update or create balance
-                if balance:
-                    await self.balances_collection.update_one(
-                        {
-                            "product_id": transaction.product_id,
-                            "location_id": transaction.location_id
-                        },
-                        {
-                            "$set": {
-                                "quantity": new_balance,
-                                "last_transaction_date": transaction_dict["created_at"]
-                            },
-                            "$inc": {"value": transaction_dict["value"]}
-                        },
-                        session=session
-                    )
-                else:
-                    await self.balances_collection.insert_one(
-                        {
-                            "product_id": transaction.product_id,
-                            "location_id": transaction.location_id,
-                            "quantity": new_balance,
-                            "value": transaction_dict["value"],
-                            "last_transaction_date": transaction_dict["created_at"]
-                        },
-                        session=session
-                    )
+        return [
+            UpdateOne(
+                {
+                    "product_id": product_id,
+                    "location_id": location_id,
+                    "granularity": granularity,
+                    "bucket": bucket
+                },
+                {"$inc": dict(inc)},
+                upsert=True
+            )
+            for (product_id, location_id, granularity, bucket), inc in increments.items()
+        ]
 
-                transaction_dict["id"] = str(result.inserted_id)
-                return transaction_dict
+    def _build_checkpoint(
+        self,
+        product_id: ObjectId,
+        location_id: ObjectId,
+        quantity: float,
+        value: float,
+        as_of: datetime,
+        last_transaction_id: Optional[ObjectId]
+    ) -> dict:
+        """A balance snapshot covering every ledger row up to (as_of, last_transaction_id)."""
+        return {
+            "product_id": product_id,
+            "location_id": location_id,
+            "quantity": quantity,
+            "value": value,
+            "as_of": as_of,
+            "last_transaction_id": last_transaction_id,
+            "created_at": datetime.utcnow()
+        }
+
+    async def write_checkpoints(self, batch_size: int = 1000) -> int:
+        """Checkpoint every balance that changed since its last checkpoint."""
+        written = 0
+        batch = []
+        cursor = self.balances_collection.find(
+            {"transactions_since_checkpoint": {"$gt": 0}}
+        ).batch_size(batch_size)
+        async for balance in cursor:
+            batch.append(balance)
+            if len(batch) == batch_size:
+                written += await self._checkpoint_balances(batch)
+                batch = []
+        if batch:
+            written += await self._checkpoint_balances(batch)
+        return written
+
+    async def _checkpoint_balances(self, balances: List[dict]) -> int:
+        await self.checkpoints_collection.insert_many([
+            self._build_checkpoint(
+                balance["product_id"],
+                balance["location_id"],
+                balance["quantity"],
+                balance["value"],
+                balance["last_transaction_date"],
+                balance.get("last_transaction_id")
+            )
+            for balance in balances
+        ])
+        # Decrement rather than reset so writes that landed after the
+        # read still count towards the next checkpoint
+        await self.balances_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": balance["_id"]},
+                    {"$inc": {"transactions_since_checkpoint": -balance["transactions_since_checkpoint"]}}
+                )
+                for balance in balances
+            ],
+            ordered=False
+        )
+        return len(balances)
 
     async def get(self, transaction_id: str) -> Optional[dict]:
         if not ObjectId.is_valid(transaction_id):
@@ -92,6 +561,10 @@ class InventoryTransactionCRUD:
         transaction = await self.collection.find_one(
             {"_id": ObjectId(transaction_id)}
         )
+        if not transaction:
+            transaction = await self.archive_crud.archive_collection.find_one(
+                {"_id": ObjectId(transaction_id)}
+            )
         if transaction:
             transaction["id"] = str(transaction.pop("_id"))
             return transaction
@@ -142,6 +615,8 @@ class InventoryTransactionCRUD:
         ])
 
         result = await self.collection.aggregate(pipeline).to_list(1)
+        if not result:
+            result = await self.archive_crud.archive_collection.aggregate(pipeline).to_list(1)
         if result:
             transaction = result[0]
             transaction["id"] = str(transaction.pop("_id"))
@@ -156,7 +631,9 @@ class InventoryTransactionCRUD:
         location_id: Optional[str] = None,
         transaction_type: Optional[str] = None,
         from_date: Optional[datetime] = None,
-        to_date: Optional[datetime] = None
+        to_date: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        with_details: bool = False
     ) -> List[dict]:
         query = {}
         if product_id and ObjectId.is_valid(product_id):
@@ -172,15 +649,47 @@ class InventoryTransactionCRUD:
             if to_date:
                 query["created_at"]["$lte"] = to_date
 
-        cursor = self.collection.find(query).sort(
-            "created_at", -1
-        ).skip(skip).limit(limit)
-        
-        transactions = await cursor.to_list(length=limit)
+        query = apply_cursor(query, cursor)
+        transactions = await self.collection.find(query).sort(
+            KEYSET_SORT
+        ).skip(skip).limit(limit).to_list(length=limit)
         for transaction in transactions:
             transaction["id"] = str(transaction.pop("_id"))
+        if with_details:
+            await self.attach_details(transactions)
         return transactions
 
+    async def attach_details(
+        self,
+        transactions: List[dict],
+        loader: Optional[ReferenceLoader] = None
+    ) -> None:
+        """Add product and location documents to a page of transactions.
+
+        Resolves the same references as get_with_details, but with one $in
+        query per collection for the whole page instead of $lookups per row.
+        """
+        loader = loader or ReferenceLoader(self.db.inven_pulse)
+        products = await loader.load_many(
+            "products",
+            (transaction["product_id"] for transaction in transactions)
+        )
+        locations = await loader.load_many(
+            "locations",
+            (
+                id
+                for transaction in transactions
+                for id in (transaction["location_id"], transaction.get("to_location_id"))
+            )
+        )
+        for transaction in transactions:
+            if transaction["product_id"] in products:
+                transaction["product_details"] = products[transaction["product_id"]]
+            if transaction["location_id"] in locations:
+                transaction["location_details"] = locations[transaction["location_id"]]
+            if transaction.get("to_location_id") in locations:
+                transaction["to_location_details"] = locations[transaction["to_location_id"]]
+
     async def get_balance(
         self,
         product_id: str,
@@ -189,15 +698,212 @@ class InventoryTransactionCRUD:
         if not ObjectId.is_valid(product_id) or not ObjectId.is_valid(location_id):
             return None
 
+        key = (ObjectId(product_id), ObjectId(location_id))
+        if settings.BALANCE_CACHE_ENABLED:
+            cached = balance_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+
         balance = await self.balances_collection.find_one({
-            "product_id": ObjectId(product_id),
-            "location_id": ObjectId(location_id)
+            "product_id": key[0],
+            "location_id": key[1]
         })
         if balance:
             balance["id"] = str(balance.pop("_id"))
+            if settings.BALANCE_CACHE_ENABLED:
+                balance_cache.set(key, dict(balance))
             return balance
         return None
 
+    async def _cache_balance(self, balance: dict) -> None:
+        """Write a committed balance post-image through to the cache."""
+        if not settings.BALANCE_CACHE_ENABLED:
+            return
+        key = (balance["product_id"], balance["location_id"])
+        cached = dict(balance)
+        cached["id"] = str(cached.pop("_id"))
+        balance_cache.set(key, cached)
+        await self._publish_invalidation([key])
+
+    async def invalidate_balances(self, pairs: Iterable[Tuple[ObjectId, ObjectId]]) -> None:
+        """Evict balances in this worker and tell the other workers to do the same."""
+        if not settings.BALANCE_CACHE_ENABLED:
+            return
+        keys = set(pairs)
+        for key in keys:
+            balance_cache.invalidate(key)
+        await self._publish_invalidation(list(keys))
+
+    async def _publish_invalidation(self, keys: List[Tuple[ObjectId, ObjectId]]) -> None:
+        if not keys:
+            return
+        try:
+            await self.invalidations_collection.insert_one({
+                "origin": WORKER_ID,
+                "pairs": [list(key) for key in keys],
+                "created_at": datetime.utcnow()
+            })
+        except PyMongoError as e:
+            # The write has committed; other workers fall back to the TTL
+            print(f"Could not publish balance invalidation: {e}")
+
+    async def ensure_invalidation_channel(self) -> None:
+        """Create the capped collection that carries balance invalidations."""
+        try:
+            await self.db.inven_pulse.create_collection(
+                self.invalidations_collection.name,
+                capped=True,
+                size=settings.BALANCE_INVALIDATION_CHANNEL_BYTES
+            )
+        except CollectionInvalid:
+            return
+        # A tailable cursor on an empty capped collection dies immediately
+        await self.invalidations_collection.insert_one({
+            "origin": WORKER_ID,
+            "pairs": [],
+            "created_at": datetime.utcnow()
+        })
+
+    async def listen_for_invalidations(self) -> None:
+        """Tail the invalidation channel and evict balances written by other workers.
+
+        Runs until cancelled. Whenever the tailable cursor has to be reopened
+        the whole cache is dropped, since messages may have been missed.
+        """
+        await self.ensure_invalidation_channel()
+        while True:
+            balance_cache.clear()
+            cursor = self.invalidations_collection.find(
+                {},
+                cursor_type=CursorType.TAILABLE_AWAIT
+            )
+            try:
+                while cursor.alive:
+                    async for message in cursor:
+                        if message["origin"] == WORKER_ID:
+                            continue
+                        for product_id, location_id in message["pairs"]:
+                            balance_cache.invalidate((product_id, location_id))
+            except PyMongoError as e:
+                print(f"Balance invalidation channel interrupted: {e}")
+            await asyncio.sleep(1)
+
+    def cache_stats(self) -> dict:
+        return {"enabled": settings.BALANCE_CACHE_ENABLED, **balance_cache.stats()}
+
+    async def lookup_balances(
+        self,
+        product_ids: List[ObjectId],
+        location_ids: List[ObjectId],
+        include_totals: bool = False
+    ) -> dict:
+        """Balances for every requested product/location combination in one query.
+
+        Either list may be empty to match every product or every location.
+        With `include_totals`, per-product sums over the matched balances are
+        accumulated while the balances are read.
+        """
+        if not product_ids and not location_ids:
+            raise ValueError("Provide at least one product_id or location_id")
+
+        match = {}
+        if product_ids:
+            match["product_id"] = {"$in": product_ids}
+        if location_ids:
+            match["location_id"] = {"$in": location_ids}
+
+        balances = []
+        totals: Dict[ObjectId, dict] = {}
+        cursor = self.balances_collection.find(match).sort([("product_id", 1), ("location_id", 1)])
+        async for balance in cursor:
+            if include_totals:
+                total = totals.setdefault(
+                    balance["product_id"],
+                    {"product_id": balance["product_id"], "quantity": 0, "value": 0, "locations": 0}
+                )
+                total["quantity"] += balance.get("quantity", 0)
+                total["value"] += balance.get("value", 0)
+                total["locations"] += 1
+            balance["id"] = str(balance.pop("_id"))
+            balances.append(balance)
+
+        return {
+            "balances": balances,
+            "totals": list(totals.values()) if include_totals else None
+        }
+
+    async def get_balance_as_of(
+        self,
+        product_id: str,
+        location_id: str,
+        as_of: datetime
+    ) -> Optional[dict]:
+        """Balance at a point in time from the nearest checkpoint plus the ledger tail."""
+        if not ObjectId.is_valid(product_id) or not ObjectId.is_valid(location_id):
+            return None
+
+        pair = {
+            "product_id": ObjectId(product_id),
+            "location_id": ObjectId(location_id)
+        }
+        checkpoint = await self.checkpoints_collection.find_one(
+            {**pair, "as_of": {"$lte": as_of}},
+            sort=[("as_of", -1), ("last_transaction_id", -1)]
+        )
+        # The closing balance of an archived month serves as a checkpoint
+        # at the month boundary when it is more recent
+        summary = await self.archive_crud.get_closing_summary(
+            pair["product_id"],
+            pair["location_id"],
+            as_of
+        )
+
+        tail_query = {**pair, "created_at": {"$lte": as_of}}
+        if summary and (not checkpoint or summary["period_end"] > checkpoint["as_of"]):
+            base = {
+                "as_of": summary["period_end"],
+                "quantity": summary["closing_quantity"],
+                "value": summary["closing_value"]
+            }
+            tail_query["created_at"]["$gte"] = summary["period_end"]
+        elif checkpoint:
+            base = checkpoint
+            after_checkpoint = [{"created_at": {"$gt": checkpoint["as_of"]}}]
+            if checkpoint.get("last_transaction_id"):
+                after_checkpoint.append({
+                    "created_at": checkpoint["as_of"],
+                    "_id": {"$gt": checkpoint["last_transaction_id"]}
+                })
+            tail_query["$or"] = after_checkpoint
+        else:
+            base = None
+
+        tail = {"quantity": 0, "value": 0, "count": 0}
+        archived_before = await self.archive_crud.get_archived_before()
+        for collection, tier_query in self.archive_crud.split_tiers(tail_query, archived_before):
+            async for totals in collection.aggregate([
+                {"$match": tier_query},
+                {
+                    "$group": {
+                        "_id": None,
+                        "quantity": {"$sum": "$quantity"},
+                        "value": {"$sum": "$value"},
+                        "count": {"$sum": 1}
+                    }
+                }
+            ]):
+                for field in tail:
+                    tail[field] += totals[field]
+
+        return {
+            **pair,
+            "as_of": as_of,
+            "quantity": (base["quantity"] if base else 0) + tail["quantity"],
+            "value": (base["value"] if base else 0) + tail["value"],
+            "checkpoint_as_of": base["as_of"] if base else None,
+            "replayed_transactions": tail["count"]
+        }
+
     async def process_adjustment(
         self,
         adjustment: InventoryAdjustment,
@@ -228,67 +934,324 @@ class InventoryTransactionCRUD:
     async def process_transfer(
         self,
         transfer: InventoryTransfer,
-        user_id: str
+        user_id: str,
+        prevent_negative: bool = False
     ) -> Tuple[dict, dict]:
-        async with await self.db.start_session() as session:
-            async with session.start_transaction():
-                # Deduct from source location
-                from_transaction = InventoryTransactionCreate(
-                    product_id=transfer.product_id,
-                    quantity=-transfer.quantity,
+        from_result, to_result = await self.process_multi_transfer(
+            InventoryMultiTransfer(
+                from_location_id=transfer.from_location_id,
+                to_location_id=transfer.to_location_id,
+                lines=[
+                    InventoryTransferLine(
+                        product_id=transfer.product_id,
+                        quantity=transfer.quantity
+                    )
+                ],
+                reason=transfer.reason,
+                notes=transfer.notes
+            ),
+            user_id,
+            prevent_negative=prevent_negative
+        )
+        return from_result, to_result
+
+    async def process_multi_transfer(
+        self,
+        transfer: InventoryMultiTransfer,
+        user_id: str,
+        prevent_negative: bool = False
+    ) -> List[dict]:
+        """Move many products between two locations atomically.
+
+        Both legs of every line are written with one insert_many and one
+        balance bulk_write inside a single transaction. The result lists
+        the source and destination leg of each line in order.
+        """
+        if transfer.from_location_id == transfer.to_location_id:
+            raise ValueError("Source and destination locations must differ")
+
+        created_at = datetime.utcnow()
+        transaction_docs = []
+        for line in transfer.lines:
+            # Deduct from source location
+            transaction_docs.append(self._build_transaction_doc(
+                InventoryTransactionCreate(
+                    product_id=line.product_id,
+                    quantity=-line.quantity,
                     transaction_type="transfer",
                     reference_type="transfer",
                     location_id=transfer.from_location_id,
                     to_location_id=transfer.to_location_id,
                     reason=transfer.reason,
                     notes=transfer.notes
-                )
-                from_result = await self.create(from_transaction, user_id)
-
-                # Add to destination location
-                to_transaction = InventoryTransactionCreate(
-                    product_id=transfer.product_id,
-                    quantity=transfer.quantity,
+                ),
+                user_id,
+                created_at
+            ))
+            # Add to destination location
+            transaction_docs.append(self._build_transaction_doc(
+                InventoryTransactionCreate(
+                    product_id=line.product_id,
+                    quantity=line.quantity,
                     transaction_type="transfer",
                     reference_type="transfer",
                     location_id=transfer.to_location_id,
                     reason=transfer.reason,
                     notes=transfer.notes
-                )
-                to_result = await self.create(to_transaction, user_id)
+                ),
+                user_id,
+                created_at
+            ))
 
-                return from_result, to_result
+        return await self._post_batch(transaction_docs, prevent_negative)
 
     async def process_count(
         self,
         count: InventoryCount,
         user_id: str
     ) -> List[dict]:
+        return await self.post_count_lines(
+            count.location_id,
+            count.products,
+            user_id,
+            notes=count.notes
+        )
+
+    async def post_count_lines(
+        self,
+        location_id: ObjectId,
+        lines: List[dict],
+        user_id: str,
+        notes: Optional[str] = None,
+        chunk_size: Optional[int] = None
+    ) -> List[dict]:
+        """Post counted quantities for a location as count transactions.
+
+        Each line is {product_id, counted_quantity}. The difference is taken
+        against the balance stored at posting time, and lines are written in
+        chunks of `chunk_size`, one transaction per chunk, so very large
+        counts stay within transaction limits.
+        """
+        counted: Dict[ObjectId, float] = {}
+        for line in lines:
+            if not ObjectId.is_valid(str(line.get("product_id"))):
+                raise ValueError(f"Invalid product_id in count line: {line.get('product_id')}")
+            # A product scanned twice keeps its last counted quantity
+            counted[ObjectId(str(line["product_id"]))] = line["counted_quantity"]
+
+        chunk_size = chunk_size or settings.COUNT_POST_CHUNK_SIZE
+        product_ids = list(counted)
         transactions = []
-        async with await self.db.start_session() as session:
-            async with session.start_transaction():
-                for product in count.products:
-                    difference = product["counted_quantity"] - product["system_quantity"]
-                    if difference != 0:
-                        transaction = InventoryTransactionCreate(
-                            product_id=product["product_id"],
+        for start in range(0, len(product_ids), chunk_size):
+            chunk = {
+                product_id: counted[product_id]
+                for product_id in product_ids[start:start + chunk_size]
+            }
+            transactions.extend(
+                await self._post_count_chunk(location_id, chunk, user_id, notes)
+            )
+        return transactions
+
+    async def _post_count_chunk(
+        self,
+        location_id: ObjectId,
+        counted: Dict[ObjectId, float],
+        user_id: str,
+        notes: Optional[str]
+    ) -> List[dict]:
+        async def write(session):
+            counted_at = datetime.utcnow()
+            balances = await self._get_balances_for_pairs(
+                [(product_id, location_id) for product_id in counted],
+                session
+            )
+            transaction_docs = []
+            for product_id, counted_quantity in counted.items():
+                balance = balances.get((product_id, location_id))
+                difference = counted_quantity - (balance["quantity"] if balance else 0)
+                if difference != 0:
+                    transaction_docs.append(self._build_transaction_doc(
+                        InventoryTransactionCreate(
+                            product_id=product_id,
                             quantity=difference,
                             transaction_type="count",
                             reference_type="count",
-                            location_id=count.location_id,
-                            notes=count.notes
-                        )
-                        result = await self.create(transaction, user_id)
-                        transactions.append(result)
-
-                # Update last count date
-                await self.balances_collection.update_many(
-                    {"location_id": count.location_id},
-                    {"$set": {"last_count_date": datetime.utcnow()}},
-                    session=session
+                            location_id=location_id,
+                            notes=notes
+                        ),
+                        user_id,
+                        counted_at
+                    ))
+            if transaction_docs:
+                await self._write_batch(transaction_docs, session, balances=balances)
+
+            # Update last count date
+            await self.balances_collection.update_many(
+                {"location_id": location_id, "product_id": {"$in": list(counted)}},
+                {"$set": {"last_count_date": counted_at}},
+                session=session
+            )
+            return transaction_docs
+
+        async with await self.db.start_session() as session:
+            transaction_docs = await session.with_transaction(write)
+        # last_count_date changed on every counted balance, not only the adjusted ones
+        await self.invalidate_balances(
+            (product_id, location_id) for product_id in counted
+        )
+
+        for transaction_dict in transaction_docs:
+            transaction_dict["id"] = str(transaction_dict.pop("_id"))
+        return transaction_docs
+
+    async def get_movement_rollups(
+        self,
+        product_id: Optional[str] = None,
+        location_id: Optional[str] = None,
+        granularity: str = "day",
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        by_location: bool = False
+    ) -> List[dict]:
+        """Bucketed movement totals for a product and/or location.
+
+        When only a product is given, buckets are summed across its locations
+        unless `by_location` is set.
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}")
+        if not product_id and not location_id:
+            raise ValueError("Provide a product_id or a location_id")
+        for id in (product_id, location_id):
+            if id and not ObjectId.is_valid(id):
+                raise ValueError("Invalid product or location ID")
+
+        query = {"granularity": granularity}
+        if product_id:
+            query["product_id"] = ObjectId(product_id)
+        if location_id:
+            query["location_id"] = ObjectId(location_id)
+        if from_date or to_date:
+            query["bucket"] = {}
+            if from_date:
+                query["bucket"]["$gte"] = _bucket_start(from_date, granularity)
+            if to_date:
+                query["bucket"]["$lte"] = to_date
+
+        rollups = await self.rollups_collection.find(
+            query,
+            {"_id": 0}
+        ).sort("bucket", 1).to_list(length=None)
+        if location_id or by_location:
+            return rollups
+
+        combined: Dict[Tuple, dict] = {}
+        for rollup in rollups:
+            key = (rollup["product_id"], rollup["bucket"])
+            total = combined.get(key)
+            if total is None:
+                combined[key] = {**rollup, "location_id": None, "by_type": dict(rollup.get("by_type", {}))}
+                continue
+            for field in ("quantity", "inbound_quantity", "outbound_quantity", "value", "count"):
+                total[field] = total.get(field, 0) + rollup.get(field, 0)
+            for transaction_type, totals in rollup.get("by_type", {}).items():
+                type_total = total["by_type"].setdefault(
+                    transaction_type,
+                    {"quantity": 0, "value": 0, "count": 0}
                 )
+                total["by_type"][transaction_type] = {
+                    field: type_total.get(field, 0) + totals.get(field, 0)
+                    for field in ("quantity", "value", "count")
+                }
+        return list(combined.values())
 
-        return transactions
+    async def rebuild_rollups(self, since: Optional[datetime] = None) -> None:
+        """Recompute movement rollups from both ledger tiers, from the day of `since` onwards.
+
+        Buckets are replaced wholesale, so run it while no movements are
+        being posted for the affected period. Needs MongoDB 5.0 for $dateTrunc.
+        """
+        bucket_filter = {}
+        ledger_filter = {}
+        if since:
+            start = _bucket_start(since, "day")
+            bucket_filter = {"bucket": {"$gte": start}}
+            ledger_filter = {"created_at": {"$gte": start}}
+        await self.rollups_collection.delete_many(bucket_filter)
+
+        archived_before = await self.archive_crud.get_archived_before()
+        tiers = self.archive_crud.split_tiers(ledger_filter, archived_before)
+        for (collection, tier_filter), granularity in [
+            (tier, granularity) for tier in tiers for granularity in ROLLUP_GRANULARITIES
+        ]:
+            pipeline = [
+                {"$match": tier_filter},
+                {
+                    "$group": {
+                        "_id": {
+                            "product_id": "$product_id",
+                            "location_id": "$location_id",
+                            "bucket": {"$dateTrunc": {"date": "$created_at", "unit": granularity}},
+                            "transaction_type": "$transaction_type"
+                        },
+                        "quantity": {"$sum": "$quantity"},
+                        "inbound_quantity": {
+                            "$sum": {"$cond": [{"$gt": ["$quantity", 0]}, "$quantity", 0]}
+                        },
+                        "outbound_quantity": {
+                            "$sum": {"$cond": [{"$lt": ["$quantity", 0]}, {"$abs": "$quantity"}, 0]}
+                        },
+                        "value": {"$sum": "$value"},
+                        "count": {"$sum": 1}
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": {
+                            "product_id": "$_id.product_id",
+                            "location_id": "$_id.location_id",
+                            "bucket": "$_id.bucket"
+                        },
+                        "quantity": {"$sum": "$quantity"},
+                        "inbound_quantity": {"$sum": "$inbound_quantity"},
+                        "outbound_quantity": {"$sum": "$outbound_quantity"},
+                        "value": {"$sum": "$value"},
+                        "count": {"$sum": "$count"},
+                        "by_type": {
+                            "$push": {
+                                "k": "$_id.transaction_type",
+                                "v": {"quantity": "$quantity", "value": "$value", "count": "$count"}
+                            }
+                        }
+                    }
+                },
+                {
+                    "$project": {
+                        "_id": 0,
+                        "product_id": "$_id.product_id",
+                        "location_id": "$_id.location_id",
+                        "granularity": {"$literal": granularity},
+                        "bucket": "$_id.bucket",
+                        "quantity": 1,
+                        "inbound_quantity": 1,
+                        "outbound_quantity": 1,
+                        "value": 1,
+                        "count": 1,
+                        "by_type": {"$arrayToObject": "$by_type"}
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": self.rollups_collection.name,
+                        "on": ["product_id", "location_id", "granularity", "bucket"],
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert"
+                    }
+                }
+            ]
+            # Tiers split on a month boundary, so no bucket spans both
+            async for _ in collection.aggregate(pipeline, allowDiskUse=True):
+                pass
 
     async def get_product_movements(
         self,
@@ -296,8 +1259,20 @@ class InventoryTransactionCRUD:
         from_date: Optional[datetime] = None,
         to_date: Optional[datetime] = None
     ) -> List[dict]:
+        return [
+            movement
+            async for movement in self.iter_product_movements(product_id, from_date, to_date)
+        ]
+
+    async def iter_product_movements(
+        self,
+        product_id: str,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None
+    ) -> AsyncIterator[dict]:
+        """Yield a product's movements oldest first without buffering them."""
         if not ObjectId.is_valid(product_id):
-            return []
+            return
 
         query = {"product_id": ObjectId(product_id)}
         if from_date or to_date:
@@ -307,11 +1282,9 @@ class InventoryTransactionCRUD:
             if to_date:
                 query["created_at"]["$lte"] = to_date
 
-        cursor = self.collection.find(query).sort("created_at", 1)
-        movements = await cursor.to_list(length=None)
-        for movement in movements:
+        async for movement in self._find_movements(query):
             movement["id"] = str(movement.pop("_id"))
-        return movements
+            yield movement
 
     async def get_location_movements(
         self,
@@ -319,24 +1292,64 @@ class InventoryTransactionCRUD:
         from_date: Optional[datetime] = None,
         to_date: Optional[datetime] = None
     ) -> List[dict]:
+        return [
+            movement
+            async for movement in self.iter_location_movements(location_id, from_date, to_date)
+        ]
+
+    async def iter_location_movements(
+        self,
+        location_id: str,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        strategy: str = "merge"
+    ) -> AsyncIterator[dict]:
+        """Yield a location's movements oldest first without buffering them.
+
+        The default "merge" strategy reads rows where the location is the
+        source and rows where it is the destination through two index-backed
+        sorted cursors and merges them by (created_at, _id). The "or"
+        strategy issues the single $or query, which Mongo may have to sort
+        in memory.
+        """
         if not ObjectId.is_valid(location_id):
-            return []
+            return
 
-        query = {
-            "$or": [
-                {"location_id": ObjectId(location_id)},
-                {"to_location_id": ObjectId(location_id)}
-            ]
-        }
+        branches = [
+            {"location_id": ObjectId(location_id)},
+            {"to_location_id": ObjectId(location_id)}
+        ]
+        date_filter = {}
         if from_date or to_date:
-            query["created_at"] = {}
+            date_filter["created_at"] = {}
             if from_date:
-                query["created_at"]["$gte"] = from_date
+                date_filter["created_at"]["$gte"] = from_date
             if to_date:
-                query["created_at"]["$lte"] = to_date
+                date_filter["created_at"]["$lte"] = to_date
+
+        if strategy == "or":
+            movements = self._find_movements({"$or": branches, **date_filter})
+        else:
+            movements = merge_sorted(
+                [self._find_movements({**branch, **date_filter}) for branch in branches],
+                key=lambda movement: (movement["created_at"], movement["_id"])
+            )
 
-        cursor = self.collection.find(query).sort("created_at", 1)
-        movements = await cursor.to_list(length=None)
-        for movement in movements:
+        last_id = None
+        async for movement in movements:
+            # A row can match both branches; merged duplicates are adjacent
+            if movement["_id"] == last_id:
+                continue
+            last_id = movement["_id"]
             movement["id"] = str(movement.pop("_id"))
-        return movements 
\ No newline at end of file
+            yield movement
+
+    async def _find_movements(self, query: dict) -> AsyncIterator[dict]:
+        """Matching rows oldest first, reading the archive tier before the hot one."""
+        archived_before = await self.archive_crud.get_archived_before()
+        for collection, tier_query in self.archive_crud.split_tiers(query, archived_before):
+            cursor = collection.find(tier_query).sort(
+                [("created_at", 1), ("_id", 1)]
+            ).batch_size(settings.MOVEMENT_STREAM_BATCH_SIZE)
+            async for movement in cursor:
+                yield movement
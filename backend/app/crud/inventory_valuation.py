@@ -0,0 +1,472 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, UpdateOne
+from app.core.config import settings
+from app.crud.cursors import merge_sorted
+from app.crud.inventory_archive import InventoryArchiveCRUD
+
+# Rows of the recurrence solved together. The running product of averaging
+# factors rarely underflows within a block; blocks that do are re-solved row by row
+RECURRENCE_BLOCK = 256
+
+def _linear_recurrence(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Solve x[i] = a[i] * x[i - 1] + b[i] with x[-1] = 0.
+
+    Every a[i] is in [0, 1]; a zero restarts the recurrence at b[i]. Each
+    block is solved with a cumulative product and a cumulative sum, with the
+    last value carried into the next block.
+    """
+    x = np.empty_like(b)
+    carry = 0.0
+    for start in range(0, len(a), RECURRENCE_BLOCK):
+        block_a = a[start:start + RECURRENCE_BLOCK]
+        block_b = b[start:start + RECURRENCE_BLOCK]
+        resets = block_a == 0
+        product = np.cumprod(np.where(resets, 1.0, block_a))
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            terms = block_b / product
+            scaled = np.cumsum(terms)
+            # Rows after a reset at r start from b[r]; rows before the first
+            # reset start from the value carried in from the previous block
+            last_reset = np.maximum.accumulate(
+                np.where(resets, np.arange(len(block_a)), -1)
+            )
+            anchor = np.maximum(last_reset, 0)
+            offset = np.where(last_reset >= 0, terms[anchor] - scaled[anchor], carry)
+            block_x = product * (offset + scaled)
+
+        if not np.all(np.isfinite(block_x)):
+            # Extreme ratios underflowed the product; solve this block row by row
+            value = carry
+            for i in range(len(block_a)):
+                value = block_a[i] * value + block_b[i]
+                block_x[i] = value
+        x[start:start + RECURRENCE_BLOCK] = block_x
+        carry = block_x[-1]
+    return x
+
+def _descending(id: ObjectId) -> bytes:
+    """Sort key that orders ObjectIds from highest to lowest."""
+    return bytes(255 - byte for byte in id.binary)
+
+def _replay_order(row: dict) -> tuple:
+    return (_descending(row["product_id"]), _descending(row["location_id"]), row["created_at"], row["_id"])
+
+def _revalue_pair(quantities: np.ndarray, unit_costs: np.ndarray) -> dict:
+    """FIFO and moving-average valuation of one (product, location) ledger.
+
+    `unit_costs` holds the cost of every inbound row; outbound rows are
+    costed by the method being evaluated.
+    """
+    quantity = float(quantities.sum())
+    inbound = quantities > 0
+    inbound_quantities = quantities[inbound]
+    inbound_costs = unit_costs[inbound]
+    if not inbound_quantities.size:
+        return {"quantity": quantity, "fifo_value": 0.0, "average_cost": 0.0,
+                "average_value": 0.0, "layers": []}
+
+    # FIFO: outbound rows consume inbound quantity in receipt order, so the
+    # cost relieved by everything shipped is the cumulative inbound value
+    # interpolated at the cumulative outbound quantity
+    cumulative_in = np.concatenate(([0.0], np.cumsum(inbound_quantities)))
+    cumulative_value = np.concatenate(([0.0], np.cumsum(inbound_quantities * inbound_costs)))
+    shipped = float(-quantities[~inbound].sum())
+    relieved = float(np.interp(shipped, cumulative_in, cumulative_value))
+    if shipped > cumulative_in[-1]:
+        # Shipped beyond receipts: the shortage carries the last receipt cost,
+        # as it does in the incremental layers
+        relieved += (shipped - cumulative_in[-1]) * float(inbound_costs[-1])
+    remaining = np.clip(cumulative_in[1:] - max(shipped, 0.0), 0.0, inbound_quantities)
+    open_layers = remaining > 0
+    layers = [
+        {"quantity": layer_quantity, "unit_cost": unit_cost}
+        for layer_quantity, unit_cost in zip(
+            remaining[open_layers].tolist(),
+            inbound_costs[open_layers].tolist()
+        )
+    ]
+    if shipped > cumulative_in[-1]:
+        layers.append({"quantity": float(cumulative_in[-1] - shipped), "unit_cost": float(inbound_costs[-1])})
+
+    # Moving average: only inbound rows change the average cost. With Q the
+    # on-hand before a receipt of q at cost c, avg = (Q * avg + q * c) / (Q + q),
+    # which restarts at c whenever nothing was on hand
+    on_hand_before = (np.cumsum(quantities) - quantities)[inbound]
+    stocked = on_hand_before > 0
+    after = np.where(stocked, on_hand_before + inbound_quantities, inbound_quantities)
+    a = np.where(stocked, on_hand_before / after, 0.0)
+    b = np.where(stocked, inbound_quantities * inbound_costs / after, inbound_costs)
+    average_cost = float(_linear_recurrence(a, b)[-1])
+
+    return {
+        "quantity": quantity,
+        "fifo_value": float(cumulative_value[-1]) - relieved,
+        "average_cost": average_cost,
+        "average_value": quantity * average_cost,
+        "layers": layers
+    }
+
+class InventoryValuationCRUD:
+    """FIFO and moving-average cost layers per (product, location).
+
+    With COST_LAYERS_ENABLED, layers are maintained incrementally inside
+    the ledger write transaction. Rows posted without a unit_cost are then
+    costed from the layers, which also gives their ledger `value`. Costing
+    a row means reading its pair's layer document and writing it back, so
+    concurrent postings to one pair conflict and retry, and the document
+    grows with the number of open layers. The flag is therefore off by
+    default. A bulk revaluation replays the ledger per pair with NumPy for
+    month-end valuation, and with rebuild_layers it brings the layers up
+    to date before the flag is turned on.
+    """
+    indexes = {
+        "layers_collection": [
+            IndexModel([("product_id", ASCENDING), ("location_id", ASCENDING)], unique=True),
+            IndexModel([("location_id", ASCENDING), ("product_id", ASCENDING)])
+        ],
+        "runs_collection": [
+            IndexModel([("created_at", DESCENDING)])
+        ],
+        "snapshots_collection": [
+            IndexModel([("run_id", ASCENDING), ("product_id", ASCENDING), ("location_id", ASCENDING)])
+        ]
+    }
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.transactions_collection = db.inven_pulse.inventory_transactions
+        self.layers_collection = db.inven_pulse.inventory_cost_layers
+        self.runs_collection = db.inven_pulse.inventory_valuation_runs
+        self.snapshots_collection = db.inven_pulse.inventory_valuation_snapshots
+        self.archive_crud = InventoryArchiveCRUD(db)
+
+    async def apply_transactions(self, transaction_docs: List[dict], session=None) -> None:
+        """Cost a batch of ledger rows against the layers and update the layers.
+
+        Adds `fifo_value` and `average_value` to every row, and fills `value`
+        for rows without a unit_cost using INVENTORY_VALUATION_METHOD.
+        """
+        pairs = {(doc["product_id"], doc["location_id"]) for doc in transaction_docs}
+        products_by_location: Dict[ObjectId, set] = {}
+        for product_id, location_id in pairs:
+            products_by_location.setdefault(location_id, set()).add(product_id)
+
+        states: Dict[Tuple[ObjectId, ObjectId], dict] = {}
+        async for state in self.layers_collection.find(
+            {
+                "$or": [
+                    {"location_id": location_id, "product_id": {"$in": list(product_ids)}}
+                    for location_id, product_ids in products_by_location.items()
+                ]
+            },
+            session=session
+        ):
+            states[(state["product_id"], state["location_id"])] = state
+
+        # Cost relieved by a transfer's source leg, keyed by its destination
+        transfer_costs: Dict[Tuple[ObjectId, ObjectId], float] = {}
+        for transaction_dict in transaction_docs:
+            key = (transaction_dict["product_id"], transaction_dict["location_id"])
+            state = states.setdefault(key, {
+                "product_id": key[0],
+                "location_id": key[1],
+                "quantity": 0.0,
+                "layers": [],
+                "average_cost": 0.0,
+                "last_unit_cost": 0.0
+            })
+            quantity = transaction_dict["quantity"]
+            unit_cost = transaction_dict.get("unit_cost")
+
+            if quantity > 0:
+                if unit_cost is None and transaction_dict["transaction_type"] == "transfer":
+                    unit_cost = transfer_costs.pop(key, None)
+                if unit_cost is None:
+                    unit_cost = state["average_cost"]
+                fifo_value = average_value = quantity * unit_cost
+                self._receive(state, transaction_dict, quantity, unit_cost)
+            else:
+                fifo_value = -self._relieve(state, -quantity)
+                average_value = quantity * state["average_cost"]
+                state["quantity"] += quantity
+                if transaction_dict.get("to_location_id") and quantity < 0:
+                    relieved = fifo_value if settings.INVENTORY_VALUATION_METHOD == "fifo" else average_value
+                    transfer_costs[(key[0], transaction_dict["to_location_id"])] = relieved / quantity
+
+            transaction_dict["fifo_value"] = fifo_value
+            transaction_dict["average_value"] = average_value
+            if transaction_dict.get("unit_cost") is None:
+                transaction_dict["value"] = (
+                    fifo_value if settings.INVENTORY_VALUATION_METHOD == "fifo" else average_value
+                )
+
+        now = datetime.utcnow()
+        await self.layers_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"product_id": product_id, "location_id": location_id},
+                    {"$set": {
+                        "quantity": state["quantity"],
+                        "layers": state["layers"],
+                        "fifo_value": sum(layer["quantity"] * layer["unit_cost"] for layer in state["layers"]),
+                        "average_cost": state["average_cost"],
+                        "average_value": state["quantity"] * state["average_cost"],
+                        "last_unit_cost": state["last_unit_cost"],
+                        "updated_at": now
+                    }},
+                    upsert=True
+                )
+                for (product_id, location_id), state in states.items()
+                if (product_id, location_id) in pairs
+            ],
+            ordered=False,
+            session=session
+        )
+
+    def _receive(self, state: dict, transaction_dict: dict, quantity: float, unit_cost: float) -> None:
+        on_hand = state["quantity"]
+        if on_hand > 0:
+            state["average_cost"] = (on_hand * state["average_cost"] + quantity * unit_cost) / (on_hand + quantity)
+        else:
+            state["average_cost"] = unit_cost
+        state["quantity"] += quantity
+        state["last_unit_cost"] = unit_cost
+
+        layers = state["layers"]
+        # A shortage layer left by shipping beyond receipts is filled first;
+        # whatever is still short carries the latest receipt cost
+        while layers and layers[0]["quantity"] < 0 and quantity > 0:
+            filled = min(quantity, -layers[0]["quantity"])
+            layers[0]["quantity"] += filled
+            layers[0]["unit_cost"] = unit_cost
+            quantity -= filled
+            if layers[0]["quantity"] == 0:
+                layers.pop(0)
+        if quantity > 0:
+            layers.append({
+                "transaction_id": transaction_dict["_id"],
+                "received_at": transaction_dict["created_at"],
+                "quantity": quantity,
+                "unit_cost": unit_cost
+            })
+
+    def _relieve(self, state: dict, quantity: float) -> float:
+        """Consume `quantity` from the oldest layers and return the cost relieved."""
+        layers = state["layers"]
+        relieved = 0.0
+        while quantity > 0 and layers and layers[0]["quantity"] > 0:
+            taken = min(quantity, layers[0]["quantity"])
+            relieved += taken * layers[0]["unit_cost"]
+            layers[0]["quantity"] -= taken
+            quantity -= taken
+            if layers[0]["quantity"] == 0:
+                layers.pop(0)
+        if quantity > 0:
+            # Shipping beyond receipts: carry the shortage at the last receipt cost
+            cost = state["last_unit_cost"]
+            relieved += quantity * cost
+            if layers and layers[-1]["quantity"] < 0:
+                layers[-1]["quantity"] -= quantity
+                layers[-1]["unit_cost"] = cost
+            else:
+                layers.append({"quantity": -quantity, "unit_cost": cost})
+        return relieved
+
+    async def get_layers(self, product_id: str, location_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(product_id) or not ObjectId.is_valid(location_id):
+            return None
+
+        state = await self.layers_collection.find_one({
+            "product_id": ObjectId(product_id),
+            "location_id": ObjectId(location_id)
+        })
+        if state:
+            state["id"] = str(state.pop("_id"))
+            return state
+        return None
+
+    async def create_run(self, as_of: Optional[datetime] = None, rebuild_layers: bool = False) -> dict:
+        if rebuild_layers and as_of:
+            raise ValueError("Cost layers can only be rebuilt from the full ledger")
+
+        run = {
+            "as_of": as_of,
+            "rebuild_layers": rebuild_layers,
+            "status": "pending",
+            "pairs": 0,
+            "rows": 0,
+            "created_at": datetime.utcnow()
+        }
+        result = await self.runs_collection.insert_one(run)
+        run["id"] = str(run.pop("_id", result.inserted_id))
+        return run
+
+    async def get_run(self, run_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(run_id):
+            return None
+
+        run = await self.runs_collection.find_one({"_id": ObjectId(run_id)})
+        if run:
+            run["id"] = str(run.pop("_id"))
+            return run
+        return None
+
+    async def get_snapshots(self, run_id: str, skip: int = 0, limit: int = 100) -> List[dict]:
+        if not ObjectId.is_valid(run_id):
+            return []
+
+        cursor = self.snapshots_collection.find({"run_id": ObjectId(run_id)}).sort(
+            [("product_id", 1), ("location_id", 1)]
+        ).skip(skip).limit(limit)
+        snapshots = await cursor.to_list(length=limit)
+        for snapshot in snapshots:
+            snapshot["id"] = str(snapshot.pop("_id"))
+        return snapshots
+
+    async def revalue(self, run_id: str, batch_size: int = 1000) -> Optional[dict]:
+        """Replay the ledger per (product, location) and store the valuations.
+
+        Both ledger tiers are replayed. Inbound rows without a unit_cost use
+        the value recorded on the row.
+        With `rebuild_layers` the FIFO layers and average costs are replaced
+        by the replayed ones, so run it while nothing is being posted.
+        """
+        run = await self.get_run(run_id)
+        if not run:
+            return None
+
+        run_oid = ObjectId(run_id)
+        started = time.perf_counter()
+        await self.runs_collection.update_one(
+            {"_id": run_oid},
+            {"$set": {"status": "running", "started_at": datetime.utcnow()}}
+        )
+        await self.snapshots_collection.delete_many({"run_id": run_oid})
+
+        try:
+            pairs, rows = await self._replay(run_oid, run, batch_size)
+        except Exception as e:
+            await self.runs_collection.update_one(
+                {"_id": run_oid},
+                {"$set": {"status": "failed", "error": str(e)}}
+            )
+            raise
+
+        await self.runs_collection.update_one(
+            {"_id": run_oid},
+            {"$set": {
+                "status": "completed",
+                "pairs": pairs,
+                "rows": rows,
+                "elapsed_seconds": time.perf_counter() - started,
+                "finished_at": datetime.utcnow()
+            }}
+        )
+        return await self.get_run(run_id)
+
+    async def _replay(self, run_oid: ObjectId, run: dict, batch_size: int) -> Tuple[int, int]:
+        query = {"created_at": {"$lte": run["as_of"]}} if run["as_of"] else {}
+        archived_before = await self.archive_crud.get_archived_before()
+        # Matches the (product_id, location_id, created_at desc, _id desc)
+        # ledger index walked backwards, so the replay needs no sort stage
+        tier_cursors = [
+            collection.find(
+                tier_query,
+                {"product_id": 1, "location_id": 1, "created_at": 1, "quantity": 1, "unit_cost": 1, "value": 1}
+            ).sort([
+                ("product_id", -1),
+                ("location_id", -1),
+                ("created_at", 1),
+                ("_id", 1)
+            ]).batch_size(10000)
+            for collection, tier_query in self.archive_crud.split_tiers(query, archived_before)
+        ]
+        if len(tier_cursors) == 1:
+            cursor = tier_cursors[0]
+        else:
+            # Each pair's archived rows come before its hot rows
+            cursor = merge_sorted(tier_cursors, key=_replay_order)
+
+        pending: List[dict] = []
+        pairs = rows = 0
+        current = None
+        quantities: List[float] = []
+        unit_costs: List[float] = []
+
+        async def flush_pair():
+            nonlocal pairs
+            valuation = _revalue_pair(np.array(quantities, dtype=float), np.array(unit_costs, dtype=float))
+            pending.append({"product_id": current[0], "location_id": current[1], **valuation})
+            pairs += 1
+            if len(pending) >= batch_size:
+                await self._store_revaluation(run_oid, run, pending)
+                pending.clear()
+
+        async for row in cursor:
+            key = (row["product_id"], row["location_id"])
+            if key != current:
+                if current is not None:
+                    await flush_pair()
+                current = key
+                quantities.clear()
+                unit_costs.clear()
+            quantity = row["quantity"]
+            quantities.append(quantity)
+            if row.get("unit_cost") is not None:
+                unit_costs.append(row["unit_cost"])
+            else:
+                unit_costs.append(row.get("value", 0) / quantity if quantity else 0.0)
+            rows += 1
+        if current is not None:
+            await flush_pair()
+        if pending:
+            await self._store_revaluation(run_oid, run, pending)
+        return pairs, rows
+
+    async def _store_revaluation(self, run_oid: ObjectId, run: dict, valuations: List[dict]) -> None:
+        await self.snapshots_collection.insert_many(
+            [
+                {
+                    "run_id": run_oid,
+                    "as_of": run["as_of"],
+                    "product_id": valuation["product_id"],
+                    "location_id": valuation["location_id"],
+                    "quantity": valuation["quantity"],
+                    "fifo_value": valuation["fifo_value"],
+                    "average_cost": valuation["average_cost"],
+                    "average_value": valuation["average_value"]
+                }
+                for valuation in valuations
+            ],
+            ordered=False
+        )
+        if not run["rebuild_layers"]:
+            return
+
+        now = datetime.utcnow()
+        await self.layers_collection.bulk_write(
+            [
+                ReplaceOne(
+                    {"product_id": valuation["product_id"], "location_id": valuation["location_id"]},
+                    {
+                        "product_id": valuation["product_id"],
+                        "location_id": valuation["location_id"],
+                        "quantity": valuation["quantity"],
+                        "layers": valuation["layers"],
+                        "fifo_value": valuation["fifo_value"],
+                        "average_cost": valuation["average_cost"],
+                        "average_value": valuation["average_value"],
+                        "last_unit_cost": valuation["layers"][-1]["unit_cost"] if valuation["layers"] else valuation["average_cost"],
+                        "updated_at": now
+                    },
+                    upsert=True
+                )
+                for valuation in valuations
+            ],
+            ordered=False
+        )
@@ -1,7 +1,20 @@
-from typing import List, Optional, Dict
-from datetime import datetime
+import asyncio
+from typing import FrozenSet, List, Optional, Dict
+from collections import defaultdict
+from datetime import datetime, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.core.config import settings
+from app.crud.notification_preferences import (
+    NOTIFICATION_PRIORITIES,
+    PREFERENCES_STATE_ID,
+    preference_index
+)
+from app.crud.notification_stream import notification_hub
+from app.crud.pagination import KEYSET_SORT, apply_cursor
+from app.crud.references import ReferenceLoader
 from app.models.notification import (
     NotificationCreate,
     NotificationUpdate,
@@ -11,64 +24,542 @@ from app.models.notification import (
     NotificationStats
 )
 
+# Notification IDs echoed back by a bulk fan-out
+FANOUT_SAMPLE_IDS = 10
+
+# Fields the per-user counters are derived from
+COUNTER_FIELDS = {"recipient_id": 1, "priority": 1, "type": 1, "is_read": 1}
+
+# Collection holding the entity each reference_type points at
+REFERENCE_COLLECTIONS = {
+    "product": "products",
+    "purchase_order": "purchase_orders",
+    "sales_order": "sales_orders",
+    "inventory": "inventory_transactions",
+    "system": None
+}
+
+# The only user fields loaded for recipient details, so credentials such
+# as password and salt are never read into the shared reference cache
+RECIPIENT_DETAIL_FIELDS = {"username": 1, "email": 1, "full_name": 1, "role": 1}
+
+# Queued entries listed in a digest's metadata; the rest are only counted
+DIGEST_ITEMS = 20
+# Entries claimed by a flush that has not finished after this long are
+# assumed orphaned by a crashed worker and flushed again
+DIGEST_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+def _is_duplicate_key(error: Exception) -> bool:
+    if isinstance(error, BulkWriteError):
+        return all(write_error["code"] == 11000 for write_error in error.details["writeErrors"])
+    return getattr(error, "code", None) == 11000
+
 class NotificationCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([
+                ("recipient_id", ASCENDING),
+                ("is_archived", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("recipient_id", ASCENDING),
+                ("is_read", ASCENDING),
+                ("type", ASCENDING)
+            ]),
+            IndexModel([
+                ("is_archived", ASCENDING),
+                ("is_read", ASCENDING),
+                ("created_at", ASCENDING)
+            ]),
+            # Generated alerts carry a dedupe_key so a repeated scan cannot
+            # notify the same recipient twice about the same event
+            IndexModel(
+                [("recipient_id", ASCENDING), ("dedupe_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"dedupe_key": {"$exists": True}}
+            ),
+            # At most one open notification per recipient and coalesce_key,
+            # so concurrent repeats cannot each upsert their own. Reading,
+            # archiving or outliving the window drops the key.
+            IndexModel(
+                [("recipient_id", ASCENDING), ("coalesce_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={
+                    "coalesce_key": {"$exists": True},
+                    "is_read": False,
+                    "is_archived": False
+                }
+            )
+        ],
+        "digest_queue_collection": [
+            IndexModel([
+                ("recipient_id", ASCENDING),
+                ("type", ASCENDING),
+                ("reference_id", ASCENDING),
+                ("flush_id", ASCENDING)
+            ]),
+            IndexModel([("flush_id", ASCENDING), ("claimed_at", ASCENDING)])
+        ],
+        "preferences_collection": [
+            IndexModel([("user_id", ASCENDING)], unique=True)
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.inven_pulse.notifications
         self.preferences_collection = db.inven_pulse.notification_preferences
         self.templates_collection = db.inven_pulse.notification_templates
+        self.preferences_state_collection = db.inven_pulse.notification_preferences_state
+        self.digest_queue_collection = db.inven_pulse.notification_digest_queue
+        # One document per recipient (_id = user ID) holding the totals
+        # behind /notifications/me/stats, kept current with $inc in the
+        # same transaction as the notifications they count
+        self.counters_collection = db.inven_pulse.notification_counters
+
+    async def _excluded_recipients(self, type: str, priority: str) -> FrozenSet[ObjectId]:
+        """Users whose preferences exclude notifications of this type and priority."""
+        return await preference_index.excluded(
+            self.preferences_collection,
+            self.preferences_state_collection,
+            type,
+            priority
+        )
+
+    async def _in_transaction(self, write):
+        """Run `write(session)` in a transaction, retrying transient errors."""
+        async with await self.db.start_session() as session:
+            return await session.with_transaction(write)
 
     async def create(self, notification: NotificationCreate) -> List[dict]:
-        """Create notifications for multiple recipients."""
-        notifications = []
-        created_at = datetime.utcnow()
+        """Create notifications for the recipients who have not opted out.
+
+        Types in NOTIFICATION_DIGEST_TYPES are queued for the next digest
+        and nothing is returned for them. Repeats of a coalesced type about
+        the same reference within NOTIFICATION_COALESCE_WINDOW update the
+        recipient's unread notification instead of adding another.
+        """
+        template = notification.dict(exclude={"recipient_ids"})
+        template["created_at"] = datetime.utcnow()
+        excluded = await self._excluded_recipients(notification.type, notification.priority)
+        recipient_ids = [
+            recipient_id
+            for recipient_id in notification.recipient_ids
+            if recipient_id not in excluded
+        ]
+        if not recipient_ids:
+            return []
+
+        if notification.type in settings.NOTIFICATION_DIGEST_TYPES:
+            await self._queue_for_digest(template, recipient_ids)
+            return []
+        if (
+            settings.NOTIFICATION_COALESCE_WINDOW
+            and notification.reference_id
+            and notification.type in settings.NOTIFICATION_COALESCE_TYPES
+        ):
+            return await self._coalesce(template, recipient_ids)
+
+        notifications = [
+            {**template, "recipient_id": recipient_id}
+            for recipient_id in recipient_ids
+        ]
+
+        chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+        for start in range(0, len(notifications), chunk_size):
+            chunk = notifications[start:start + chunk_size]
+
+            async def write(session):
+                # insert_many assigns each document its _id in place
+                await self.collection.insert_many(chunk, ordered=False, session=session)
+                await self.apply_counter_updates(chunk, session=session)
 
-        # Create a notification for each recipient
-        for recipient_id in notification.recipient_ids:
-            notification_dict = notification.dict(exclude={"recipient_ids"})
-            notification_dict["recipient_id"] = recipient_id
-            notification_dict["created_at"] = created_at
+            await self._in_transaction(write)
+        notification_hub.publish_many(notifications)
+        for notification_dict in notifications:
+            notification_dict["id"] = str(notification_dict.pop("_id"))
 
-            result = await self.collection.insert_one(notification_dict)
-            notification_dict["id"] = str(result.inserted_id)
-            notifications.append(notification_dict)
+        return notifications
 
+    async def _coalesce(self, template: dict, recipient_ids: List[ObjectId]) -> List[dict]:
+        """Merge a notification into each recipient's open one about the same reference."""
+        now = template["created_at"]
+        coalesce_key = f"{template['type']}:{template['reference_id']}"
+        open_notification = {
+            "coalesce_key": coalesce_key,
+            "coalesce_until": {"$gt": now},
+            "is_read": False,
+            "is_archived": False
+        }
+        # Fields that identify the open notification are filled in by the
+        # filter on insert, and the priority stays fixed so the per-user
+        # priority counters remain exact
+        inserted_fields = {
+            key: value for key, value in template.items()
+            if key not in ("title", "message", "metadata", "is_read", "is_archived")
+        }
+        inserted_fields["coalesce_until"] = now + timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW)
+
+        chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+        for start in range(0, len(recipient_ids), chunk_size):
+            chunk = recipient_ids[start:start + chunk_size]
+
+            async def write(session):
+                # Close the recipients' windows that have run out, which
+                # frees the unique key for a new open notification
+                await self.collection.update_many(
+                    {
+                        "recipient_id": {"$in": chunk},
+                        "coalesce_key": coalesce_key,
+                        "is_read": False,
+                        "is_archived": False,
+                        "coalesce_until": {"$lte": now}
+                    },
+                    {"$unset": {"coalesce_key": ""}},
+                    session=session
+                )
+                result = await self.collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {"recipient_id": recipient_id, **open_notification},
+                            {
+                                "$setOnInsert": inserted_fields,
+                                "$set": {
+                                    "title": template["title"],
+                                    "message": template["message"],
+                                    "metadata": template["metadata"],
+                                    "last_occurred_at": now
+                                },
+                                "$inc": {"occurrence_count": 1}
+                            },
+                            upsert=True
+                        )
+                        for recipient_id in chunk
+                    ],
+                    ordered=False,
+                    session=session
+                )
+                await self.apply_counter_updates(
+                    [
+                        {**template, "recipient_id": chunk[index], "is_read": False}
+                        for index in result.upserted_ids
+                    ],
+                    session=session
+                )
+
+            while True:
+                try:
+                    await self._in_transaction(write)
+                    break
+                except (BulkWriteError, DuplicateKeyError) as e:
+                    # Another worker opened the notification first; the
+                    # retry updates it instead
+                    if not _is_duplicate_key(e):
+                        raise
+
+        notifications = await self.collection.find({
+            "recipient_id": {"$in": recipient_ids},
+            **open_notification
+        }).to_list(length=None)
+        notification_hub.publish_many(notifications)
+        for notification_dict in notifications:
+            notification_dict["id"] = str(notification_dict.pop("_id"))
         return notifications
 
+    async def _queue_for_digest(self, template: dict, recipient_ids: List[ObjectId]) -> None:
+        """Add a notification to each recipient's pending digest entry for its reference."""
+        now = template["created_at"]
+        chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+        for start in range(0, len(recipient_ids), chunk_size):
+            await self.digest_queue_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {
+                            "recipient_id": recipient_id,
+                            "type": template["type"],
+                            "reference_id": template["reference_id"],
+                            "flush_id": None
+                        },
+                        {
+                            "$set": {
+                                "reference_type": template["reference_type"],
+                                "title": template["title"],
+                                "message": template["message"]
+                            },
+                            "$inc": {"count": 1},
+                            "$max": {
+                                "priority_rank": NOTIFICATION_PRIORITIES.index(template["priority"]),
+                                "last_at": now
+                            },
+                            "$min": {"first_at": now}
+                        },
+                        upsert=True
+                    )
+                    for recipient_id in recipient_ids[start:start + chunk_size]
+                ],
+                ordered=False
+            )
+
+    async def flush_digests(self) -> dict:
+        """Turn every queued entry into one digest notification per (recipient, type).
+
+        Entries are first claimed with a flush_id, so notifications queued
+        during the flush wait for the next one and concurrent flushes in
+        other workers take disjoint entries. Digests carry a dedupe_key
+        derived from the flush_id, so the entries of a flush that died
+        before removing them are flushed again without duplicates.
+        """
+        now = datetime.utcnow()
+        flush_ids = [ObjectId()]
+        await self.digest_queue_collection.update_many(
+            {"flush_id": None},
+            {"$set": {"flush_id": flush_ids[0], "claimed_at": now}}
+        )
+        for stale_flush_id in await self.digest_queue_collection.distinct(
+            "flush_id",
+            {"claimed_at": {"$lt": now - DIGEST_CLAIM_TIMEOUT}}
+        ):
+            taken_over = await self.digest_queue_collection.update_many(
+                {"flush_id": stale_flush_id, "claimed_at": {"$lt": now - DIGEST_CLAIM_TIMEOUT}},
+                {"$set": {"claimed_at": now}}
+            )
+            if taken_over.modified_count:
+                flush_ids.append(stale_flush_id)
+
+        pipeline = [
+            {"$match": {"flush_id": {"$in": flush_ids}}},
+            {"$sort": {"last_at": -1}},
+            {
+                "$group": {
+                    "_id": {
+                        "flush_id": "$flush_id",
+                        "recipient_id": "$recipient_id",
+                        "type": "$type"
+                    },
+                    "count": {"$sum": "$count"},
+                    "priority_rank": {"$max": "$priority_rank"},
+                    "items": {
+                        "$push": {
+                            "reference_type": "$reference_type",
+                            "reference_id": "$reference_id",
+                            "title": "$title",
+                            "count": "$count"
+                        }
+                    }
+                }
+            },
+            {
+                "$project": {
+                    "count": 1,
+                    "priority_rank": 1,
+                    "references": {"$size": "$items"},
+                    "items": {"$slice": ["$items", DIGEST_ITEMS]}
+                }
+            }
+        ]
+
+        chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+        digests = created = 0
+        chunk = []
+        async for group in self.digest_queue_collection.aggregate(pipeline, allowDiskUse=True):
+            chunk.append(self._build_digest(group, now))
+            if len(chunk) == chunk_size:
+                created += await self.insert_deduplicated(chunk)
+                digests += len(chunk)
+                chunk = []
+        if chunk:
+            created += await self.insert_deduplicated(chunk)
+            digests += len(chunk)
+
+        await self.digest_queue_collection.delete_many({"flush_id": {"$in": flush_ids}})
+        return {"digests": digests, "notifications_created": created}
+
+    def _build_digest(self, group: dict, created_at: datetime) -> dict:
+        type = group["_id"]["type"]
+        label = type.replace("_", " ")
+        lines = [
+            f"{item['title']} (x{item['count']})" if item["count"] > 1 else item["title"]
+            for item in group["items"]
+        ]
+        if group["references"] > len(group["items"]):
+            lines.append(f"and {group['references'] - len(group['items'])} more")
+        return {
+            "type": type,
+            "priority": NOTIFICATION_PRIORITIES[group["priority_rank"]],
+            "title": f"{group['count']} {label} notifications",
+            "message": "; ".join(lines),
+            "reference_type": None,
+            "reference_id": None,
+            "metadata": {
+                "digest": True,
+                "references": group["references"],
+                "items": [
+                    {**item, "reference_id": str(item["reference_id"]) if item["reference_id"] else None}
+                    for item in group["items"]
+                ]
+            },
+            "is_read": False,
+            "is_archived": False,
+            "recipient_id": group["_id"]["recipient_id"],
+            "created_at": created_at,
+            "dedupe_key": f"digest:{group['_id']['flush_id']}:{type}"
+        }
+
+    async def run_digests_periodically(self, interval: float) -> None:
+        """Flush digests every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                result = await self.flush_digests()
+                if result["digests"]:
+                    print(f"Flushed {result['digests']} notification digests")
+            except Exception as e:
+                print(f"Digest flush failed: {e}")
+
     async def create_bulk(
         self,
         notification: BulkNotificationCreate,
         user_filter: Optional[Dict] = None
-    ) -> List[dict]:
-        """Create notifications for users matching the filter criteria."""
-        # Get users matching the filter
-        users_collection = self.db.inven_pulse.users
+    ) -> dict:
+        """Create notifications for users matching the filter criteria.
+
+        Recipient IDs are streamed from the users cursor and written a chunk
+        at a time, so a broadcast never holds every recipient in memory.
+        Recipients whose preferences exclude the notification are skipped.
+        """
         filter_query = {
             **notification.recipient_filter,
             **(user_filter or {})
         }
-        
-        users = await users_collection.find(
+        template = notification.dict(exclude={"recipient_filter"})
+        template.update({
+            "is_read": False,
+            "is_archived": False,
+            "created_at": datetime.utcnow()
+        })
+
+        chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+        users = self.db.inven_pulse.users.find(
             filter_query,
             {"_id": 1}  # Only get user IDs
-        ).to_list(length=None)
+        ).batch_size(chunk_size)
+
+        excluded = await self._excluded_recipients(notification.type, notification.priority)
+        count = skipped = 0
+        first_ids = []
+        chunk = []
+        async for user in users:
+            if user["_id"] in excluded:
+                skipped += 1
+                continue
+            chunk.append({**template, "recipient_id": user["_id"]})
+            if len(chunk) == chunk_size:
+                count += await self._insert_chunk(chunk, first_ids)
+                chunk = []
+        if chunk:
+            count += await self._insert_chunk(chunk, first_ids)
+
+        return {"count": count, "first_ids": first_ids, "skipped": skipped}
+
+    async def _insert_chunk(self, notification_docs: List[dict], first_ids: List[str]) -> int:
+        async def write(session):
+            result = await self.collection.insert_many(notification_docs, ordered=False, session=session)
+            await self.apply_counter_updates(notification_docs, session=session)
+            return result
 
-        if not users:
-            return []
+        result = await self._in_transaction(write)
+        notification_hub.publish_many(notification_docs)
+        if len(first_ids) < FANOUT_SAMPLE_IDS:
+            first_ids.extend(
+                str(inserted_id)
+                for inserted_id in result.inserted_ids[:FANOUT_SAMPLE_IDS - len(first_ids)]
+            )
+        return len(result.inserted_ids)
+
+    async def insert_deduplicated(self, notification_docs: List[dict]) -> int:
+        """Insert prepared notifications, skipping any whose dedupe_key already exists.
+
+        Notifications their recipient has opted out of are dropped first.
+        """
+        exclusions = {}
+        for notification_dict in notification_docs:
+            key = (notification_dict["type"], notification_dict["priority"])
+            if key not in exclusions:
+                exclusions[key] = await self._excluded_recipients(*key)
+        notification_docs = [
+            notification_dict
+            for notification_dict in notification_docs
+            if notification_dict["recipient_id"] not in exclusions[
+                (notification_dict["type"], notification_dict["priority"])
+            ]
+        ]
+        if not notification_docs:
+            return 0
 
-        # Create notification for matched users
-        notification_create = NotificationCreate(
-            type=notification.type,
-            priority=notification.priority,
-            title=notification.title,
-            message=notification.message,
-            reference_type=notification.reference_type,
-            reference_id=notification.reference_id,
-            metadata=notification.metadata,
-            recipient_ids=[user["_id"] for user in users]
-        )
+        # A duplicate key aborts the whole transaction, so existing keys are
+        # looked up and left out first
+        async def write(session):
+            existing = set()
+            async for notification in self.collection.find(
+                {
+                    "recipient_id": {"$in": list({doc["recipient_id"] for doc in notification_docs})},
+                    "dedupe_key": {"$in": list({doc["dedupe_key"] for doc in notification_docs})}
+                },
+                {"recipient_id": 1, "dedupe_key": 1},
+                session=session
+            ):
+                existing.add((notification["recipient_id"], notification["dedupe_key"]))
+
+            inserted = []
+            for notification_dict in notification_docs:
+                key = (notification_dict["recipient_id"], notification_dict["dedupe_key"])
+                if key not in existing:
+                    existing.add(key)
+                    inserted.append(notification_dict)
+            if inserted:
+                await self.collection.insert_many(inserted, ordered=False, session=session)
+                await self.apply_counter_updates(inserted, session=session)
+            return inserted
+
+        while True:
+            try:
+                inserted = await self._in_transaction(write)
+                break
+            except (BulkWriteError, DuplicateKeyError) as e:
+                # Inserted concurrently after the lookup; the retry sees it
+                if not _is_duplicate_key(e):
+                    raise
+
+        notification_hub.publish_many(inserted)
+        return len(inserted)
+
+    def _counter_updates(self, notification_docs: List[dict], sign: int = 1) -> List[UpdateOne]:
+        """$inc upserts adding (or with sign=-1, removing) notifications from their recipients' counters."""
+        increments: Dict[ObjectId, Dict[str, int]] = {}
+        for notification_dict in notification_docs:
+            inc = increments.setdefault(notification_dict["recipient_id"], defaultdict(int))
+            inc["total_count"] += sign
+            if not notification_dict.get("is_read"):
+                inc["unread_count"] += sign
+            inc[f"priority_counts.{notification_dict['priority']}"] += sign
+            inc[f"type_counts.{notification_dict['type']}"] += sign
+
+        now = datetime.utcnow()
+        return [
+            UpdateOne(
+                {"_id": recipient_id},
+                {"$inc": dict(inc), "$set": {"updated_at": now}},
+                upsert=True
+            )
+            for recipient_id, inc in increments.items()
+        ]
 
-        return await self.create(notification_create)
+    async def apply_counter_updates(self, notification_docs: List[dict], sign: int = 1, session=None) -> None:
+        updates = self._counter_updates(notification_docs, sign)
+        if updates:
+            await self.counters_collection.bulk_write(updates, ordered=False, session=session)
 
     async def get(self, notification_id: str) -> Optional[dict]:
         """Get a single notification by ID."""
@@ -134,7 +625,9 @@ class NotificationCRUD:
         type: Optional[str] = None,
         priority: Optional[str] = None,
         from_date: Optional[datetime] = None,
-        to_date: Optional[datetime] = None
+        to_date: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        with_details: bool = False
     ) -> List[dict]:
         """Get notifications for a specific user with filtering."""
         if not ObjectId.is_valid(user_id):
@@ -156,15 +649,57 @@ class NotificationCRUD:
             if to_date:
                 query["created_at"]["$lte"] = to_date
 
-        cursor = self.collection.find(query).sort(
-            "created_at", -1
-        ).skip(skip).limit(limit)
-        
-        notifications = await cursor.to_list(length=limit)
+        query = apply_cursor(query, cursor)
+        notifications = await self.collection.find(query).sort(
+            KEYSET_SORT
+        ).skip(skip).limit(limit).to_list(length=limit)
         for notification in notifications:
             notification["id"] = str(notification.pop("_id"))
+        if with_details:
+            await self.attach_details(notifications)
         return notifications
 
+    async def attach_details(
+        self,
+        notifications: List[dict],
+        loader: Optional[ReferenceLoader] = None
+    ) -> None:
+        """Add recipient and referenced entity documents to a page of notifications.
+
+        Resolves the same details as get_with_details, but with one $in
+        query per reference_type and one for the recipients of the whole
+        page instead of two round trips per notification.
+        """
+        loader = loader or ReferenceLoader(self.db.inven_pulse)
+        reference_ids: Dict[str, set] = {}
+        for notification in notifications:
+            if notification.get("reference_id") and REFERENCE_COLLECTIONS.get(notification.get("reference_type")):
+                reference_ids.setdefault(notification["reference_type"], set()).add(notification["reference_id"])
+
+        references = {
+            reference_type: await loader.load_many(REFERENCE_COLLECTIONS[reference_type], ids)
+            for reference_type, ids in reference_ids.items()
+        }
+        recipients = await loader.load_many(
+            "users",
+            (notification["recipient_id"] for notification in notifications),
+            projection=RECIPIENT_DETAIL_FIELDS
+        )
+
+        for notification in notifications:
+            recipient = recipients.get(notification["recipient_id"])
+            if recipient:
+                notification["recipient_details"] = self._public_document(recipient)
+            reference = references.get(notification.get("reference_type"), {}).get(notification.get("reference_id"))
+            if reference:
+                notification["reference_details"] = self._public_document(reference)
+
+    def _public_document(self, document: dict) -> dict:
+        """Copy of a shared cached document with `id` in place of `_id`."""
+        public = {key: value for key, value in document.items() if key != "_id"}
+        public["id"] = str(document["_id"])
+        return public
+
     async def update(
         self,
         notification_id: str,
@@ -185,20 +720,45 @@ class NotificationCRUD:
             update_data["read_at"] = now
         if "is_archived" in update_data and update_data["is_archived"]:
             update_data["archived_at"] = now
+        changes = {"$set": update_data}
+        # A read or archived notification no longer takes coalesced repeats,
+        # and keeping its key would clash with the next open one if it were
+        # marked unread again
+        if update_data.get("is_read") or update_data.get("is_archived"):
+            changes["$unset"] = {"coalesce_key": ""}
+
+        # The pre-image tells whether is_read actually changed, so the
+        # unread counter moves once however often the update is repeated
+        async def write(session):
+            before = await self.collection.find_one_and_update(
+                {
+                    "_id": ObjectId(notification_id),
+                    "recipient_id": ObjectId(user_id)
+                },
+                changes,
+                session=session
+            )
+            if before and "is_read" in update_data and update_data["is_read"] != before.get("is_read", False):
+                await self.counters_collection.update_one(
+                    {"_id": before["recipient_id"]},
+                    {
+                        "$inc": {"unread_count": -1 if update_data["is_read"] else 1},
+                        "$set": {"updated_at": now}
+                    },
+                    upsert=True,
+                    session=session
+                )
+            return before
 
-        result = await self.collection.find_one_and_update(
-            {
-                "_id": ObjectId(notification_id),
-                "recipient_id": ObjectId(user_id)
-            },
-            {"$set": update_data},
-            return_document=True
-        )
+        before = await self._in_transaction(write)
+        if not before:
+            return None
 
-        if result:
-            result["id"] = str(result.pop("_id"))
-            return result
-        return None
+        result = {**before, **update_data}
+        if "$unset" in changes:
+            result.pop("coalesce_key", None)
+        result["id"] = str(result.pop("_id"))
+        return result
 
     async def mark_all_read(
         self,
@@ -216,35 +776,35 @@ class NotificationCRUD:
         if notification_type:
             query["type"] = notification_type
 
-        update_result = await self.collection.update_many(
-            query,
-            {
-                "$set": {
-                    "is_read": True,
-                    "read_at": datetime.utcnow()
-                }
-            }
-        )
+        now = datetime.utcnow()
 
-        return update_result.modified_count
+        async def write(session):
+            update_result = await self.collection.update_many(
+                query,
+                {
+                    "$set": {
+                        "is_read": True,
+                        "read_at": now
+                    },
+                    "$unset": {"coalesce_key": ""}
+                },
+                session=session
+            )
 
-    async def delete_old_notifications(
-        self,
-        days: int = 30,
-        exclude_unread: bool = True
-    ) -> int:
-        """Delete old notifications that are archived or read."""
-        cutoff_date = datetime.utcnow() - datetime.timedelta(days=days)
-        
-        query = {
-            "created_at": {"$lt": cutoff_date},
-            "is_archived": True
-        }
-        if exclude_unread:
-            query["is_read"] = True
+            # Only unread notifications match, so every modified one was unread
+            if update_result.modified_count:
+                await self.counters_collection.update_one(
+                    {"_id": ObjectId(user_id)},
+                    {
+                        "$inc": {"unread_count": -update_result.modified_count},
+                        "$set": {"updated_at": now}
+                    },
+                    upsert=True,
+                    session=session
+                )
+            return update_result.modified_count
 
-        result = await self.collection.delete_many(query)
-        return result.deleted_count
+        return await self._in_transaction(write)
 
     async def get_user_preferences(
         self,
@@ -282,6 +842,15 @@ class NotificationCRUD:
             return_document=True
         )
 
+        # Tell every worker's preference index to rebuild; this worker
+        # rebuilds on its next dispatch
+        await self.preferences_state_collection.update_one(
+            {"_id": PREFERENCES_STATE_ID},
+            {"$inc": {"version": 1}},
+            upsert=True
+        )
+        preference_index.invalidate()
+
         if result:
             result["id"] = str(result.pop("_id"))
             return result
@@ -293,62 +862,129 @@ class NotificationCRUD:
         from_date: Optional[datetime] = None,
         to_date: Optional[datetime] = None
     ) -> NotificationStats:
-        """Get notification statistics for a user."""
-        match_stage = {"recipient_id": ObjectId(user_id)}
-        if from_date or to_date:
-            match_stage["created_at"] = {}
-            if from_date:
-                match_stage["created_at"]["$gte"] = from_date
-            if to_date:
-                match_stage["created_at"]["$lte"] = to_date
+        """Get notification statistics for a user.
+
+        All-time stats are read from the user's counter document; a date
+        range has to be aggregated from the notifications themselves.
+        """
+        if not ObjectId.is_valid(user_id):
+            return NotificationStats()
+
+        if not from_date and not to_date:
+            counters = await self.counters_collection.find_one({"_id": ObjectId(user_id)})
+            return self._stats_from_counters(counters or {})
+
+        match_stage = {"recipient_id": ObjectId(user_id), "created_at": {}}
+        if from_date:
+            match_stage["created_at"]["$gte"] = from_date
+        if to_date:
+            match_stage["created_at"]["$lte"] = to_date
 
         pipeline = [
             {"$match": match_stage},
+            *self._counter_stages()
+        ]
+        result = await self.collection.aggregate(pipeline).to_list(None)
+        return self._stats_from_counters(self._fold_counter_groups(result))
+
+    def _stats_from_counters(self, counters: dict) -> NotificationStats:
+        stats = NotificationStats(
+            total_count=counters.get("total_count", 0),
+            unread_count=counters.get("unread_count", 0)
+        )
+        stats.priority_counts.update(counters.get("priority_counts", {}))
+        stats.type_counts.update(counters.get("type_counts", {}))
+        return stats
+
+    def _counter_stages(self) -> List[dict]:
+        """Group notifications into (recipient, priority, type) counts."""
+        return [
             {
                 "$group": {
-                    "_id": None,
+                    "_id": {
+                        "recipient_id": "$recipient_id",
+                        "priority": "$priority",
+                        "type": "$type"
+                    },
                     "total_count": {"$sum": 1},
                     "unread_count": {
                         "$sum": {"$cond": [{"$eq": ["$is_read", False]}, 1, 0]}
-                    },
-                    "priority_counts": {
-                        "$push": "$priority"
-                    },
-                    "type_counts": {
-                        "$push": "$type"
                     }
                 }
-            }
+            },
+            {"$sort": {"_id.recipient_id": 1}}
         ]
 
-        result = await self.collection.aggregate(pipeline).to_list(1)
-        if not result:
-            return NotificationStats()
-
-        stats = result[0]
-        
-        # Calculate priority counts
-        priority_counts = {"low": 0, "medium": 0, "high": 0, "critical": 0}
-        for priority in stats["priority_counts"]:
-            priority_counts[priority] = priority_counts.get(priority, 0) + 1
-
-        # Calculate type counts
-        type_counts = {
-            "low_stock": 0,
-            "order_status": 0,
-            "price_change": 0,
-            "expiry": 0,
-            "system": 0
+    def _fold_counter_groups(self, groups: List[dict]) -> dict:
+        """Combine one recipient's (priority, type) groups into a counter document."""
+        counters = {
+            "total_count": 0,
+            "unread_count": 0,
+            "priority_counts": defaultdict(int),
+            "type_counts": defaultdict(int)
         }
-        for type_ in stats["type_counts"]:
-            type_counts[type_] = type_counts.get(type_, 0) + 1
-
-        return NotificationStats(
-            total_count=stats["total_count"],
-            unread_count=stats["unread_count"],
-            priority_counts=priority_counts,
-            type_counts=type_counts
-        )
+        for group in groups:
+            counters["total_count"] += group["total_count"]
+            counters["unread_count"] += group["unread_count"]
+            counters["priority_counts"][group["_id"]["priority"]] += group["total_count"]
+            counters["type_counts"][group["_id"]["type"]] += group["total_count"]
+        counters["priority_counts"] = dict(counters["priority_counts"])
+        counters["type_counts"] = dict(counters["type_counts"])
+        return counters
+
+    async def rebuild_counters(self, user_id: Optional[str] = None, batch_size: int = 1000) -> int:
+        """Recompute counter documents from the notifications.
+
+        Used to backfill counters for notifications created before they
+        existed, or to repair drift. Without a user ID every counter is
+        rebuilt and counters of users with no notifications are removed.
+        Returns the number of counter documents written.
+        """
+        match = {}
+        if user_id:
+            if not ObjectId.is_valid(user_id):
+                return 0
+            match["recipient_id"] = ObjectId(user_id)
+
+        rebuilt_at = datetime.utcnow()
+        written = 0
+        replacements = []
+        recipient_id, groups = None, []
+
+        async def flush():
+            nonlocal replacements, written
+            if replacements:
+                await self.counters_collection.bulk_write(replacements, ordered=False)
+                written += len(replacements)
+                replacements = []
+
+        def replacement(recipient_id: ObjectId, groups: List[dict]) -> ReplaceOne:
+            return ReplaceOne(
+                {"_id": recipient_id},
+                {**self._fold_counter_groups(groups), "updated_at": rebuilt_at},
+                upsert=True
+            )
+
+        pipeline = [{"$match": match}, *self._counter_stages()]
+        async for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            if groups and group["_id"]["recipient_id"] != recipient_id:
+                replacements.append(replacement(recipient_id, groups))
+                groups = []
+                if len(replacements) == batch_size:
+                    await flush()
+            recipient_id = group["_id"]["recipient_id"]
+            groups.append(group)
+        if groups:
+            replacements.append(replacement(recipient_id, groups))
+        await flush()
+
+        # Counters neither rebuilt nor incremented since the rebuild started
+        # belong to users who no longer have any notifications
+        stale = {"updated_at": {"$lt": rebuilt_at}}
+        if user_id:
+            stale["_id"] = ObjectId(user_id)
+        await self.counters_collection.delete_many(stale)
+        return written
 
     async def _get_reference_details(
         self,
@@ -356,18 +992,10 @@ class NotificationCRUD:
         reference_id: ObjectId
     ) -> Optional[dict]:
         """Get details of the referenced entity."""
-        collection_map = {
-            "product": "products",
-            "purchase_order": "purchase_orders",
-            "sales_order": "sales_orders",
-            "inventory": "inventory_transactions",
-            "system": None
-        }
-
-        if reference_type not in collection_map or not collection_map[reference_type]:
+        if not REFERENCE_COLLECTIONS.get(reference_type):
             return None
 
-        collection = self.db.inven_pulse[collection_map[reference_type]]
+        collection = self.db.inven_pulse[REFERENCE_COLLECTIONS[reference_type]]
         reference = await collection.find_one({"_id": reference_id})
         
         if reference:
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from app.core.config import settings
+
+NOTIFICATION_TYPES = ("low_stock", "order_status", "price_change", "expiry", "system")
+NOTIFICATION_PRIORITIES = ("low", "medium", "high", "critical")
+
+# _id of the document whose version is bumped on every preference change
+PREFERENCES_STATE_ID = "notification_preferences"
+
+class NotificationPreferenceIndex:
+    """Per-worker index of the users each (type, priority) must not be sent.
+
+    Users without preferences receive everything, so the index holds the
+    opted-out side: one set per (type, priority) of users who disabled the
+    type or set a higher minimum_priority. It is rebuilt when the shared
+    version document changes, which is checked at most every
+    `check_interval` seconds, so a change made through another worker is
+    honoured within that interval.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._excluded: Dict[Tuple[str, str], FrozenSet[ObjectId]] = {}
+        self._version: Optional[int] = None
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def excluded(
+        self,
+        preferences_collection: AsyncIOMotorCollection,
+        state_collection: AsyncIOMotorCollection,
+        type: str,
+        priority: str
+    ) -> FrozenSet[ObjectId]:
+        """Users who opted out of notifications of this type and priority."""
+        if self._is_stale():
+            async with self._lock:
+                if self._is_stale():
+                    await self._refresh(preferences_collection, state_collection)
+        return self._excluded.get((type, priority), frozenset())
+
+    def invalidate(self) -> None:
+        """Force a rebuild before the next lookup."""
+        self._version = None
+        self._checked_at = None
+
+    def _is_stale(self) -> bool:
+        return (
+            self._checked_at is None
+            or time.monotonic() - self._checked_at >= self.check_interval
+        )
+
+    async def _refresh(
+        self,
+        preferences_collection: AsyncIOMotorCollection,
+        state_collection: AsyncIOMotorCollection
+    ) -> None:
+        # Read the version before the preferences, so a change landing in
+        # between bumps it again and is picked up by the next check
+        state = await state_collection.find_one({"_id": PREFERENCES_STATE_ID})
+        version = state["version"] if state else 0
+        if version == self._version:
+            self._checked_at = time.monotonic()
+            return
+
+        excluded: Dict[Tuple[str, str], Set[ObjectId]] = {}
+        async for preferences in preferences_collection.find(
+            {},
+            {"user_id": 1, "notification_types": 1, "minimum_priority": 1}
+        ):
+            enabled_types = preferences.get("notification_types") or {}
+            minimum_rank = NOTIFICATION_PRIORITIES.index(preferences.get("minimum_priority", "low"))
+            for type in NOTIFICATION_TYPES:
+                for rank, priority in enumerate(NOTIFICATION_PRIORITIES):
+                    if not enabled_types.get(type, True) or rank < minimum_rank:
+                        excluded.setdefault((type, priority), set()).add(preferences["user_id"])
+
+        self._excluded = {key: frozenset(user_ids) for key, user_ids in excluded.items()}
+        self._version = version
+        self._checked_at = time.monotonic()
+
+# Shared by every NotificationCRUD in this worker
+preference_index = NotificationPreferenceIndex(settings.NOTIFICATION_PREFERENCE_CHECK_INTERVAL)
@@ -0,0 +1,219 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.core.config import settings
+from app.crud.notification import COUNTER_FIELDS, NotificationCRUD
+
+PURGE_LEASE_ID = "purge"
+# A purger that stops renewing its lease for this long is presumed dead
+PURGE_LEASE = timedelta(minutes=5)
+
+# Progress of the purges run by this worker
+retention_metrics = {
+    "runs": 0,
+    "batches": 0,
+    "deleted": 0,
+    "archived": 0,
+    "last_started_at": None,
+    "last_finished_at": None,
+    "last_deleted": 0,
+    "last_duration_seconds": None,
+    "last_error": None
+}
+
+class NotificationRetentionCRUD:
+    """Remove archived notifications past their retention period.
+
+    The purger walks the (is_archived, is_read, created_at) index oldest
+    first, deleting a bounded batch at a time with a pause in between, so
+    it never holds a long-running delete against foreground writes. The
+    recipients' counters are decremented by exactly the notifications that
+    were removed. With `archive`, each batch is copied to
+    notifications_archive before it is deleted. There is deliberately no
+    TTL index: server-side expiry would bypass the counters.
+    """
+    indexes = {
+        "archive_collection": [
+            IndexModel([
+                ("recipient_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ])
+        ]
+    }
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.collection = db.inven_pulse.notifications
+        self.archive_collection = db.inven_pulse.notifications_archive
+        self.state_collection = db.inven_pulse.notification_retention_state
+        self.notification_crud = NotificationCRUD(db)
+
+    async def purge(
+        self,
+        days: Optional[int] = None,
+        exclude_unread: bool = True,
+        batch_size: Optional[int] = None,
+        pause: Optional[float] = None,
+        archive: Optional[bool] = None,
+        progress: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """Delete archived notifications created more than `days` ago.
+
+        Unread ones are kept unless `exclude_unread` is False. Only one
+        worker purges at a time; the others return with `skipped` set.
+        Arguments left as None come from the NOTIFICATION_* retention settings.
+        """
+        days = settings.NOTIFICATION_RETENTION_DAYS if days is None else days
+        batch_size = batch_size or settings.NOTIFICATION_PURGE_BATCH_SIZE
+        pause = settings.NOTIFICATION_PURGE_PAUSE if pause is None else pause
+        archive = settings.NOTIFICATION_ARCHIVE_ON_PURGE if archive is None else archive
+
+        # Identifies this purge as the lease holder, so a purger whose lease
+        # was taken over after a stall cannot renew or release it
+        owner = ObjectId()
+        if not await self._acquire_lease(owner):
+            return {"deleted": 0, "archived": 0, "batches": 0, "skipped": True}
+
+        started = time.perf_counter()
+        retention_metrics["runs"] += 1
+        retention_metrics["last_started_at"] = datetime.utcnow()
+        retention_metrics["last_error"] = None
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        result = {"deleted": 0, "archived": 0, "batches": 0, "skipped": False}
+        try:
+            # One pass per is_read value keeps every query an equality
+            # prefix of the index followed by the created_at range
+            for is_read in ([True] if exclude_unread else [True, False]):
+                query = {
+                    "is_archived": True,
+                    "is_read": is_read,
+                    "created_at": {"$lt": cutoff_date}
+                }
+                while True:
+                    purged = await self._purge_batch(query, batch_size, archive)
+                    if purged is None:
+                        break
+                    deleted, archived = purged
+                    result["deleted"] += deleted
+                    result["archived"] += archived
+                    result["batches"] += 1
+                    retention_metrics["batches"] += 1
+                    retention_metrics["deleted"] += deleted
+                    retention_metrics["archived"] += archived
+                    if progress:
+                        progress(dict(result))
+                    if not await self._renew_lease(owner):
+                        # Another purger took over; leave the rest to it
+                        return result
+                    if pause:
+                        await asyncio.sleep(pause)
+        except Exception as e:
+            retention_metrics["last_error"] = str(e)
+            raise
+        finally:
+            await self._release_lease(owner)
+            retention_metrics["last_finished_at"] = datetime.utcnow()
+            retention_metrics["last_deleted"] = result["deleted"]
+            retention_metrics["last_duration_seconds"] = time.perf_counter() - started
+
+        return result
+
+    async def _purge_batch(self, query: dict, batch_size: int, archive: bool) -> Optional[Tuple[int, int]]:
+        """Delete the oldest batch matching `query`; None once nothing matches."""
+        batch = await self.collection.find(
+            query,
+            None if archive else COUNTER_FIELDS
+        ).sort("created_at", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return None
+
+        if archive:
+            await self._copy_to_archive(batch)
+
+        ids = [notification["_id"] for notification in batch]
+
+        # The delete and the counter decrements commit together
+        async def delete(session):
+            result = await self.collection.delete_many({"_id": {"$in": ids}, **query}, session=session)
+            deleted = batch
+            if result.deleted_count < len(batch):
+                # Some changed between the find and the delete and were kept
+                kept = {
+                    notification["_id"]
+                    async for notification in self.collection.find(
+                        {"_id": {"$in": ids}},
+                        {"_id": 1},
+                        session=session
+                    )
+                }
+                deleted = [notification for notification in batch if notification["_id"] not in kept]
+            await self.notification_crud.apply_counter_updates(deleted, sign=-1, session=session)
+            return deleted
+
+        async with await self.db.start_session() as session:
+            deleted = await session.with_transaction(delete)
+
+        if archive and len(deleted) < len(batch):
+            deleted_ids = {notification["_id"] for notification in deleted}
+            await self.archive_collection.delete_many({
+                "_id": {"$in": [_id for _id in ids if _id not in deleted_ids]}
+            })
+        return len(deleted), len(deleted) if archive else 0
+
+    async def _copy_to_archive(self, notifications: List[dict]) -> None:
+        try:
+            await self.archive_collection.insert_many(notifications, ordered=False)
+        except BulkWriteError as e:
+            # Copied by an earlier attempt that stopped before deleting
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+
+    async def _acquire_lease(self, owner: ObjectId) -> bool:
+        now = datetime.utcnow()
+        try:
+            await self.state_collection.find_one_and_update(
+                {"_id": PURGE_LEASE_ID, "locked_until": {"$lt": now}},
+                {"$set": {"owner": owner, "locked_until": now + PURGE_LEASE}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def _renew_lease(self, owner: ObjectId) -> bool:
+        """Extend the lease; False if it has passed to another purger."""
+        result = await self.state_collection.update_one(
+            {"_id": PURGE_LEASE_ID, "owner": owner},
+            {"$set": {"locked_until": datetime.utcnow() + PURGE_LEASE}}
+        )
+        return result.matched_count == 1
+
+    async def _release_lease(self, owner: ObjectId) -> None:
+        await self.state_collection.update_one(
+            {"_id": PURGE_LEASE_ID, "owner": owner},
+            {"$set": {"locked_until": datetime.min}}
+        )
+
+    def metrics(self) -> dict:
+        return {
+            **retention_metrics,
+            "retention_days": settings.NOTIFICATION_RETENTION_DAYS,
+            "archive_on_purge": settings.NOTIFICATION_ARCHIVE_ON_PURGE
+        }
+
+    async def run_periodically(self, interval: float) -> None:
+        """Purge every `interval` seconds until cancelled."""
+        while True:
+            try:
+                result = await self.purge()
+                if result["deleted"]:
+                    print(f"Purged {result['deleted']} notifications in {result['batches']} batches")
+            except Exception as e:
+                print(f"Notification purge failed: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Notifications replayed to a client reconnecting with Last-Event-ID
+STREAM_REPLAY_LIMIT = 500
+# Polls re-read this far back, since _ids generated by other workers'
+# clocks can land slightly behind the previous poll
+POLL_LOOKBACK = timedelta(seconds=5)
+# Error code of a $changeStream on a standalone server
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+class NotificationHub:
+    """Deliver notifications to the SSE connections open in this worker.
+
+    Each connection owns a bounded queue; when a slow client falls behind,
+    its oldest undelivered notification is dropped. The same notification
+    can reach the hub twice, published locally by the writer and again by
+    the database feed, so recently delivered ones are remembered and
+    skipped.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[ObjectId, Set[asyncio.Queue]] = {}
+        self._delivered = TTLCache(50000, 300)
+
+    def subscribe(self, recipient_id: ObjectId) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(recipient_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, recipient_id: ObjectId, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(recipient_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[recipient_id]
+
+    def recipient_ids(self) -> Set[ObjectId]:
+        return set(self._subscribers)
+
+    def publish(self, notification: dict) -> None:
+        queues = self._subscribers.get(notification["recipient_id"])
+        if not queues:
+            return
+
+        # A coalesced notification is delivered again for every repeat
+        key = (notification["_id"], notification.get("occurrence_count", 1))
+        if self._delivered.peek(key) is not None:
+            return
+        self._delivered.set(key, True)
+
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(dict(notification))
+
+    def publish_many(self, notifications: Iterable[dict]) -> None:
+        if self._subscribers:
+            for notification in notifications:
+                self.publish(notification)
+
+# Shared by every connection in this worker
+notification_hub = NotificationHub(settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+
+class NotificationStreamCRUD:
+    """Live notification delivery for /notifications/me/stream.
+
+    Writers publish to the hub of their own worker. `feed` relays
+    notifications written by other workers, both new ones and coalesced
+    repeats: it follows a change stream, or polls for new _ids and recent
+    last_occurred_at values on a standalone server. Either way the database
+    sees one reader per worker, however many clients are connected.
+    """
+    indexes = {
+        "collection": [
+            IndexModel([("recipient_id", ASCENDING), ("_id", ASCENDING)]),
+            IndexModel([("recipient_id", ASCENDING), ("last_occurred_at", ASCENDING)])
+        ]
+    }
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.collection = db.inven_pulse.notifications
+
+    async def stream_user_notifications(
+        self,
+        user_id: str,
+        last_event_id: Optional[str] = None
+    ) -> AsyncIterator[Optional[dict]]:
+        """Yield a user's new notifications as they arrive, None as a keep-alive.
+
+        With `last_event_id`, notifications created after it are replayed
+        first. The subscription starts before the replay, so nothing
+        written in between is lost.
+        """
+        recipient_id = ObjectId(user_id)
+        queue = notification_hub.subscribe(recipient_id)
+        try:
+            replayed = set()
+            if last_event_id and ObjectId.is_valid(last_event_id):
+                cursor = self.collection.find({
+                    "recipient_id": recipient_id,
+                    "_id": {"$gt": ObjectId(last_event_id)}
+                }).sort("_id", 1).limit(STREAM_REPLAY_LIMIT)
+                async for notification in cursor:
+                    replayed.add(notification["_id"])
+                    notification["id"] = str(notification.pop("_id"))
+                    yield notification
+
+            while True:
+                try:
+                    notification = await asyncio.wait_for(
+                        queue.get(),
+                        timeout=settings.NOTIFICATION_STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if notification["_id"] in replayed and notification.get("occurrence_count", 1) == 1:
+                    continue
+                notification["id"] = str(notification.pop("_id"))
+                yield notification
+        finally:
+            notification_hub.unsubscribe(recipient_id, queue)
+
+    async def feed(self) -> None:
+        """Publish notifications written by any worker to this worker's hub. Runs until cancelled."""
+        while True:
+            try:
+                async with self.collection.watch(
+                    [{
+                        "$match": {
+                            "$or": [
+                                {"operationType": "insert"},
+                                # A coalesced repeat increments occurrence_count
+                                {
+                                    "operationType": "update",
+                                    "updateDescription.updatedFields.occurrence_count": {"$exists": True}
+                                }
+                            ]
+                        }
+                    }],
+                    full_document="updateLookup"
+                ) as stream:
+                    async for change in stream:
+                        # None when the notification was deleted before the lookup
+                        if change.get("fullDocument"):
+                            notification_hub.publish(change["fullDocument"])
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    print("Change streams unavailable; polling for live notifications")
+                    await self._poll()
+                    return
+                print(f"Notification change stream interrupted: {e}")
+            except PyMongoError as e:
+                print(f"Notification change stream interrupted: {e}")
+            await asyncio.sleep(1)
+
+    async def _poll(self) -> None:
+        polled_at = datetime.utcnow()
+        while True:
+            await asyncio.sleep(settings.NOTIFICATION_STREAM_POLL_INTERVAL)
+            recipient_ids = notification_hub.recipient_ids()
+            now = datetime.utcnow()
+            if recipient_ids:
+                try:
+                    cursor = self.collection.find({
+                        "_id": {"$gt": ObjectId.from_datetime(polled_at - POLL_LOOKBACK)},
+                        "recipient_id": {"$in": list(recipient_ids)}
+                    }).sort("_id", 1)
+                    async for notification in cursor:
+                        notification_hub.publish(notification)
+                    # Coalesced repeats update an older notification in place
+                    cursor = self.collection.find({
+                        "recipient_id": {"$in": list(recipient_ids)},
+                        "last_occurred_at": {"$gt": polled_at - POLL_LOOKBACK}
+                    }).sort("last_occurred_at", 1)
+                    async for notification in cursor:
+                        notification_hub.publish(notification)
+                except PyMongoError as e:
+                    print(f"Live notification poll failed: {e}")
+                    continue
+            polled_at = now
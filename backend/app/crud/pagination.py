@@ -0,0 +1,47 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from bson import ObjectId
+from pymongo import DESCENDING
+
+# Listings are ordered newest first with _id as a tie-breaker, so that a
+# (created_at, _id) pair identifies a unique position in the result set
+KEYSET_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+def encode_cursor(created_at: datetime, id) -> str:
+    """Build an opaque cursor pointing just past the given document."""
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Decode a cursor produced by `encode_cursor`, raising ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, id = raw.split("|")
+        return datetime.fromisoformat(created_at), ObjectId(id)
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+def apply_cursor(query: dict, cursor: Optional[str]) -> dict:
+    """Restrict `query` to documents that sort after `cursor` in KEYSET_SORT order."""
+    if not cursor:
+        return query
+
+    created_at, id = decode_cursor(cursor)
+    keyset = {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": id}}
+        ]
+    }
+    return {"$and": [query, keyset]} if query else keyset
+
+def next_cursor(items: List, limit: int) -> Optional[str]:
+    """Cursor for the page after `items`, or None when this was the last page."""
+    if not items or len(items) < limit:
+        return None
+
+    last = items[-1]
+    if isinstance(last, dict):
+        return encode_cursor(last["created_at"], last["id"])
+    return encode_cursor(last.created_at, last.id)
@@ -1,10 +1,41 @@
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.models.product import ProductCreate, ProductUpdate, Product
 
+# Pipeline stages that keep the reorder flags in line with quantity_in_stock
+# and reorder_point. below_reorder_since marks when the current low stock
+# episode started; low_stock_alerted_at is cleared once stock recovers.
+REORDER_STAGES = [
+    {"$set": {"below_reorder": {"$lte": ["$quantity_in_stock", "$reorder_point"]}}},
+    {
+        "$set": {
+            "below_reorder_since": {
+                "$cond": ["$below_reorder", {"$ifNull": ["$below_reorder_since", "$$NOW"]}, "$$REMOVE"]
+            },
+            "low_stock_alerted_at": {
+                "$cond": ["$below_reorder", "$low_stock_alerted_at", "$$REMOVE"]
+            }
+        }
+    }
+]
+
 class ProductCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([("sku", ASCENDING)], unique=True),
+            IndexModel([("status", ASCENDING), ("category_id", ASCENDING)]),
+            IndexModel([("category_id", ASCENDING)]),
+            # Only products at or below their reorder point are indexed
+            IndexModel(
+                [("status", ASCENDING), ("low_stock_alerted_at", ASCENDING), ("_id", ASCENDING)],
+                partialFilterExpression={"below_reorder": True}
+            )
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.invenpulse.products
@@ -13,6 +44,9 @@ class ProductCRUD:
         product_dict = product.model_dump()
         product_dict["created_at"] = datetime.utcnow()
         product_dict["updated_at"] = datetime.utcnow()
+        product_dict["below_reorder"] = product_dict["quantity_in_stock"] <= product_dict["reorder_point"]
+        if product_dict["below_reorder"]:
+            product_dict["below_reorder_since"] = product_dict["created_at"]
         
         result = await self.collection.insert_one(product_dict)
         created_product = await self.collection.find_one({"_id": result.inserted_id})
@@ -58,7 +92,10 @@ class ProductCRUD:
             update_data["updated_at"] = datetime.utcnow()
             await self.collection.update_one(
                 {"_id": ObjectId(id)},
-                {"$set": update_data}
+                [
+                    {"$set": {field: {"$literal": value} for field, value in update_data.items()}},
+                    *REORDER_STAGES
+                ]
             )
 
         updated_product = await self.collection.find_one({"_id": ObjectId(id)})
@@ -91,13 +128,60 @@ class ProductCRUD:
 
         update_result = await self.collection.update_one(
             {"_id": ObjectId(id)},
-            {
-                "$inc": {"quantity_in_stock": quantity_change},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+            [
+                {
+                    "$set": {
+                        "quantity_in_stock": {"$add": ["$quantity_in_stock", quantity_change]},
+                        "updated_at": datetime.utcnow()
+                    }
+                },
+                *REORDER_STAGES
+            ]
         )
 
         if update_result.modified_count:
             updated_product = await self.collection.find_one({"_id": ObjectId(id)})
             return Product(**updated_product)
-        return None 
\ No newline at end of file
+        return None
+
+    async def refresh_reorder_flags(self) -> int:
+        """Recompute below_reorder for every product on the server."""
+        result = await self.collection.update_many({}, REORDER_STAGES)
+        return result.modified_count
+
+    async def iter_unalerted_below_reorder(
+        self,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[dict]]:
+        """Yield pages of active products at or below their reorder point that
+        have not been alerted yet, walking the partial index by _id."""
+        last_id = None
+        while True:
+            query = {
+                "below_reorder": True,
+                "status": "active",
+                "low_stock_alerted_at": None
+            }
+            if last_id:
+                query["_id"] = {"$gt": last_id}
+            products = await self.collection.find(
+                query,
+                {
+                    "name": 1,
+                    "sku": 1,
+                    "quantity_in_stock": 1,
+                    "reorder_point": 1,
+                    "below_reorder_since": 1
+                }
+            ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+            if not products:
+                return
+            yield products
+            last_id = products[-1]["_id"]
+
+    async def mark_low_stock_alerted(self, ids: List[ObjectId], alerted_at: datetime) -> None:
+        await self.collection.update_many(
+            {"_id": {"$in": ids}, "below_reorder": True},
+            {"$set": {"low_stock_alerted_at": alerted_at}}
+        )
+
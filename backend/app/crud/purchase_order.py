@@ -1,7 +1,9 @@
 from typing import List, Optional, Dict
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from motor.motor_asyncio import AsyncIOMotorClient
+from app.crud.pagination import KEYSET_SORT, apply_cursor
 from app.models.purchase_order import (
     PurchaseOrderCreate,
     PurchaseOrderUpdate,
@@ -13,6 +15,25 @@ from app.models.purchase_order import (
 )
 
 class PurchaseOrderCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([
+                ("supplier_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("status", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)])
+        ],
+        "items_collection": [
+            IndexModel([("purchase_order_id", ASCENDING)])
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.invenpulse.purchase_orders
@@ -114,7 +135,8 @@ class PurchaseOrderCRUD:
         status: Optional[str] = None,
         supplier_id: Optional[str] = None,
         from_date: Optional[datetime] = None,
-        to_date: Optional[datetime] = None
+        to_date: Optional[datetime] = None,
+        cursor: Optional[str] = None
     ) -> List[PurchaseOrder]:
         query = {}
         if status:
@@ -127,8 +149,10 @@ class PurchaseOrderCRUD:
             query["order_date"] = query.get("order_date", {})
             query["order_date"]["$lte"] = to_date
 
-        cursor = self.collection.find(query).skip(skip).limit(limit)
-        orders = await cursor.to_list(length=limit)
+        query = apply_cursor(query, cursor)
+        orders = await self.collection.find(query).sort(
+            KEYSET_SORT
+        ).skip(skip).limit(limit).to_list(length=limit)
 
         # Get items for all orders
         order_ids = [order["_id"] for order in orders]
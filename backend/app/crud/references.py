@@ -0,0 +1,63 @@
+from typing import Dict, Iterable, Optional, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# Hot reference documents (products, locations, ...) shared by every loader
+# in this worker, keyed by (collection name, projection, _id) so a document
+# loaded with a narrow projection is never handed to a caller wanting more
+reference_cache = TTLCache(settings.REFERENCE_CACHE_SIZE, settings.REFERENCE_CACHE_TTL)
+
+class ReferenceLoader:
+    """Resolve referenced documents for one request with one $in query per collection.
+
+    Documents are looked up in this loader first, then in the shared
+    reference cache, and only the remaining ids are fetched.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        self.database = database
+        self._loaded: Dict[Tuple[str, Optional[tuple], ObjectId], Optional[dict]] = {}
+
+    async def load_many(
+        self,
+        collection_name: str,
+        ids: Iterable[ObjectId],
+        projection: Optional[dict] = None
+    ) -> Dict[ObjectId, dict]:
+        """Map each id that exists in `collection_name` to its document.
+
+        With `projection`, only those fields are fetched; documents are
+        cached separately for every projection.
+        """
+        projection_key = tuple(sorted(projection.items())) if projection else None
+        requested = {id for id in ids if id is not None}
+        missing = []
+        for id in requested:
+            key = (collection_name, projection_key, id)
+            if key in self._loaded:
+                continue
+            cached = reference_cache.get(key)
+            if cached is not None:
+                self._loaded[key] = cached
+            else:
+                missing.append(id)
+
+        if missing:
+            async for document in self.database[collection_name].find(
+                {"_id": {"$in": missing}},
+                projection
+            ):
+                key = (collection_name, projection_key, document["_id"])
+                self._loaded[key] = document
+                reference_cache.set(key, document)
+            for id in missing:
+                # Remember ids that do not exist so they are not queried again
+                self._loaded.setdefault((collection_name, projection_key, id), None)
+
+        return {
+            id: self._loaded[(collection_name, projection_key, id)]
+            for id in requested
+            if self._loaded[(collection_name, projection_key, id)] is not None
+        }
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from app.core.config import settings
+from app.crud.notification import NotificationCRUD
+from app.crud.product import ProductCRUD
+
+class ReorderAlertCRUD:
+    """Raise low_stock notifications for products at or below their reorder point.
+
+    Products are read a page at a time from the partial below_reorder index,
+    so the catalog is never loaded at once. Each product is alerted once per
+    low stock episode: it is marked after its notifications are inserted, and
+    the notifications' dedupe_key makes a scan interrupted in between safe
+    to repeat.
+    """
+
+    def __init__(self, db: AsyncIOMotorClient):
+        self.db = db
+        self.product_crud = ProductCRUD(db)
+        self.notification_crud = NotificationCRUD(db)
+        self.users_collection = db.inven_pulse.users
+
+    async def scan(self, batch_size: int = 1000) -> dict:
+        recipient_ids = [
+            user["_id"]
+            async for user in self.users_collection.find(
+                settings.LOW_STOCK_RECIPIENT_FILTER,
+                {"_id": 1}
+            )
+        ]
+
+        chunk_size = settings.NOTIFICATION_FANOUT_CHUNK_SIZE
+        products_alerted = notifications_created = 0
+        async for products in self.product_crud.iter_unalerted_below_reorder(batch_size):
+            created_at = datetime.utcnow()
+            # A page fans out to every recipient, so it is inserted in
+            # bounded chunks, each in its own transaction
+            chunk = []
+            for product in products:
+                for recipient_id in recipient_ids:
+                    chunk.append(self._build_notification(product, recipient_id, created_at))
+                    if len(chunk) == chunk_size:
+                        notifications_created += await self.notification_crud.insert_deduplicated(chunk)
+                        chunk = []
+            if chunk:
+                notifications_created += await self.notification_crud.insert_deduplicated(chunk)
+            # Marked only once every chunk of the page is in
+            await self.product_crud.mark_low_stock_alerted(
+                [product["_id"] for product in products],
+                created_at
+            )
+            products_alerted += len(products)
+
+        return {
+            "products_alerted": products_alerted,
+            "notifications_created": notifications_created,
+            "recipients": len(recipient_ids)
+        }
+
+    def _build_notification(self, product: dict, recipient_id: ObjectId, created_at: datetime) -> dict:
+        quantity = product.get("quantity_in_stock", 0)
+        since = product.get("below_reorder_since") or created_at
+        return {
+            "type": "low_stock",
+            "priority": "critical" if quantity <= 0 else "high",
+            "title": f"Low stock: {product.get('name', product.get('sku'))}",
+            "message": (
+                f"{product.get('name')} ({product.get('sku')}) has {quantity} in stock, "
+                f"at or below its reorder point of {product.get('reorder_point')}."
+            ),
+            "reference_type": "product",
+            "reference_id": product["_id"],
+            "metadata": {
+                "sku": product.get("sku"),
+                "quantity_in_stock": quantity,
+                "reorder_point": product.get("reorder_point")
+            },
+            "is_read": False,
+            "is_archived": False,
+            "recipient_id": recipient_id,
+            "created_at": created_at,
+            "dedupe_key": f"low_stock:{product['_id']}:{since.isoformat()}"
+        }
+
+    async def run_periodically(self, interval: float) -> None:
+        """Scan every `interval` seconds until cancelled."""
+        while True:
+            try:
+                result = await self.scan()
+                if result["products_alerted"]:
+                    print(f"Reorder scan alerted {result['products_alerted']} products")
+            except Exception as e:
+                print(f"Reorder scan failed: {e}")
+            await asyncio.sleep(interval)
@@ -2,9 +2,27 @@ from datetime import datetime
 from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from app.crud.pagination import KEYSET_SORT, apply_cursor
 from app.models.sales_order import SalesOrderCreate, SalesOrderUpdate, SalesOrderItemUpdate
 
 class SalesOrderCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([
+                ("status", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([
+                ("customer_id", ASCENDING),
+                ("created_at", DESCENDING),
+                ("_id", DESCENDING)
+            ]),
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)])
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.inven_pulse.sales_orders
@@ -80,7 +98,8 @@ class SalesOrderCRUD:
         status: Optional[str] = None,
         customer_id: Optional[str] = None,
         from_date: Optional[datetime] = None,
-        to_date: Optional[datetime] = None
+        to_date: Optional[datetime] = None,
+        cursor: Optional[str] = None
     ) -> List[dict]:
         query = {}
         if status:
@@ -94,8 +113,10 @@ class SalesOrderCRUD:
             if to_date:
                 query["created_at"]["$lte"] = to_date
 
-        cursor = self.collection.find(query).skip(skip).limit(limit)
-        orders = await cursor.to_list(length=limit)
+        query = apply_cursor(query, cursor)
+        orders = await self.collection.find(query).sort(
+            KEYSET_SORT
+        ).skip(skip).limit(limit).to_list(length=limit)
         for order in orders:
             order["id"] = str(order.pop("_id"))
         return orders
@@ -1,10 +1,18 @@
 from typing import List, Optional
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.models.supplier import SupplierCreate, SupplierUpdate, Supplier, SupplierWithStats
 
 class SupplierCRUD:
+    indexes = {
+        "collection": [
+            IndexModel([("email", ASCENDING)]),
+            IndexModel([("status", ASCENDING)])
+        ]
+    }
+
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
         self.collection = db.invenpulse.suppliers
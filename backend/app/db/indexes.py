@@ -0,0 +1,255 @@
+from datetime import datetime
+from typing import Iterator, List
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+from app.crud.category import CategoryCRUD
+from app.crud.inventory_archive import InventoryArchiveCRUD
+from app.crud.inventory_count import InventoryCountCRUD
+from app.crud.inventory_reconciliation import InventoryReconciliationCRUD
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.crud.inventory_valuation import InventoryValuationCRUD
+from app.crud.notification import NotificationCRUD
+from app.crud.notification_retention import NotificationRetentionCRUD
+from app.crud.notification_stream import NotificationStreamCRUD
+from app.crud.pagination import KEYSET_SORT
+from app.crud.product import ProductCRUD
+from app.crud.purchase_order import PurchaseOrderCRUD
+from app.crud.sales_order import SalesOrderCRUD
+from app.crud.supplier import SupplierCRUD
+
+# CRUD classes whose `indexes` declarations are created at startup.
+# Each declaration maps a collection attribute of the CRUD instance to
+# its IndexModels, so the database name stays owned by the CRUD class.
+CRUD_CLASSES = [
+    CategoryCRUD,
+    InventoryArchiveCRUD,
+    InventoryCountCRUD,
+    InventoryReconciliationCRUD,
+    InventoryTransactionCRUD,
+    InventoryValuationCRUD,
+    NotificationCRUD,
+    NotificationRetentionCRUD,
+    NotificationStreamCRUD,
+    ProductCRUD,
+    PurchaseOrderCRUD,
+    SalesOrderCRUD,
+    SupplierCRUD
+]
+
+_ID = ObjectId()
+_DATE = datetime(2024, 1, 1)
+_MOVEMENT_SORT = [("created_at", 1), ("_id", 1)]
+
+# Representative filter/sort pairs for every find the CRUD layer issues
+QUERY_SHAPES = [
+    (InventoryTransactionCRUD, "collection", {"product_id": _ID}, KEYSET_SORT),
+    (InventoryTransactionCRUD, "collection", {"location_id": _ID}, KEYSET_SORT),
+    (InventoryTransactionCRUD, "collection", {"transaction_type": "sale"}, KEYSET_SORT),
+    (InventoryTransactionCRUD, "collection", {}, KEYSET_SORT),
+    (
+        InventoryTransactionCRUD,
+        "collection",
+        {"$and": [
+            {"product_id": _ID},
+            {"$or": [
+                {"created_at": {"$lt": _DATE}},
+                {"created_at": _DATE, "_id": {"$lt": _ID}}
+            ]}
+        ]},
+        KEYSET_SORT
+    ),
+    (
+        InventoryTransactionCRUD,
+        "collection",
+        {"product_id": _ID, "created_at": {"$gte": _DATE}},
+        _MOVEMENT_SORT
+    ),
+    (
+        InventoryTransactionCRUD,
+        "collection",
+        {"location_id": _ID, "created_at": {"$gte": _DATE}},
+        _MOVEMENT_SORT
+    ),
+    (
+        InventoryTransactionCRUD,
+        "collection",
+        {"to_location_id": _ID, "created_at": {"$gte": _DATE}},
+        _MOVEMENT_SORT
+    ),
+    (InventoryTransactionCRUD, "balances_collection", {"product_id": _ID, "location_id": _ID}, None),
+    (InventoryTransactionCRUD, "balances_collection", {"location_id": _ID}, None),
+    (
+        InventoryTransactionCRUD,
+        "balances_collection",
+        {"product_id": {"$in": [_ID]}, "location_id": {"$in": [_ID]}},
+        None
+    ),
+    (
+        InventoryTransactionCRUD,
+        "checkpoints_collection",
+        {"product_id": _ID, "location_id": _ID, "as_of": {"$lte": _DATE}},
+        [("as_of", -1), ("last_transaction_id", -1)]
+    ),
+    (
+        InventoryTransactionCRUD,
+        "rollups_collection",
+        {"product_id": _ID, "granularity": "day", "bucket": {"$gte": _DATE}},
+        [("bucket", 1)]
+    ),
+    (
+        InventoryTransactionCRUD,
+        "rollups_collection",
+        {"location_id": _ID, "granularity": "hour", "bucket": {"$gte": _DATE}},
+        [("bucket", 1)]
+    ),
+    (
+        InventoryTransactionCRUD,
+        "collection",
+        {"created_at": {"$lte": _DATE}},
+        [("product_id", -1), ("location_id", -1), ("created_at", 1), ("_id", 1)]
+    ),
+    (InventoryValuationCRUD, "layers_collection", {"product_id": _ID, "location_id": _ID}, None),
+    (
+        InventoryValuationCRUD,
+        "snapshots_collection",
+        {"run_id": _ID},
+        [("product_id", 1), ("location_id", 1)]
+    ),
+    (
+        InventoryArchiveCRUD,
+        "archive_collection",
+        {"product_id": _ID, "created_at": {"$lt": _DATE}},
+        _MOVEMENT_SORT
+    ),
+    (
+        InventoryArchiveCRUD,
+        "archive_collection",
+        {"created_at": {"$gte": _DATE, "$lt": _DATE}},
+        _MOVEMENT_SORT
+    ),
+    (
+        InventoryArchiveCRUD,
+        "summaries_collection",
+        {"product_id": _ID, "location_id": _ID, "period_end": {"$lte": _DATE}},
+        [("period_start", -1)]
+    ),
+    (InventoryCountCRUD, "lines_collection", {"session_id": _ID}, [("product_id", 1)]),
+    (InventoryReconciliationCRUD, "drift_collection", {"run_id": _ID}, [("partition", 1), ("_id", 1)]),
+    (
+        NotificationCRUD,
+        "collection",
+        {"recipient_id": _ID, "is_archived": False},
+        KEYSET_SORT
+    ),
+    (NotificationCRUD, "collection", {"recipient_id": _ID, "is_read": False}, None),
+    (
+        NotificationRetentionCRUD,
+        "collection",
+        {"is_archived": True, "is_read": True, "created_at": {"$lt": _DATE}},
+        [("created_at", 1)]
+    ),
+    (
+        NotificationCRUD,
+        "collection",
+        {
+            "recipient_id": _ID,
+            "coalesce_key": "low_stock:ref",
+            "coalesce_until": {"$gt": _DATE},
+            "is_read": False,
+            "is_archived": False
+        },
+        None
+    ),
+    (
+        NotificationCRUD,
+        "collection",
+        {
+            "recipient_id": {"$in": [_ID]},
+            "coalesce_key": "low_stock:ref",
+            "is_read": False,
+            "is_archived": False,
+            "coalesce_until": {"$lte": _DATE}
+        },
+        None
+    ),
+    (NotificationCRUD, "preferences_collection", {"user_id": _ID}, None),
+    (NotificationStreamCRUD, "collection", {"recipient_id": _ID, "_id": {"$gt": _ID}}, [("_id", 1)]),
+    (
+        NotificationStreamCRUD,
+        "collection",
+        {"recipient_id": {"$in": [_ID]}, "last_occurred_at": {"$gt": _DATE}},
+        [("last_occurred_at", 1)]
+    ),
+    (
+        NotificationCRUD,
+        "digest_queue_collection",
+        {"recipient_id": _ID, "type": "low_stock", "reference_id": _ID, "flush_id": None},
+        None
+    ),
+    (ProductCRUD, "collection", {"sku": "SKU-1"}, None),
+    (ProductCRUD, "collection", {"status": "active", "category_id": _ID}, None),
+    (
+        ProductCRUD,
+        "collection",
+        {"below_reorder": True, "status": "active", "low_stock_alerted_at": None, "_id": {"$gt": _ID}},
+        [("_id", 1)]
+    ),
+    (CategoryCRUD, "collection", {"name": "Electronics"}, None),
+    (CategoryCRUD, "collection", {"parent_id": _ID}, None),
+    (SupplierCRUD, "collection", {"email": "supplier@example.com"}, None),
+    (SupplierCRUD, "collection", {"status": "active"}, None),
+    (PurchaseOrderCRUD, "collection", {}, KEYSET_SORT),
+    (
+        PurchaseOrderCRUD,
+        "collection",
+        {"supplier_id": _ID, "order_date": {"$gte": _DATE}},
+        KEYSET_SORT
+    ),
+    (PurchaseOrderCRUD, "collection", {"status": "confirmed"}, KEYSET_SORT),
+    (PurchaseOrderCRUD, "items_collection", {"purchase_order_id": _ID}, None),
+    (SalesOrderCRUD, "collection", {}, KEYSET_SORT),
+    (SalesOrderCRUD, "collection", {"status": "draft"}, KEYSET_SORT),
+    (SalesOrderCRUD, "collection", {"customer_id": "customer-1"}, KEYSET_SORT)
+]
+
+async def create_indexes(client: AsyncIOMotorClient) -> None:
+    """Create every index declared by the CRUD classes."""
+    for crud_class in CRUD_CLASSES:
+        crud = crud_class(client)
+        for attribute, index_models in crud_class.indexes.items():
+            collection = getattr(crud, attribute)
+            try:
+                await collection.create_indexes(index_models)
+            except OperationFailure as e:
+                print(f"Could not create indexes on {collection.full_name}: {e}")
+
+def _plan_stages(plan) -> Iterator[str]:
+    """Yield every stage name in an explain plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+async def explain_query_shapes(client: AsyncIOMotorClient) -> List[dict]:
+    """Explain every registered query shape and flag collection scans."""
+    report = []
+    for crud_class, attribute, query, sort in QUERY_SHAPES:
+        collection = getattr(crud_class(client), attribute)
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = list(_plan_stages(explain["queryPlanner"]["winningPlan"]))
+        report.append({
+            "collection": collection.full_name,
+            "query": query,
+            "sort": sort,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
@@ -2,6 +2,14 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.api_v1.api import api_router
+from app.db.base import db, connect_to_mongo, close_mongo_connection
+from app.db.indexes import create_indexes
+from app.core.tasks import start_background_task, cancel_background_tasks
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.crud.notification import NotificationCRUD
+from app.crud.notification_retention import NotificationRetentionCRUD
+from app.crud.notification_stream import NotificationStreamCRUD
+from app.crud.reorder_alert import ReorderAlertCRUD
 
 app = FastAPI(
     title="InvenPulse API",
@@ -18,8 +26,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.on_event("startup")
+async def startup_event():
+    await connect_to_mongo()
+    if settings.CREATE_INDEXES_ON_STARTUP:
+        await create_indexes(db.client)
+    if settings.BALANCE_CACHE_ENABLED:
+        start_background_task(InventoryTransactionCRUD(db.client).listen_for_invalidations())
+    if settings.REORDER_SCAN_INTERVAL:
+        start_background_task(ReorderAlertCRUD(db.client).run_periodically(settings.REORDER_SCAN_INTERVAL))
+    if settings.NOTIFICATION_STREAM_FEED_ENABLED:
+        start_background_task(NotificationStreamCRUD(db.client).feed())
+    if settings.NOTIFICATION_PURGE_INTERVAL:
+        start_background_task(
+            NotificationRetentionCRUD(db.client).run_periodically(settings.NOTIFICATION_PURGE_INTERVAL)
+        )
+    if settings.NOTIFICATION_DIGEST_INTERVAL:
+        start_background_task(
+            NotificationCRUD(db.client).run_digests_periodically(settings.NOTIFICATION_DIGEST_INTERVAL)
+        )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await cancel_background_tasks()
+    await close_mongo_connection()
+
 # Include API routes
 app.include_router(api_router, prefix="/api/v1")
 
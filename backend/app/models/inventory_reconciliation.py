@@ -0,0 +1,49 @@
+from typing import Optional, List
+from pydantic import BaseModel, Field
+from datetime import datetime
+from bson import ObjectId
+from app.models.product import PyObjectId
+
+class ReconciliationPartition(BaseModel):
+    index: int
+    min_product_id: PyObjectId
+    max_product_id: PyObjectId  # Exclusive upper bound
+    status: str = Field(default="pending", regex="^(pending|running|completed)$")
+    lease_until: Optional[datetime] = None  # A running partition is claimed until then
+    pairs_checked: int = 0
+    drift_count: int = 0
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+class ReconciliationRun(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    status: str = Field(default="pending", regex="^(pending|running|completed|failed)$")
+    repair: bool = False
+    partitions: List[ReconciliationPartition] = []
+    completed_partitions: int = 0
+    pairs_checked: int = 0
+    drift_count: int = 0
+    repaired_count: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+        allow_population_by_field_name = True
+
+class BalanceDrift(BaseModel):
+    run_id: PyObjectId
+    partition: int
+    product_id: PyObjectId
+    location_id: PyObjectId
+    ledger_quantity: float
+    ledger_value: float
+    balance_quantity: Optional[float] = None  # None when the balance document is missing
+    balance_value: Optional[float] = None
+    repaired: bool = False
+
+    class Config:
+        json_encoders = {ObjectId: str}
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, Field
 from datetime import datetime
 from bson import ObjectId
@@ -19,6 +19,9 @@ class InventoryTransactionBase(BaseModel):
 class InventoryTransactionCreate(InventoryTransactionBase):
     pass
 
+class InventoryTransactionBulkCreate(BaseModel):
+    transactions: List[InventoryTransactionCreate] = Field(..., min_items=1, max_items=5000)
+
 class InventoryTransactionUpdate(BaseModel):
     quantity: Optional[float] = None
     unit_cost: Optional[float] = Field(None, ge=0)
@@ -32,6 +35,8 @@ class InventoryTransaction(InventoryTransactionBase):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     running_balance: float = 0.0  # Running balance after this transaction
     value: float = 0.0  # Transaction value (quantity * unit_cost)
+    fifo_value: Optional[float] = None  # Value under FIFO cost layers
+    average_value: Optional[float] = None  # Value at the moving average cost
 
     class Config:
         json_encoders = {ObjectId: str}
@@ -54,6 +59,74 @@ class InventoryBalance(BaseModel):
     class Config:
         json_encoders = {ObjectId: str}
 
+class InventoryBalanceAsOf(BaseModel):
+    product_id: PyObjectId
+    location_id: PyObjectId
+    as_of: datetime
+    quantity: float = 0.0
+    value: float = 0.0
+    checkpoint_as_of: Optional[datetime] = None  # Checkpoint the ledger tail was replayed from
+    replayed_transactions: int = 0
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+class InventoryBalanceLookup(BaseModel):
+    product_ids: List[PyObjectId] = Field(default_factory=list, max_items=1000)
+    location_ids: List[PyObjectId] = Field(default_factory=list, max_items=500)
+    include_totals: bool = False  # Also return per-product totals across the matched locations
+
+class InventoryProductTotal(BaseModel):
+    product_id: PyObjectId
+    quantity: float = 0.0
+    value: float = 0.0
+    locations: int = 0  # Locations holding a balance for this product
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+class InventoryBalanceLookupResult(BaseModel):
+    balances: List[InventoryBalance]
+    totals: Optional[List[InventoryProductTotal]] = None
+
+class MovementTypeTotals(BaseModel):
+    quantity: float = 0.0
+    value: float = 0.0
+    count: int = 0
+
+class InventoryMovementRollup(BaseModel):
+    product_id: PyObjectId
+    location_id: Optional[PyObjectId] = None  # None when summed across locations
+    granularity: str  # hour, day
+    bucket: datetime  # Start of the bucket (UTC)
+    quantity: float = 0.0  # Net movement
+    inbound_quantity: float = 0.0
+    outbound_quantity: float = 0.0
+    value: float = 0.0
+    count: int = 0
+    by_type: Dict[str, MovementTypeTotals] = {}
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+class InventoryPeriodSummary(BaseModel):
+    product_id: PyObjectId
+    location_id: PyObjectId
+    period_start: datetime  # First day of the archived month
+    period_end: datetime  # Exclusive
+    opening_quantity: float = 0.0
+    opening_value: float = 0.0
+    quantity: float = 0.0  # Net movement in the period
+    value: float = 0.0
+    count: int = 0
+    closing_quantity: float = 0.0
+    closing_value: float = 0.0
+    last_transaction_id: Optional[PyObjectId] = None
+    last_transaction_date: Optional[datetime] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
 class InventoryAdjustment(BaseModel):
     product_id: PyObjectId
     location_id: PyObjectId
@@ -70,9 +143,46 @@ class InventoryTransfer(BaseModel):
     reason: Optional[str] = None
     notes: Optional[str] = None
 
+class InventoryTransferLine(BaseModel):
+    product_id: PyObjectId
+    quantity: float = Field(..., gt=0)
+
+class InventoryMultiTransfer(BaseModel):
+    from_location_id: PyObjectId
+    to_location_id: PyObjectId
+    lines: List[InventoryTransferLine] = Field(..., min_items=1, max_items=2500)
+    reason: Optional[str] = None
+    notes: Optional[str] = None
+
 class InventoryCount(BaseModel):
     location_id: PyObjectId
-    products: List[dict]  # List of {product_id, counted_quantity, system_quantity}
+    products: List[dict]  # List of {product_id, counted_quantity}; differences use the stored balance
     count_date: datetime = Field(default_factory=datetime.utcnow)
     status: str = Field(default="draft")  # draft, in_progress, completed
-    notes: Optional[str] = None 
\ No newline at end of file
+    notes: Optional[str] = None 
+
+class InventoryCountSessionCreate(BaseModel):
+    location_id: PyObjectId
+    notes: Optional[str] = None
+
+class InventoryCountSession(InventoryCountSessionCreate):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    status: str = Field(default="draft", regex="^(draft|in_progress|posting|completed)$")
+    line_count: int = 0  # Distinct products staged so far
+    transaction_count: int = 0  # Count transactions created when posted
+    created_by: PyObjectId
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+        allow_population_by_field_name = True
+
+class InventoryCountLine(BaseModel):
+    product_id: PyObjectId
+    counted_quantity: float = Field(..., ge=0)
+
+class InventoryCountUploadResult(BaseModel):
+    received: int  # Lines in this upload
+    line_count: int  # Distinct products staged in the session
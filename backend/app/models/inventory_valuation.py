@@ -0,0 +1,58 @@
+from typing import Optional, List
+from pydantic import BaseModel, Field
+from datetime import datetime
+from bson import ObjectId
+from app.models.product import PyObjectId
+
+class CostLayer(BaseModel):
+    transaction_id: Optional[PyObjectId] = None  # Receipt that opened the layer
+    received_at: Optional[datetime] = None
+    quantity: float  # Negative for a shortage shipped beyond receipts
+    unit_cost: float
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+class InventoryCostLayers(BaseModel):
+    product_id: PyObjectId
+    location_id: PyObjectId
+    quantity: float = 0.0
+    layers: List[CostLayer] = []  # Oldest first
+    fifo_value: float = 0.0
+    average_cost: float = 0.0
+    average_value: float = 0.0
+    last_unit_cost: float = 0.0
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+
+class ValuationRun(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    as_of: Optional[datetime] = None  # None values the whole ledger
+    rebuild_layers: bool = False
+    status: str = Field(default="pending", regex="^(pending|running|completed|failed)$")
+    pairs: int = 0
+    rows: int = 0
+    elapsed_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        json_encoders = {ObjectId: str}
+        allow_population_by_field_name = True
+
+class ValuationSnapshot(BaseModel):
+    run_id: PyObjectId
+    as_of: Optional[datetime] = None
+    product_id: PyObjectId
+    location_id: PyObjectId
+    quantity: float
+    fifo_value: float
+    average_cost: float
+    average_value: float
+
+    class Config:
+        json_encoders = {ObjectId: str}
@@ -28,6 +28,8 @@ class Notification(NotificationBase):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     read_at: Optional[datetime] = None
     archived_at: Optional[datetime] = None
+    occurrence_count: int = 1  # Repeats merged into this notification by coalescing
+    last_occurred_at: Optional[datetime] = None
 
     class Config:
         json_encoders = {ObjectId: str}
@@ -72,6 +74,11 @@ class BulkNotificationCreate(BaseModel):
     metadata: Optional[Dict] = None
     recipient_filter: Dict  # Query to filter recipients (e.g., by role, department)
 
+class NotificationFanOutResult(BaseModel):
+    count: int = 0  # Notifications created
+    first_ids: List[str] = []  # IDs of the first few, for spot checks
+    skipped: int = 0  # Matched recipients whose preferences exclude the notification
+
 class NotificationStats(BaseModel):
     total_count: int = 0
     unread_count: int = 0
@@ -0,0 +1,29 @@
+"""Move whole months of old inventory transactions into the archive tier.
+
+    python -m scripts.archive_ledger [YYYY-MM-DD]
+
+Months ending on or before the given date (default: LEDGER_ARCHIVE_AFTER_DAYS
+ago) are copied to inventory_transactions_archive, summarised per product
+and location, and removed from inventory_transactions. Safe to re-run after
+an interruption.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.inventory_archive import InventoryArchiveCRUD
+
+def report(progress: dict):
+    print(f"Archived {progress['month']:%Y-%m}: {progress['rows']} transactions")
+
+async def main():
+    horizon = datetime.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    result = await InventoryArchiveCRUD(client).archive(horizon, progress=report)
+    print(f"Archived {result['rows']} transactions in {result['months']} months; "
+          f"archive boundary is now {result['archived_before']}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Hammer a single (product, location) balance with concurrent writers.
+
+Run from the backend directory against a replica set (transactions need one):
+
+    python -m scripts.benchmark_balance_contention [writers] [writes_per_writer]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.models.inventory_transaction import InventoryTransactionCreate
+
+# MongoDB connection
+MONGODB_URL = "mongodb://localhost:27017"
+
+async def writer(crud, product_id, location_id, user_id, writes, latencies, errors):
+    for i in range(writes):
+        transaction = InventoryTransactionCreate(
+            product_id=product_id,
+            quantity=1 if i % 2 == 0 else -1,
+            transaction_type="adjustment",
+            reference_type="adjustment",
+            location_id=location_id,
+            unit_cost=1.0
+        )
+        started = time.perf_counter()
+        try:
+            await crud.create(transaction, user_id)
+        except PyMongoError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+async def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    writes_per_writer = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    client = AsyncIOMotorClient(MONGODB_URL)
+    crud = InventoryTransactionCRUD(client)
+    product_id, location_id, user_id = ObjectId(), ObjectId(), str(ObjectId())
+
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        writer(crud, product_id, location_id, user_id, writes_per_writer, latencies, errors)
+        for _ in range(writers)
+    ])
+    elapsed = time.perf_counter() - started
+
+    ledger_total = await crud.collection.aggregate([
+        {"$match": {"product_id": product_id, "location_id": location_id}},
+        {"$group": {"_id": None, "quantity": {"$sum": "$quantity"}}}
+    ]).to_list(1)
+    balance = await crud.balances_collection.find_one(
+        {"product_id": product_id, "location_id": location_id}
+    )
+
+    print(f"Writers: {writers}, writes per writer: {writes_per_writer}")
+    print(f"Committed: {len(latencies)}, failed: {len(errors)} in {elapsed:.2f}s")
+    print(f"Throughput: {len(latencies) / elapsed:.1f} writes/s")
+    if latencies:
+        latencies.sort()
+        print(f"Latency p50: {statistics.median(latencies) * 1000:.1f}ms, "
+              f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+    ledger_quantity = ledger_total[0]["quantity"] if ledger_total else 0
+    balance_quantity = balance["quantity"] if balance else 0
+    print(f"Ledger sum: {ledger_quantity}, balance: {balance_quantity}, "
+          f"consistent: {ledger_quantity == balance_quantity}")
+
+    # Remove benchmark data
+    await crud.collection.delete_many({"product_id": product_id})
+    await crud.balances_collection.delete_many({"product_id": product_id})
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
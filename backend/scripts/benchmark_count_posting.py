@@ -0,0 +1,70 @@
+"""Time physical count posting at increasing count sizes.
+
+Each run counts a fresh location where every product already holds some
+stock, so every line produces a count transaction:
+
+    python -m scripts.benchmark_count_posting [lines ...] [--chunk-size N]
+
+Defaults to 1k, 10k and 100k lines.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.db.indexes import create_indexes
+
+# MongoDB connection
+MONGODB_URL = "mongodb://localhost:27017"
+
+async def run(crud, lines, chunk_size):
+    location_id = ObjectId()
+    product_ids = [ObjectId() for _ in range(lines)]
+    await crud.balances_collection.insert_many([
+        {
+            "product_id": product_id,
+            "location_id": location_id,
+            "quantity": 100,
+            "value": 0,
+            "last_transaction_date": datetime.utcnow()
+        }
+        for product_id in product_ids
+    ])
+
+    count_lines = [
+        {"product_id": str(product_id), "counted_quantity": random.randint(0, 99)}
+        for product_id in product_ids
+    ]
+    started = time.perf_counter()
+    transactions = await crud.post_count_lines(
+        location_id,
+        count_lines,
+        str(ObjectId()),
+        chunk_size=chunk_size
+    )
+    elapsed = time.perf_counter() - started
+    print(f"{lines:>8} lines: {len(transactions)} transactions in {elapsed:.2f}s "
+          f"({lines / elapsed:.0f} lines/s)")
+
+    # Remove benchmark data
+    await crud.collection.delete_many({"location_id": location_id})
+    await crud.balances_collection.delete_many({"location_id": location_id})
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("lines", type=int, nargs="*", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGODB_URL)
+    await create_indexes(client)
+    crud = InventoryTransactionCRUD(client)
+    for lines in args.lines:
+        await run(crud, lines, args.chunk_size)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
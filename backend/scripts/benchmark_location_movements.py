@@ -0,0 +1,88 @@
+"""Compare the $or and merged-cursor strategies for location movements.
+
+Seeds a synthetic ledger spread over a few locations, with a share of
+transfer legs pointing at the benchmarked location, then streams that
+location's full history with both strategies:
+
+    python -m scripts.benchmark_location_movements [rows ...]
+
+Defaults to 1M and 10M rows.
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.db.indexes import create_indexes
+
+# MongoDB connection
+MONGODB_URL = "mongodb://localhost:27017"
+
+LOCATIONS = 20
+TRANSFER_SHARE = 0.2
+
+async def seed(crud, product_ids, location_ids, rows):
+    start = datetime.utcnow() - timedelta(seconds=rows)
+    batch = []
+    for i in range(rows):
+        location_id = random.choice(location_ids)
+        to_location_id = None
+        if random.random() < TRANSFER_SHARE:
+            to_location_id = random.choice(location_ids)
+        batch.append({
+            "product_id": random.choice(product_ids),
+            "location_id": location_id,
+            "to_location_id": to_location_id,
+            "quantity": 1,
+            "transaction_type": "transfer" if to_location_id else "purchase",
+            "created_at": start + timedelta(seconds=i),
+            "running_balance": 0,
+            "value": 0
+        })
+        if len(batch) == 10000:
+            await crud.collection.insert_many(batch)
+            batch = []
+    if batch:
+        await crud.collection.insert_many(batch)
+
+async def run(crud, location_id, strategy):
+    started = time.perf_counter()
+    first_row_ms = None
+    count = 0
+    try:
+        async for _ in crud.iter_location_movements(str(location_id), strategy=strategy):
+            if first_row_ms is None:
+                first_row_ms = (time.perf_counter() - started) * 1000
+            count += 1
+    except OperationFailure as e:
+        return f"failed: {e.details.get('codeName', e)}"
+    elapsed = time.perf_counter() - started
+    return f"{count} rows, first row {first_row_ms or 0:.0f}ms, total {elapsed:.2f}s"
+
+async def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000, 10_000_000]
+
+    client = AsyncIOMotorClient(MONGODB_URL)
+    await create_indexes(client)
+    crud = InventoryTransactionCRUD(client)
+
+    for rows in sizes:
+        product_ids = [ObjectId() for _ in range(1000)]
+        location_ids = [ObjectId() for _ in range(LOCATIONS)]
+        await seed(crud, product_ids, location_ids, rows)
+
+        print(f"Ledger rows: {rows}")
+        for strategy in ("or", "merge"):
+            print(f"  {strategy:>5}: {await run(crud, location_ids[0], strategy)}")
+
+        # Remove benchmark data
+        await crud.collection.delete_many({"location_id": {"$in": location_ids}})
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
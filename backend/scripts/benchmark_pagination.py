@@ -0,0 +1,83 @@
+"""Compare skip/limit and cursor pagination latency across page depth.
+
+Seeds a synthetic product ledger, then times single page fetches at
+increasing depths with both strategies:
+
+    python -m scripts.benchmark_pagination [rows] [page_size]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+from app.crud.pagination import next_cursor
+from app.db.indexes import create_indexes
+
+# MongoDB connection
+MONGODB_URL = "mongodb://localhost:27017"
+
+async def seed(crud, product_id, rows):
+    location_id = ObjectId()
+    start = datetime.utcnow() - timedelta(seconds=rows)
+    batch = []
+    for i in range(rows):
+        batch.append({
+            "product_id": product_id,
+            "location_id": location_id,
+            "quantity": 1,
+            "transaction_type": "purchase",
+            "created_at": start + timedelta(seconds=i),
+            "running_balance": i + 1,
+            "value": 0
+        })
+        if len(batch) == 10000:
+            await crud.collection.insert_many(batch)
+            batch = []
+    if batch:
+        await crud.collection.insert_many(batch)
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    client = AsyncIOMotorClient(MONGODB_URL)
+    await create_indexes(client)
+    crud = InventoryTransactionCRUD(client)
+    product_id = ObjectId()
+    await seed(crud, product_id, rows)
+
+    pages = rows // page_size
+    checkpoints = {1, 10, 100, 1000, 10000, pages}
+    print(f"{'page':>8} {'skip ms':>10} {'cursor ms':>10}")
+
+    cursor = None
+    for page in range(1, pages + 1):
+        transactions, cursor_ms = await timed(crud.get_all(
+            limit=page_size,
+            product_id=str(product_id),
+            cursor=cursor
+        ))
+        if page in checkpoints:
+            _, skip_ms = await timed(crud.get_all(
+                skip=(page - 1) * page_size,
+                limit=page_size,
+                product_id=str(product_id)
+            ))
+            print(f"{page:>8} {skip_ms:>10.1f} {cursor_ms:>10.1f}")
+        cursor = next_cursor(transactions, page_size)
+        if not cursor:
+            break
+
+    # Remove benchmark data
+    await crud.collection.delete_many({"product_id": product_id})
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+"""Deliver queued digest notifications.
+
+Notifications of the types in NOTIFICATION_DIGEST_TYPES are queued instead
+of sent. Run this from cron, or set NOTIFICATION_DIGEST_INTERVAL to flush
+from the app:
+
+    python -m scripts.flush_notification_digests
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.notification import NotificationCRUD
+
+async def main():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    result = await NotificationCRUD(client).flush_digests()
+    print(f"Flushed {result['digests']} digests, "
+          f"{result['notifications_created']} notifications created")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,34 @@
+"""Explain every query shape issued by the CRUD layer and flag COLLSCANs.
+
+    python -m scripts.index_report [--create]
+
+With --create the declared indexes are created before explaining.
+Exits with status 1 when any query shape falls back to a collection scan.
+"""
+import asyncio
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.db.indexes import create_indexes, explain_query_shapes
+
+async def main():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    if "--create" in sys.argv:
+        await create_indexes(client)
+
+    report = await explain_query_shapes(client)
+    collscans = 0
+    for entry in report:
+        flag = "COLLSCAN" if entry["collscan"] else "ok"
+        if entry["collscan"]:
+            collscans += 1
+        print(f"[{flag:8}] {entry['collection']} {entry['query']} sort={entry['sort']}")
+        print(f"           stages: {' <- '.join(entry['stages'])}")
+
+    print(f"\n{len(report)} query shapes, {collscans} collection scans")
+    client.close()
+    if collscans:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
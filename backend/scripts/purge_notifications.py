@@ -0,0 +1,43 @@
+"""Purge archived notifications past the retention period.
+
+Meant to run from cron, or set NOTIFICATION_PURGE_INTERVAL to purge from the app:
+
+    python -m scripts.purge_notifications [--days N] [--include-unread] [--archive]
+
+--archive copies each batch to notifications_archive before deleting it.
+"""
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.notification_retention import NotificationRetentionCRUD
+
+def report(progress: dict):
+    print(f"  batch {progress['batches']}: {progress['deleted']} deleted, "
+          f"{progress['archived']} archived")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=None)
+    parser.add_argument("--include-unread", action="store_true")
+    parser.add_argument("--archive", action="store_true", default=None)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    retention_crud = NotificationRetentionCRUD(client)
+    result = await retention_crud.purge(
+        days=args.days,
+        exclude_unread=not args.include_unread,
+        archive=args.archive,
+        progress=report
+    )
+    if result["skipped"]:
+        print("Another purge is running")
+    else:
+        metrics = retention_crud.metrics()
+        print(f"Purged {result['deleted']} notifications in {result['batches']} batches "
+              f"({metrics['last_duration_seconds']:.2f}s)")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+"""Recompute the hourly and daily movement rollups from the ledger.
+
+Used to backfill rollups for movements posted before they existed, or to
+repair a period:
+
+    python -m scripts.rebuild_movement_rollups [YYYY-MM-DD]
+
+Without a date every bucket is rebuilt. Run while no movements are being
+posted for the affected period.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+
+async def main():
+    since = datetime.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    await InventoryTransactionCRUD(client).rebuild_rollups(since)
+    print(f"Rebuilt movement rollups{' since ' + since.date().isoformat() if since else ''}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
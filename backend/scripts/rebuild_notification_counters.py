@@ -0,0 +1,28 @@
+"""Recompute the per-user notification counters behind /notifications/me/stats.
+
+Used to backfill counters for notifications created before they existed,
+or to repair one user's badge:
+
+    python -m scripts.rebuild_notification_counters [USER_ID]
+
+Without a user ID every counter is rebuilt. Notifications created or read
+while a counter is being replaced can be missed, so run it when traffic
+is quiet.
+"""
+import asyncio
+import sys
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.notification import NotificationCRUD
+
+async def main():
+    user_id = sys.argv[1] if len(sys.argv) > 1 else None
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    started = time.perf_counter()
+    written = await NotificationCRUD(client).rebuild_counters(user_id)
+    print(f"Rebuilt {written} notification counters in {time.perf_counter() - started:.2f}s")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+"""Reconcile inventory_balances against the inventory ledger.
+
+    python -m scripts.reconcile_inventory [--partitions N] [--concurrency N] [--repair]
+    python -m scripts.reconcile_inventory --resume RUN_ID [--concurrency N]
+"""
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.inventory_reconciliation import InventoryReconciliationCRUD
+
+def report_progress(run):
+    print(
+        f"[{run['completed_partitions']}/{run['total_partitions']}] "
+        f"pairs checked: {run['pairs_checked']}, drift: {run['drift_count']}"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--partitions", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repair", action="store_true")
+    parser.add_argument("--resume", metavar="RUN_ID")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    reconciliation_crud = InventoryReconciliationCRUD(client)
+
+    run_id = args.resume
+    if not run_id:
+        run = await reconciliation_crud.create_run(args.partitions, repair=args.repair)
+        run_id = run["id"]
+    print(f"Reconciliation run {run_id}")
+
+    run = await reconciliation_crud.run(run_id, args.concurrency, progress=report_progress)
+    if not run:
+        print("Reconciliation run not found")
+    else:
+        print(
+            f"Done: {run['pairs_checked']} pairs checked, {run['drift_count']} drifted, "
+            f"{run['repaired_count']} repaired"
+        )
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
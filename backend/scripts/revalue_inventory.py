@@ -0,0 +1,32 @@
+"""Value the inventory ledger with FIFO and moving-average costs.
+
+Meant for month-end close:
+
+    python -m scripts.revalue_inventory [YYYY-MM-DD] [--rebuild-layers]
+
+With a date only movements up to that moment are valued. --rebuild-layers
+replaces the incrementally maintained cost layers with the replayed ones
+and needs the full ledger, so it cannot be combined with a date.
+"""
+import asyncio
+import sys
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.inventory_valuation import InventoryValuationCRUD
+
+async def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    as_of = datetime.fromisoformat(args[0]) if args else None
+    rebuild_layers = "--rebuild-layers" in sys.argv
+
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    valuation_crud = InventoryValuationCRUD(client)
+    run = await valuation_crud.create_run(as_of=as_of, rebuild_layers=rebuild_layers)
+    run = await valuation_crud.revalue(run["id"])
+    print(f"Valued {run['pairs']} product/location pairs from {run['rows']} ledger rows "
+          f"in {run['elapsed_seconds']:.2f}s (run {run['id']})")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,20 @@
+"""Snapshot every inventory balance that changed since its last checkpoint.
+
+Meant to run periodically (e.g. nightly and at month-end close) so that
+as-of balance queries only replay a short ledger tail:
+
+    python -m scripts.write_balance_checkpoints
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.core.config import settings
+from app.crud.inventory_transaction import InventoryTransactionCRUD
+
+async def main():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    written = await InventoryTransactionCRUD(client).write_checkpoints()
+    print(f"Wrote {written} balance checkpoints")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())